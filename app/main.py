@@ -2,34 +2,101 @@
 月次受講人数集計 Web アプリ
 FastAPI + htmx
 ポータル経由: BEHIND_PORTAL=true + X-Portal-Role ヘッダーで認証スキップ
+
+起動を速くするため、pandas・openpyxl を読み込む集計系のモジュールとテンプレート環境は
+最初に使うときまで import・構築しない（/health は集計系を読み込まずに応答する）。
+PREWARM で起動時に読み込んでおくこともできる。
+
+月別結果は年度ディレクトリ（outputs/results/FY2025 など）に分けて保存する。画面・ダウンロード・
+クエリは ?year= で選んだ年度（省略時は最新の年度）のディレクトリだけを読み込む。
+
+POST /upload/batch は複数ファイルを受け付け、受信し終えたファイルから順に集計・保存を始める。
+全ファイルの保存後にピボットを年度ごとに1回だけ更新し、進捗は SSE で画面へ送る。
+
+トップ画面はピボットを更新したときに書く年度のサマリー（services/summary.py）だけを読み、
+「現在のデータ」カードの描画結果を年度の世代番号ごとに保持する。
 """
 from __future__ import annotations
 
+import asyncio
+import functools
+import logging
+import os
 import sys
+import threading
+from collections import OrderedDict
+from datetime import date
 from pathlib import Path
 
-from fastapi import FastAPI, File, Request, UploadFile
-from fastapi.responses import HTMLResponse, Response
-from fastapi.templating import Jinja2Templates
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import (
+    FileResponse,
+    HTMLResponse,
+    JSONResponse,
+    PlainTextResponse,
+    Response,
+    StreamingResponse,
+)
 
 from yossy_portal_lib import portal_auth_middleware, csp_middleware, add_health_endpoint
 
 PROJECT_ROOT = Path(__file__).parent.parent
 sys.path.insert(0, str(PROJECT_ROOT))
 
-from services.aggregator import (
-    aggregate,
-    build_pivot,
-    load_excel,
-    parse_target_month,
-    save_monthly_result,
-    to_excel_bytes,
+from app.uploads import (
+    SpooledUpload,
+    UploadError,
+    UploadTooLarge,
+    UploadTooMany,
+    receive_upload,
+    receive_uploads,
 )
+from services.jobs import JobBatch, JobQueue
+from services.metrics import counter, render_prometheus, request_trace, stage
+
+_logger = logging.getLogger(__name__)
+
+OUTPUT_DIR = PROJECT_ROOT / "outputs"
+RESULTS_DIR = OUTPUT_DIR / "results"
+
+# 起動時の事前読み込み: "0"（既定）= しない、"1" = 起動フック内で完了させてから受け付ける、
+# "background" = 受け付けを始めてから別スレッドで行う
+PREWARM = os.environ.get("PREWARM", "0")
+
+MAX_UPLOAD_MB = int(os.environ.get("MAX_UPLOAD_MB", "20"))
+MAX_UPLOAD_SIZE = MAX_UPLOAD_MB * 1024 * 1024
+
+# 0 より大きければ、名簿を全行読み込まずにこの行数ずつ読みながら集計する（メモリは
+# キーの種類数に比例）。大きな名簿を受け付けるため MAX_UPLOAD_MB を上げる場合に使う
+AGGREGATE_BATCH_ROWS = int(os.environ.get("AGGREGATE_BATCH_ROWS", "0"))
 
-RESULTS_DIR = PROJECT_ROOT / "outputs" / "results"
-RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+# アップロード処理の同時実行数・待機数（超過分は混雑エラー）
+UPLOAD_CONCURRENCY = int(os.environ.get("UPLOAD_CONCURRENCY", "2"))
+UPLOAD_QUEUE_SIZE = int(os.environ.get("UPLOAD_QUEUE_SIZE", "8"))
+# ジョブ・一括アップロードの状態ファイルの置き場所（複数の uvicorn ワーカーで共有する）
+JOB_STATE_DIR = OUTPUT_DIR / ".jobs"
+upload_jobs = JobQueue(max_workers=UPLOAD_CONCURRENCY, max_pending=UPLOAD_QUEUE_SIZE,
+                       state_dir=JOB_STATE_DIR)
 
-templates = Jinja2Templates(directory=str(PROJECT_ROOT / "templates"))
+# 一括アップロード: 1回のファイル数の上限・ファイルを並行して集計する数・SSE の確認間隔（秒）
+MAX_BATCH_FILES = int(os.environ.get("MAX_BATCH_FILES", "24"))
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", str(UPLOAD_CONCURRENCY)))
+BATCH_POLL_INTERVAL = 0.25
+batch_jobs = JobQueue(max_workers=BATCH_CONCURRENCY, max_pending=MAX_BATCH_FILES,
+                      state_dir=JOB_STATE_DIR)
+
+# トップ画面の「現在のデータ」カードの描画結果（(年度, 世代番号, 年度一覧) → HTML）
+FRAGMENT_CACHE_SIZE = 16
+_fragments: OrderedDict[tuple, str] = OrderedDict()
+_fragments_lock = threading.Lock()
+
+upload_dedup_hits = counter("upload_dedup_hits_total",
+                            "保存済み結果と同一内容のため集計を省略したアップロード数")
+upload_dedup_misses = counter("upload_dedup_misses_total",
+                              "集計を実行したアップロード数")
+upload_schema_rejections = counter("upload_schema_rejections_total",
+                                   "事前確認で形式が違うと判定したアップロード数")
 
 app = FastAPI(title="月次受講人数集計")
 
@@ -38,76 +105,612 @@ app.middleware("http")(csp_middleware)
 add_health_endpoint(app)
 
 
+@functools.cache
+def _templates():
+    from fastapi.templating import Jinja2Templates
+    return Jinja2Templates(directory=str(PROJECT_ROOT / "templates"))
+
+
+def _render(name: str, context: dict):
+    return _templates().TemplateResponse(name, context)
+
+
+def warm_up() -> None:
+    """集計系モジュール・テンプレート環境・ピボットキャッシュを読み込んでおく"""
+    _templates()
+    _current_pivot()
+
+
+@app.on_event("startup")
+async def _startup():
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    if PREWARM == "1":
+        await run_in_threadpool(warm_up)
+    elif PREWARM == "background":
+        threading.Thread(target=warm_up, name="prewarm", daemon=True).start()
+
+
+@app.on_event("shutdown")
+def _shutdown_jobs():
+    upload_jobs.shutdown(wait=False)
+    batch_jobs.shutdown(wait=False)
+
+
 @app.get("/", response_class=HTMLResponse)
-async def index(request: Request):
-    pivot = build_pivot(RESULTS_DIR)
-    months = [c for c in pivot.columns if c not in ["学年", "教室", "講座名", "M/C", "担当"]] if not pivot.empty else []
-    return templates.TemplateResponse("index.html", {
-        "request": request,
-        "has_data": not pivot.empty,
-        "months": months,
-        "total_rows": len(pivot) if not pivot.empty else 0,
+async def index(request: Request, year: str | None = None):
+    with request_trace("index"):
+        years, fiscal_year, summary_html = await run_in_threadpool(_index_data, year)
+        with stage("render"):
+            return _render("index.html", {
+                "request": request,
+                "year": fiscal_year,
+                "summary_html": summary_html,
+            })
+
+
+def _index_data(year: str | None):
+    years = _fiscal_years()
+    try:
+        fiscal_year = _selected_year(year, years)
+    except UnknownYear:
+        fiscal_year = _selected_year(None, years)
+    return years, fiscal_year, _summary_fragment(fiscal_year, years)
+
+
+def _summary_fragment(fiscal_year: int, years: list[int]) -> str:
+    """「現在のデータ」カードの HTML。年度の世代番号が同じ間は描画済みのものを返す
+
+    サマリー（services/summary.py）も世代番号が同じなら JSON を読むだけで、ピボットは読まない。
+    """
+    from services.atomic_io import read_generation
+
+    year_dir = _year_dir(fiscal_year)
+    key = (fiscal_year, read_generation(year_dir), tuple(years))
+    with _fragments_lock:
+        html = _fragments.get(key)
+        if html is not None:
+            _fragments.move_to_end(key)
+            return html
+    summary = _year_summary(fiscal_year, key[1])
+    html = _templates().get_template("index_summary.html").render({
+        "year": fiscal_year,
+        "years": years,
+        "has_data": bool(summary["total_rows"]),
+        **summary,
     })
+    with _fragments_lock:
+        _fragments[key] = html
+        if len(_fragments) > FRAGMENT_CACHE_SIZE:
+            _fragments.popitem(last=False)
+    return html
+
+
+def _year_summary(fiscal_year: int, generation: int | None = None) -> dict:
+    """fiscal_year の保存済みサマリー。ない・古い場合はピボットから作り直して保存する"""
+    from services.summary import read_summary
+
+    summary = read_summary(_year_dir(fiscal_year), generation)
+    return summary if summary is not None else _refresh_summary(fiscal_year)
+
+
+def _refresh_summary(fiscal_year: int) -> dict:
+    """fiscal_year のピボットを読み込み、サマリーを書き直して返す"""
+    from services.aggregator import store_only
+    from services.atomic_io import read_generation
+    from services.summary import write_store_summary, write_summary
+
+    year_dir = _year_dir(fiscal_year)
+    generation = read_generation(year_dir)
+    if store_only(year_dir):
+        # SQLite ストアだけの年度は SQL の集計から作り、ピボットを組み立てない
+        with stage("summary"):
+            return write_store_summary(year_dir, generation)
+    pivot = _current_pivot(fiscal_year)
+    with stage("summary"):
+        return write_summary(year_dir, pivot, generation)
+
+
+@functools.cache
+def _partitioned() -> None:
+    """年度別に分ける前の配置（results 直下）の月別結果を年度ディレクトリへ移す（初回のみ）"""
+    from services.aggregator import partition_legacy_results
+
+    moved = partition_legacy_results(RESULTS_DIR)
+    if moved:
+        _logger.info("月別結果を年度ディレクトリへ移動しました: %s", ", ".join(moved))
+
+
+def _fiscal_years() -> list[int]:
+    from services.aggregator import list_fiscal_years
+
+    _partitioned()
+    return list_fiscal_years(RESULTS_DIR)
+
+
+class UnknownYear(LookupError):
+    """?year= の年度に月別結果がない（保存済みの年度でも今年度でもない）"""
+
+
+def _selected_year(year: str | None, years: list[int]) -> int:
+    """?year= の年度。省略・数字でない場合は保存済みの最新年度（なければ今年度）
+
+    保存済みの年度と今年度以外は UnknownYear（年度ごとのキャッシュを任意の ?year= で増やさない）。
+    """
+    current = _current_fiscal_year()
+    if year and year.isdecimal():
+        fiscal_year = int(year)
+        if fiscal_year not in years and fiscal_year != current:
+            raise UnknownYear(f"{fiscal_year} 年度のデータはありません")
+        return fiscal_year
+    return years[-1] if years else current
+
+
+def _current_fiscal_year() -> int:
+    today = date.today()
+    return today.year if today.month >= 4 else today.year - 1
+
+
+def _year_dir(fiscal_year: int) -> Path:
+    """年度の月別結果ディレクトリ"""
+    from services.aggregator import fiscal_year_dir
+
+    _partitioned()
+    return fiscal_year_dir(RESULTS_DIR, fiscal_year)
+
+
+def _current_pivot(fiscal_year: int | None = None):
+    """fiscal_year（省略時は最新の年度）のピボット"""
+    from services.pivot_cache import cached_pivot
+
+    if fiscal_year is None:
+        fiscal_year = _selected_year(None, _fiscal_years())
+    with stage("build_pivot") as s:
+        pivot = cached_pivot(_year_dir(fiscal_year))
+        s.rows_out = len(pivot)
+    return pivot
+
+
+def process_upload(upload: SpooledUpload, target_month) -> dict:
+    """アップロード1件の集計・保存・ピボット更新（ワーカースレッドで実行）
+
+    result.html に渡すコンテキストを返す。一時ファイルは処理後に閉じる。
+    """
+    with request_trace("upload", file=upload.filename, month=str(target_month), bytes=upload.size):
+        return _process_upload(upload, target_month)
+
+
+def _process_upload(upload: SpooledUpload, target_month) -> dict:
+    saved = _save_upload(upload, target_month)
+    if "error" in saved:
+        return saved
+    return result_context(target_month, saved["rows"])
+
+
+def process_batch_item(upload: SpooledUpload, target_month) -> dict:
+    """一括アップロードの1ファイル分の集計・保存（ピボットはバッチの最後にまとめて更新）"""
+    with request_trace("batch_upload", file=upload.filename, month=str(target_month),
+                       bytes=upload.size):
+        error = _check_schema(upload)
+        if error is not None:
+            upload.close()
+            return {"error": error}
+        return _save_upload(upload, target_month)
+
+
+def _check_schema(upload: SpooledUpload) -> str | None:
+    """シートの先頭だけを読んで形式を確認し、合わなければ画面に出すメッセージを返す"""
+    from services.preflight import SchemaError, preflight
+
+    with stage("preflight"):
+        try:
+            preflight(upload.file)
+        except SchemaError as e:
+            upload_schema_rejections.inc()
+            return f"Excel の形式が想定と異なります: {e}"
+    return None
+
+
+def _save_upload(upload: SpooledUpload, target_month) -> dict:
+    """集計して月別結果とキューブを保存する。{"month", "rows"} か {"error"} を返す"""
+    from services.month_writer import save_month
+
+    try:
+        if AGGREGATE_BATCH_ROWS > 0:
+            result, cube = _aggregate_in_batches(upload, target_month)
+        else:
+            result, cube = _aggregate_whole(upload, target_month)
+    except Exception as e:
+        _logger.error("集計エラー: %s", e, exc_info=True)
+        return {"error": "集計処理に失敗しました。Excelファイルの形式を確認してください"}
+    finally:
+        upload.close()
+
+    if result is None or result.empty:
+        return {"error": f"{target_month}: 集計対象データがありませんでした"}
+
+    year_dir = _month_dir(target_month)
+    with stage("save_monthly_result") as s:
+        s.rows_in = len(result)
+        save_month(result, target_month, year_dir, upload.sha256, cube)
+    return {"month": str(target_month), "rows": len(result)}
+
+
+def _aggregate_whole(upload: SpooledUpload, target_month):
+    """(月別結果, 件数キューブ)。月別結果はキューブを KEY_COLS で合算したもの"""
+    from services.aggregator import KEY_COLS, aggregate_cube, load_excel, rollup
+
+    with stage("load_excel") as s:
+        df = load_excel(upload.file)
+        s.bytes_read = upload.size
+        s.rows_out = len(df)
+    with stage("aggregate") as s:
+        s.rows_in = len(df)
+        cube = aggregate_cube(df, target_month)
+        result = rollup(cube, KEY_COLS)
+        s.rows_out = len(result)
+    return result, cube
+
+
+def _aggregate_in_batches(upload: SpooledUpload, target_month):
+    """読み込みと集計を1段階として、AGGREGATE_BATCH_ROWS 行ずつ処理する"""
+    from services.aggregator import CUBE_COLS, KEY_COLS, aggregate_batches, iter_excel_batches, rollup
+
+    rows_in = 0
+
+    def counted(batches):
+        nonlocal rows_in
+        for batch in batches:
+            rows_in += len(batch)
+            yield batch
+
+    with stage("aggregate") as s:
+        s.bytes_read = upload.size
+        cube = aggregate_batches(
+            counted(iter_excel_batches(upload.file, AGGREGATE_BATCH_ROWS)), target_month, CUBE_COLS)
+        result = rollup(cube, KEY_COLS)
+        s.rows_in = rows_in
+        s.rows_out = len(result)
+    return result, cube
+
+
+def _month_dir(target_month) -> Path:
+    """target_month の年度の月別結果ディレクトリ"""
+    from services.aggregator import fiscal_year_of
+
+    return _year_dir(fiscal_year_of(target_month))
+
+
+def result_context(target_month, rows: int) -> dict:
+    """集計完了画面のコンテキスト（target_month の年度のピボットの月数・行数を含む）"""
+    from services.aggregator import fiscal_year_of
+
+    return {
+        "month": str(target_month),
+        "rows": rows,
+        **_year_context(fiscal_year_of(target_month)),
+    }
+
+
+def _year_context(fiscal_year: int) -> dict:
+    """fiscal_year のピボットの月数・行数（保存後に呼ぶため、サマリーも書き直す）"""
+    summary = _refresh_summary(fiscal_year)
+    return {
+        "year": fiscal_year,
+        "months": summary["months"],
+        "total_rows": summary["total_rows"],
+    }
 
 
 @app.post("/upload", response_class=HTMLResponse)
-async def upload(request: Request, file: UploadFile = File(...)):
-    contents = await file.read()
-    MAX_UPLOAD_SIZE = 20 * 1024 * 1024  # 20MB
-    if len(contents) > MAX_UPLOAD_SIZE:
-        return templates.TemplateResponse("result.html", {
+async def upload(request: Request):
+    from services.aggregator import parse_target_month
+    from services.manifest import find_month_source
+
+    # 本体をチャンク単位で一時ファイルに受信し、上限超過は受信途中で打ち切る
+    try:
+        upload = await receive_upload(request, "file", MAX_UPLOAD_SIZE)
+    except UploadTooLarge:
+        return _render("result.html", {
+            "request": request,
+            "error": f"ファイルサイズが上限（{MAX_UPLOAD_MB}MB）を超えています",
+        })
+    except UploadError as e:
+        _logger.warning("アップロード受信エラー: %s", e)
+        return _render("result.html", {
             "request": request,
-            "error": "ファイルサイズが上限（20MB）を超えています",
+            "error": "アップロードされたファイルを読み取れませんでした",
         })
-    filename = file.filename or ""
+    filename = upload.filename
 
     target_month = parse_target_month(filename)
     if target_month is None:
-        return templates.TemplateResponse("result.html", {
+        upload.close()
+        return _render("result.html", {
             "request": request,
             "error": f"ファイル名からターゲット月を判定できません: {filename}（例: *_2504.xlsx）",
         })
 
-    import logging
-    _logger = logging.getLogger(__name__)
-    try:
-        df = load_excel(contents)
-        result = aggregate(df, target_month)
-    except Exception as e:
-        _logger.error("集計エラー: %s", e, exc_info=True)
-        return templates.TemplateResponse("result.html", {
+    # 保存済みの月と同一内容なら集計せずに既存結果を返す
+    month_dir = await run_in_threadpool(_month_dir, target_month)
+    source = find_month_source(month_dir, str(target_month), upload.sha256)
+    if source is not None:
+        upload.close()
+        upload_dedup_hits.inc()
+        context = await run_in_threadpool(result_context, target_month, source["rows"])
+        return _render("result.html", {
             "request": request,
-            "error": "集計処理に失敗しました。Excelファイルの形式を確認してください",
+            "deduplicated": True,
+            **context,
         })
+    upload_dedup_misses.inc()
 
-    if result is None or result.empty:
-        return templates.TemplateResponse("result.html", {
+    # 全行を読む前に形式を確認し、違えばジョブに回さずに返す
+    error = await run_in_threadpool(_check_schema, upload)
+    if error is not None:
+        upload.close()
+        return _render("result.html", {"request": request, "error": error})
+
+    job = upload_jobs.submit(filename, process_upload, upload, target_month)
+    if job is None:
+        upload.close()
+        return _render("result.html", {
             "request": request,
-            "error": f"{target_month}: 集計対象データがありませんでした",
+            "error": "処理待ちのアップロードが多いため受け付けられませんでした。しばらくしてから再度お試しください",
         })
+    return _render("result.html", {
+        "request": request,
+        "job": job,
+    })
 
-    save_monthly_result(result, target_month, RESULTS_DIR)
 
-    pivot = build_pivot(RESULTS_DIR)
+@app.post("/upload/batch", response_class=HTMLResponse)
+async def upload_batch(request: Request):
+    """複数ファイルの一括アップロード
 
-    months = [c for c in pivot.columns if c not in ["学年", "教室", "講座名", "M/C", "担当"]]
-    return templates.TemplateResponse("result.html", {
-        "request": request,
-        "month": str(target_month),
-        "rows": len(result),
-        "months": months,
-        "total_rows": len(pivot),
-    })
+    受信し終えたファイルから順に batch_jobs で集計・保存し（同時実行は BATCH_CONCURRENCY まで）、
+    全ファイルの保存後に _finish_batch でピボットを年度ごとに1回だけ更新する。
+    応答はファイル一覧のカードで、進捗は GET /upload/batch/{id}/events（SSE）で更新する。
+    """
+    from services.aggregator import parse_target_month
+    from services.manifest import find_month_source
+
+    await run_in_threadpool(_partitioned)
+    batch = batch_jobs.batch(_finish_batch)
+    months = set()
+
+    def accept(upload: SpooledUpload) -> None:
+        # 受信中に呼ばれる（イベントループ上）。重い処理はジョブに回す
+        target_month = parse_target_month(upload.filename)
+        if target_month is None:
+            upload.close()
+            batch.add(upload.filename, {"error": "ファイル名からターゲット月を判定できません（例: *_2504.xlsx）"})
+            return
+        if target_month in months:
+            upload.close()
+            batch.add(upload.filename, {"error": f"{target_month} のファイルが他にもあるため集計しませんでした"})
+            return
+        months.add(target_month)
+        source = find_month_source(_month_dir(target_month), str(target_month), upload.sha256)
+        if source is not None:
+            upload.close()
+            upload_dedup_hits.inc()
+            batch.add(upload.filename, {"month": str(target_month), "rows": source["rows"],
+                                        "deduplicated": True})
+            return
+        upload_dedup_misses.inc()
+        if batch.submit(upload.filename, process_batch_item, upload, target_month) is None:
+            upload.close()
+            batch.add(upload.filename, {"error": "処理待ちのアップロードが多いため受け付けられませんでした"})
+
+    error = None
+    try:
+        await receive_uploads(request, "files", MAX_UPLOAD_SIZE, MAX_BATCH_FILES, accept)
+    except UploadTooLarge:
+        error = f"ファイルサイズが上限（1ファイル {MAX_UPLOAD_MB}MB）を超えたため、以降のファイルは受け付けていません"
+    except UploadTooMany:
+        error = f"一度にアップロードできるのは {MAX_BATCH_FILES} ファイルまでです。以降のファイルは受け付けていません"
+    except UploadError as e:
+        _logger.warning("一括アップロード受信エラー: %s", e)
+        error = "アップロードされたファイルを読み取れませんでした"
+    await run_in_threadpool(batch.seal)
+
+    jobs = batch.jobs
+    if not jobs:
+        return _render("batch.html", {"request": request, "error": error or "ファイルが選択されていません"})
+    return _render("batch.html", {"request": request, "batch": batch, "jobs": jobs, "error": error})
+
+
+def _finish_batch(batch: JobBatch) -> list[dict]:
+    """一括アップロードの全ファイル保存後に、保存した月の年度のピボットを1回ずつ更新する"""
+    import pandas as pd
+
+    from services.aggregator import fiscal_year_of
+
+    years = sorted({fiscal_year_of(pd.Period(job.result["month"], "M")) for job in batch.jobs
+                    if isinstance(job.result, dict) and "month" in job.result})
+    with request_trace("batch_finish", batch=batch.id, years=len(years)):
+        return [_year_context(fiscal_year) for fiscal_year in years]
+
+
+def _sse(event: str, html: str) -> str:
+    """SSE の1イベント（HTML は空行を除いて行ごとに data: を付ける）"""
+    lines = [line for line in html.splitlines() if line.strip()] or [""]
+    data = "".join(f"data: {line}\n" for line in lines)
+    return f"event: {event}\n{data}\n"
+
+
+@app.get("/upload/batch/{batch_id}/events")
+async def batch_events(batch_id: str):
+    """一括アップロードの進捗（SSE）
+
+    ファイルの状態が変わるたびに file-{番号} イベントで行の HTML を、全ファイルの保存と
+    ピボット更新が終わったら complete イベントで結果の HTML を送って終了する。
+    バッチを受け付けたのが別のワーカーなら、毎回その状態ファイルを読み直す。
+    """
+    batch = await run_in_threadpool(batch_jobs.get_batch, batch_id)
+    if batch is None:
+        return Response("処理状況が見つかりません", status_code=404)
+    templates = _templates().env
+
+    async def stream():
+        nonlocal batch
+        sent: dict[int, str] = {}
+        while True:
+            finished = batch.finished
+            for i, job in enumerate(batch.jobs):
+                if sent.get(i) != job.status:
+                    sent[i] = job.status
+                    yield _sse(f"file-{i}", templates.get_template("batch_item.html").render(job=job))
+            if finished:
+                yield _sse("complete", templates.get_template("batch_done.html").render(
+                    batch=batch, jobs=batch.jobs))
+                return
+            await asyncio.sleep(BATCH_POLL_INTERVAL)
+            batch = await run_in_threadpool(batch_jobs.get_batch, batch_id) or batch
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.get("/jobs/{job_id}", response_class=HTMLResponse)
+async def job_status(request: Request, job_id: str):
+    job = await run_in_threadpool(upload_jobs.get, job_id)
+    if job is None:
+        return _render("result.html", {
+            "request": request,
+            "error": "処理状況が見つかりません。もう一度アップロードしてください",
+        })
+    if not job.finished:
+        return _render("result.html", {"request": request, "job": job})
+    if job.error is not None:
+        return _render("result.html", {
+            "request": request,
+            "error": "集計処理に失敗しました。Excelファイルの形式を確認してください",
+        })
+    with request_trace("job_result", job=job.id), stage("render"):
+        return _render("result.html", {"request": request, **job.result})
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
 
 
 @app.get("/download")
-async def download():
-    pivot = build_pivot(RESULTS_DIR)
+async def download(request: Request, year: str | None = None):
+    from services.export_cache import (
+        cached_export,
+        etag_matches,
+        export_path,
+        iter_export,
+        pivot_with_etag,
+    )
+
+    years = await run_in_threadpool(_fiscal_years)
+    try:
+        year_dir = _year_dir(_selected_year(year, years))
+    except UnknownYear:
+        return Response("データがありません", status_code=404)
+    pivot, etag = await run_in_threadpool(pivot_with_etag, year_dir)
     if pivot is None or pivot.empty:
         return Response("データがありません", status_code=404)
-    excel_bytes = to_excel_bytes(pivot)
-    return Response(
-        content=excel_bytes,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": "attachment; filename=monthly_stats.xlsx"},
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "no-cache",
+        "Content-Disposition": f"attachment; filename={export_path(year_dir, OUTPUT_DIR).name}",
+    }
+    path = await run_in_threadpool(cached_export, etag, year_dir, OUTPUT_DIR)
+    if path is not None:
+        return FileResponse(path, media_type=media_type, headers=headers)
+    # 月別結果が変わった後の初回だけ生成。送信しながらディスクにも保存する
+    return StreamingResponse(iter_export(pivot, etag, year_dir, OUTPUT_DIR),
+                             media_type=media_type, headers=headers)
+
+
+def _run_query(params) -> dict:
+    """クエリパラメータを解釈して pivot_index().query()（SQLite ストアだけの年度は store_query()）を呼ぶ"""
+    from services.aggregator import KEY_COLS, store_only
+    from services.pivot_index import (
+        DEFAULT_LIMIT,
+        FIELD_ALIASES,
+        QueryError,
+        pivot_index,
+        store_query,
     )
+
+    year = params.get("year")
+    if year is not None and not year.isdecimal():
+        raise QueryError(f"year は年度（例: 2025）で指定してください: {year}")
+    filters = {name: params.getlist(name) for name in params
+               if name in FIELD_ALIASES or name in KEY_COLS}
+    group_by = params.get("group_by")
+    if group_by is not None:
+        group_by = [c.strip() for c in group_by.split(",") if c.strip()]
+    try:
+        offset = int(params.get("offset", 0))
+        limit = int(params.get("limit", DEFAULT_LIMIT))
+    except ValueError:
+        raise QueryError("offset / limit は整数で指定してください") from None
+    fiscal_year = _selected_year(year, _fiscal_years())
+    year_dir = _year_dir(fiscal_year)
+    args = (filters, params.get("month_from"), params.get("month_to"), group_by, offset, limit)
+    if store_only(year_dir):
+        result = store_query(year_dir, *args)
+    else:
+        result = pivot_index(year_dir).query(*args)
+    return {"year": fiscal_year, **result}
+
+
+@app.get("/api/query")
+async def query(request: Request):
+    """ピボットを条件で絞り込み・合算して JSON で返す
+
+    例: /api/query?year=2025&grade=高2&classroom=本校&group_by=担当&month_from=4月&month_to=9月
+    """
+    from services.pivot_index import QueryError
+
+    try:
+        result = await run_in_threadpool(_run_query, request.query_params)
+    except QueryError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    except UnknownYear as e:
+        return JSONResponse({"error": str(e)}, status_code=404)
+    return JSONResponse(result)
+
+
+def _summary(params) -> dict:
+    """年度の月別総計と、by 指定時はその列の値ごとの月別合計（ロールアップから）"""
+    from services.cube import ROLLUP_DIMS, summary_table
+
+    year = params.get("year")
+    if year is not None and not year.isdecimal():
+        raise ValueError(f"year は年度（例: 2025）で指定してください: {year}")
+    fiscal_year = _selected_year(year, _fiscal_years())
+    result = {"year": fiscal_year, "totals": _year_summary(fiscal_year)["month_totals"]}
+    by = params.get("by")
+    if by is not None:
+        if by not in ROLLUP_DIMS:
+            raise ValueError(f"by は {', '.join(ROLLUP_DIMS)} のいずれかを指定してください: {by}")
+        table = summary_table(_year_dir(fiscal_year), by)
+        result["by"] = by
+        result["rows"] = table.to_dict(orient="records")
+    return result
+
+
+@app.get("/api/summary")
+async def summary(request: Request):
+    """年度の月別総計・学年／教室／担当ごとの月別合計を JSON で返す
+
+    例: /api/summary?year=2025&by=学年
+    """
+    try:
+        result = await run_in_threadpool(_summary, request.query_params)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    except UnknownYear as e:
+        return JSONResponse({"error": str(e)}, status_code=404)
+    return JSONResponse(result)
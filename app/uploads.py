@@ -0,0 +1,176 @@
+"""
+ストリーミングアップロード受信
+
+multipart/form-data のリクエスト本体をチャンク単位で解析し、ファイル部分を
+SpooledTemporaryFile（SPOOL_SIZE 超でディスクへ退避）に書き込みながら sha256 を計算する。
+上限サイズを超えた時点で受信を打ち切るため、巨大な本体を全てメモリに載せることはない。
+receive_uploads() は複数ファイルを受け取り、1ファイル受信し終えるごとにコールバックへ渡す
+（残りのファイルを受信している間に処理を始められる）。
+"""
+from __future__ import annotations
+
+import hashlib
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from tempfile import SpooledTemporaryFile
+from typing import Any
+
+from python_multipart import MultipartParser
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import parse_options_header
+from starlette.requests import Request
+
+SPOOL_SIZE = 1024 * 1024  # 1MB までメモリ、超えたら一時ファイル
+_FORM_OVERHEAD = 64 * 1024  # Content-Length 事前判定時の multipart ヘッダー分の余裕
+
+
+class UploadTooLarge(Exception):
+    """アップロードが上限サイズを超えた"""
+
+
+class UploadError(Exception):
+    """multipart として解釈できない、または対象フィールドがない"""
+
+
+class UploadTooMany(UploadError):
+    """ファイル数が上限を超えた"""
+
+
+@dataclass
+class SpooledUpload:
+    """受信済みアップロード。利用後は close() すること"""
+    filename: str
+    file: SpooledTemporaryFile
+    size: int = 0
+    sha256: str = ""
+
+    def close(self) -> None:
+        self.file.close()
+
+
+@dataclass
+class _PartState:
+    field_name: str
+    max_size: int
+    spool_size: int
+    max_files: int = 1
+    on_file: Callable[[SpooledUpload], None] | None = None
+    header_field: bytearray = field(default_factory=bytearray)
+    header_value: bytearray = field(default_factory=bytearray)
+    headers: dict[bytes, bytes] = field(default_factory=dict)
+    current: SpooledUpload | None = None
+    uploads: list[SpooledUpload] = field(default_factory=list)
+    hasher: Any = None
+
+    def on_part_begin(self) -> None:
+        self.headers = {}
+        self.current = None
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self.header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self.header_value += data[start:end]
+
+    def on_header_end(self) -> None:
+        self.headers[bytes(self.header_field).lower()] = bytes(self.header_value)
+        self.header_field.clear()
+        self.header_value.clear()
+
+    def on_headers_finished(self) -> None:
+        _, options = parse_options_header(self.headers.get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        if name != self.field_name or b"filename" not in options:
+            return
+        filename = options[b"filename"].decode("utf-8", "replace")
+        if self.max_files > 1 and not filename:
+            return  # 複数選択の入力でファイル未選択のときの空パート
+        if len(self.uploads) >= self.max_files:
+            if self.max_files == 1:
+                return  # 1ファイル受信では2つ目以降を無視
+            raise UploadTooMany(f"ファイル数が {self.max_files} を超えています")
+        self.current = SpooledUpload(filename, SpooledTemporaryFile(max_size=self.spool_size))
+        self.hasher = hashlib.sha256()
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self.current is None:
+            return
+        self.current.size += end - start
+        if self.current.size > self.max_size:
+            raise UploadTooLarge(f"{self.current.filename}: {self.max_size} bytes を超えています")
+        chunk = data[start:end]
+        self.hasher.update(chunk)
+        self.current.file.write(chunk)
+
+    def on_part_end(self) -> None:
+        if self.current is not None:
+            upload, self.current = self.current, None
+            upload.sha256 = self.hasher.hexdigest()
+            upload.file.seek(0)
+            self.uploads.append(upload)
+            if self.on_file is not None:
+                self.on_file(upload)
+
+    def close(self) -> None:
+        """受信途中・コールバックへ渡していない一時ファイルを閉じる"""
+        pending = [] if self.on_file is not None else self.uploads
+        for upload in [self.current, *pending]:
+            if upload is not None:
+                upload.close()
+
+
+async def receive_upload(request: Request, field_name: str, max_size: int,
+                         spool_size: int = SPOOL_SIZE) -> SpooledUpload:
+    """リクエスト本体から field_name のファイルを受信する
+
+    Content-Length が明らかに上限を超える場合は本体を読まずに UploadTooLarge。
+    返り値のファイル位置は先頭に戻してある。
+    """
+    state = _PartState(field_name, max_size, spool_size)
+    await _receive(request, state, max_size)
+    if not state.uploads:
+        raise UploadError(f"ファイルフィールド {field_name} がありません")
+    return state.uploads[0]
+
+
+async def receive_uploads(request: Request, field_name: str, max_size: int, max_files: int,
+                          on_file: Callable[[SpooledUpload], None],
+                          spool_size: int = SPOOL_SIZE) -> int:
+    """field_name の複数ファイルを受信し、1つ受信し終えるごとに on_file(upload) を呼ぶ
+
+    max_size は1ファイルあたりの上限。渡したファイル（位置は先頭）は on_file 側で閉じること。
+    上限超過・解析エラーの例外は、それまでに受信したファイルを on_file へ渡した後に送出する。
+    受信したファイル数を返す。
+    """
+    state = _PartState(field_name, max_size, spool_size, max_files, on_file)
+    await _receive(request, state, max_size * max_files)
+    return len(state.uploads)
+
+
+async def _receive(request: Request, state: _PartState, max_total: int) -> None:
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise UploadError("multipart/form-data ではありません")
+
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > max_total + _FORM_OVERHEAD:
+        raise UploadTooLarge(f"Content-Length {length} が上限を超えています")
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": state.on_part_begin,
+        "on_header_field": state.on_header_field,
+        "on_header_value": state.on_header_value,
+        "on_header_end": state.on_header_end,
+        "on_headers_finished": state.on_headers_finished,
+        "on_part_data": state.on_part_data,
+        "on_part_end": state.on_part_end,
+    })
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+        parser.finalize()
+    except BaseException as e:
+        state.close()
+        if isinstance(e, MultipartParseError):
+            raise UploadError(f"multipart の解析に失敗しました: {e}") from e
+        raise
@@ -0,0 +1,6 @@
+"""
+性能計測ハーネス
+
+合成名簿（benchmarks/roster.py）で読み込み・集計・保存・ピボット・出力の各段階を計測し、
+JSON レポートをベースラインと比較する（benchmarks/run.py）。
+"""
@@ -0,0 +1,127 @@
+"""
+合成名簿ジェネレータ
+
+COLUMN_INDICES の列配置（Row 1-3 タイトル、Row 4 ヘッダー、Row 5 以降データ）で
+受講者リスト Excel を生成する。分布は実データに寄せている:
+- 追加日: 年度初め（3-4月）に集中し、残りは年度内に散らばる。時刻付きの行も含む
+- 取消日: 約 25% の行に、追加日から数日〜数ヶ月後
+- 学年: 高1〜高3（31-33）が大半、中学（21-23）が少し
+- 担当: 少数の担当者に偏る（Zipf）。「0」「-」「」の除外対象も少し
+- 講座名: 一部に ｱﾄﾞﾊﾞﾝｽ・ﾊｲﾚﾍﾞﾙ、M/C は【マスター】【コア】と空
+"""
+from __future__ import annotations
+
+import hashlib
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+from openpyxl import Workbook
+
+from services.aggregator import COLUMN_INDICES, HEADER_ROW
+
+_WIDTH = max(COLUMN_INDICES.values()) + 1
+_HEADERS = {
+    "add_date": "受講追加日付",
+    "cancel_date": "受講取消日付",
+    "course": "講座名",
+    "class_type": "M/C",
+    "classroom": "受講教室",
+    "grade": "学年コード",
+    "teacher": "担当",
+    "gender": "性別",
+    "school": "在籍校",
+    "department": "学科",
+}
+GENERATOR_VERSION = 1
+
+
+def _courses(rng: np.random.Generator, count: int = 200) -> np.ndarray:
+    subjects = ["英語", "数学", "国語", "物理", "化学", "生物", "日本史", "世界史", "地理"]
+    levels = ["", "ｽﾀﾝﾀﾞｰﾄﾞ", "ｱﾄﾞﾊﾞﾝｽ", "ﾊｲﾚﾍﾞﾙ", "基礎"]
+    names = {f"{rng.choice(subjects)}{rng.choice(levels)}{i % 40 + 1}" for i in range(count * 2)}
+    return np.array(sorted(names)[:count], dtype=object)
+
+
+def roster_columns(rows: int, fiscal_year: int = 2025, seed: int = 0) -> dict[str, np.ndarray]:
+    """COLUMN_INDICES の各列の値（object 配列）を生成"""
+    rng = np.random.default_rng(seed)
+    start = datetime(fiscal_year, 3, 1)
+
+    # 追加日: 6 割は 3/1〜4/30、残りは年度内
+    early = rng.random(rows) < 0.6
+    days = np.where(early, rng.integers(0, 61, rows), rng.integers(0, 396, rows))
+    seconds = np.where(rng.random(rows) < 0.1, rng.integers(9 * 3600, 21 * 3600, rows), 0)
+    add = np.array([start + timedelta(days=int(d), seconds=int(s)) for d, s in zip(days, seconds)],
+                   dtype=object)
+
+    cancelled = rng.random(rows) < 0.25
+    gap = rng.integers(1, 240, rows)
+    cancel = np.array([a + timedelta(days=int(g)) if c else None
+                       for a, g, c in zip(add, gap, cancelled)], dtype=object)
+
+    grade = rng.choice([31, 32, 33, 21, 22, 23], rows, p=[0.3, 0.3, 0.3, 0.04, 0.03, 0.03])
+
+    teachers = np.array([f"講師{i:03d}" for i in range(120)], dtype=object)
+    weights = 1 / np.arange(1, len(teachers) + 1)
+    teacher = rng.choice(teachers, rows, p=weights / weights.sum())
+    excluded = rng.random(rows) < 0.03
+    teacher[excluded] = rng.choice(np.array(["0", "-", None], dtype=object), excluded.sum())
+
+    courses = _courses(rng)
+    rooms = np.array([f"{name}校" for name in
+                      ["本", "駅前", "北", "南", "東", "西", "中央", "港", "山手", "川辺"]], dtype=object)
+    return {
+        "add_date": add,
+        "cancel_date": cancel,
+        "course": rng.choice(courses, rows),
+        "class_type": rng.choice(np.array(["【マスター】", "【コア】", None], dtype=object), rows,
+                                 p=[0.45, 0.45, 0.1]),
+        "classroom": rng.choice(rooms, rows),
+        "grade": grade,
+        "teacher": teacher,
+        "gender": rng.choice(np.array(["男", "女"], dtype=object), rows),
+        "school": rng.choice(np.array([f"高校{i:02d}" for i in range(60)], dtype=object), rows),
+        "department": rng.choice(np.array(["普通科", "理数科", "国際科"], dtype=object), rows),
+    }
+
+
+def write_roster(path: Path, rows: int, fiscal_year: int = 2025, seed: int = 0) -> Path:
+    """合成名簿を path に書き出す（openpyxl の write-only モード）"""
+    columns = roster_columns(rows, fiscal_year, seed)
+    positions = [(COLUMN_INDICES[name], values) for name, values in columns.items()]
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append([f"〔定例報告〕{fiscal_year}AC受講者ﾘｽﾄ（合成データ）"])
+    for _ in range(HEADER_ROW - 1):
+        ws.append([])
+    header = [f"列{i + 1}" for i in range(_WIDTH)]
+    for name, label in _HEADERS.items():
+        header[COLUMN_INDICES[name]] = label
+    ws.append(header)
+
+    row = [None] * _WIDTH
+    for i in range(rows):
+        for col, values in positions:
+            value = values[i]
+            row[col] = value.item() if hasattr(value, "item") else value
+        ws.append(row)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    wb.save(path)
+    return path
+
+
+def cached_roster(cache_dir: Path, rows: int, fiscal_year: int = 2025, seed: int = 0) -> Path:
+    """同じ条件の合成名簿があれば再利用し、なければ生成してパスを返す
+
+    ファイル名末尾の _YYMM は年度末（3月）にし、parse_target_month で対象月が決まるようにする。
+    """
+    key = hashlib.sha256(f"{GENERATOR_VERSION}:{rows}:{fiscal_year}:{seed}".encode()).hexdigest()[:10]
+    path = cache_dir / f"roster_{rows}_{key}_{fiscal_year % 100:02d}03.xlsx"
+    if not path.exists():
+        tmp = path.with_suffix(".tmp")
+        write_roster(tmp, rows, fiscal_year, seed)
+        tmp.replace(path)
+    return path
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+段階別ベンチマーク
+
+合成名簿で read（load_excel）・aggregate・save（save_monthly_result）・
+pivot（build_pivot）・export（write_excel）を計測し、JSON レポートを書き出す。
+行数ごとに別プロセスで実行し、段階ごとの秒数（repeat 回の最小値）と
+ピーク RSS の増分、プロセス全体のピーク RSS を記録する。
+
+使用方法:
+  python -m benchmarks.run --rows 10000 100000 --output bench.json
+  python -m benchmarks.run --rows 10000 --baseline benchmarks/baseline.json --threshold 0.2
+  python -m benchmarks.run --compare bench.json --baseline benchmarks/baseline.json
+
+ベースラインより threshold（既定 20%）以上遅い・大きい段階があれば終了コード 1。
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from benchmarks.roster import cached_roster
+from services.aggregator import (
+    aggregate,
+    build_pivot,
+    load_excel,
+    parse_target_month,
+    save_monthly_result,
+    write_excel,
+)
+from services.metrics import peak_rss
+
+REPORT_VERSION = 1
+STAGES = ("read", "aggregate", "save", "pivot", "export")
+DEFAULT_ROWS = (10_000, 100_000)
+DEFAULT_CACHE = Path(__file__).parent / ".cache"
+PIVOT_MONTHS = 12  # pivot 段階で合算する月数
+MIN_SECONDS = 0.05  # これ未満の差は計測誤差として扱う
+MIN_BYTES = 8 * 1024 * 1024
+
+
+class _Stages:
+    """段階ごとの最小秒数とピーク RSS 増分を記録"""
+
+    def __init__(self):
+        self.seconds: dict[str, float] = {}
+        self.rss_growth: dict[str, int | None] = {}
+
+    def run(self, name: str, fn, *args):
+        rss_before = peak_rss()
+        start = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - start
+        rss_after = peak_rss()
+        self.seconds[name] = min(elapsed, self.seconds.get(name, elapsed))
+        if rss_before is not None:
+            growth = rss_after - rss_before
+            self.rss_growth[name] = max(growth, self.rss_growth.get(name) or 0)
+        else:
+            self.rss_growth[name] = None
+        return result
+
+
+def run_size(rows: int, cache_dir: Path, repeat: int = 1, seed: int = 0) -> dict:
+    """1つの行数について全段階を計測（ワーカープロセスで実行）"""
+    gen_start = time.perf_counter()
+    roster = cached_roster(cache_dir, rows, seed=seed)
+    generate_seconds = time.perf_counter() - gen_start
+    target_month = parse_target_month(roster.name)
+    stages = _Stages()
+
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            results_dir = Path(tmpdir) / "results"
+            df = stages.run("read", load_excel, roster)
+            result = stages.run("aggregate", aggregate, df, target_month)
+            del df
+            stages.run("save", save_monthly_result, result, target_month, results_dir)
+            # 同じ集計結果を年度分の月として置き、ピボットの合算量を実運用に近づける
+            for month in pd.period_range(end=target_month - 1, periods=PIVOT_MONTHS - 1, freq="M"):
+                save_monthly_result(result.rename(columns={result.columns[-1]: f"{month.month}月"}),
+                                    month, results_dir)
+            pivot = stages.run("pivot", build_pivot, results_dir)
+            stages.run("export", write_excel, pivot, Path(tmpdir) / "monthly_stats.xlsx")
+
+    return {
+        "rows": rows,
+        "file_bytes": roster.stat().st_size,
+        "result_rows": len(result),
+        "pivot_rows": len(pivot),
+        "generate_seconds": round(generate_seconds, 4),
+        "peak_rss": peak_rss(),
+        "stages": {
+            name: {"seconds": round(stages.seconds[name], 4),
+                   "rss_growth": stages.rss_growth[name]}
+            for name in STAGES
+        },
+    }
+
+
+def build_report(rows: list[int], cache_dir: Path, repeat: int = 1, seed: int = 0) -> dict:
+    """行数ごとに新しいプロセスで計測し、レポートにまとめる"""
+    runs = []
+    for n in rows:
+        # ピーク RSS を行数ごとに独立させるため、毎回プロセスを作り直す
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            runs.append(pool.submit(run_size, n, cache_dir, repeat, seed).result())
+    return {
+        "version": REPORT_VERSION,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "runs": runs,
+    }
+
+
+def compare(report: dict, baseline: dict, threshold: float = 0.2) -> list[str]:
+    """ベースラインより threshold 以上悪化した項目の説明を返す（空なら問題なし）
+
+    同じ行数の実行同士を比べる。誤差を避けるため MIN_SECONDS / MIN_BYTES 未満の差は無視する。
+    """
+    base_runs = {r["rows"]: r for r in baseline.get("runs", [])}
+    regressions = []
+    for run in report.get("runs", []):
+        base = base_runs.get(run["rows"])
+        if base is None:
+            continue
+        label = f"{run['rows']:,} rows"
+        for name, stage in run["stages"].items():
+            base_stage = base["stages"].get(name)
+            if base_stage is None:
+                continue
+            now, before = stage["seconds"], base_stage["seconds"]
+            if now > before * (1 + threshold) and now - before >= MIN_SECONDS:
+                regressions.append(f"{label} {name}: {before:.3f}s → {now:.3f}s "
+                                   f"(+{(now / before - 1) * 100:.0f}%)")
+        now, before = run.get("peak_rss"), base.get("peak_rss")
+        if now and before and now > before * (1 + threshold) and now - before >= MIN_BYTES:
+            regressions.append(f"{label} peak RSS: {before / 2**20:.1f}MB → {now / 2**20:.1f}MB "
+                               f"(+{(now / before - 1) * 100:.0f}%)")
+    return regressions
+
+
+def print_report(report: dict) -> None:
+    print(f"{'rows':>10}  " + "  ".join(f"{s:>10}" for s in STAGES) + f"  {'peak RSS':>10}")
+    for run in report["runs"]:
+        cells = "  ".join(f"{run['stages'][s]['seconds']:>9.3f}s" for s in STAGES)
+        rss = f"{run['peak_rss'] / 2**20:>8.1f}MB" if run.get("peak_rss") else f"{'-':>10}"
+        print(f"{run['rows']:>10,}  {cells}  {rss}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="読み込み〜出力の段階別ベンチマーク")
+    parser.add_argument("--rows", type=int, nargs="+", default=list(DEFAULT_ROWS),
+                        help="名簿の行数（複数可、既定: 10000 100000）")
+    parser.add_argument("--repeat", type=int, default=1, help="各段階の繰り返し回数（最小値を採用）")
+    parser.add_argument("--seed", type=int, default=0, help="合成名簿の乱数シード")
+    parser.add_argument("--cache-dir", type=Path, default=DEFAULT_CACHE,
+                        help="合成名簿の保存先（同じ条件なら再利用）")
+    parser.add_argument("--output", "-o", type=Path, help="JSON レポートの出力先")
+    parser.add_argument("--compare", type=Path, metavar="REPORT",
+                        help="計測せず、既存のレポートをベースラインと比較する")
+    parser.add_argument("--baseline", type=Path, help="比較するベースラインの JSON レポート")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="悪化とみなす比率（既定 0.2 = 20%%）")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.compare:
+        report = json.loads(args.compare.read_text(encoding="utf-8"))
+    else:
+        report = build_report(args.rows, args.cache_dir, args.repeat, args.seed)
+        if args.output:
+            args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2),
+                                   encoding="utf-8")
+            print(f"Report: {args.output}")
+    print_report(report)
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"\nRegressions (threshold {args.threshold:.0%}):")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\nNo regressions against {args.baseline} (threshold {args.threshold:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,31 +7,129 @@ lists/ 内のすべての Excel ファイルを処理し、
 
 使用方法:
   python scripts/aggregate.py
+  python scripts/aggregate.py --jobs 4   # 4プロセスで並列に読み込み・集計
+  python scripts/aggregate.py --force    # 変化のないファイルも含めて全て再集計
+  python scripts/aggregate.py --batch-rows 50000  # 5万行ずつ読みながら集計（大きな名簿向け）
+
+既定では outputs/results/.manifest.json を参照し、前回から変化のない Excel は
+集計を省略して既存の月別結果を再利用します。
+月別結果は年度ごと（outputs/results/FY2025/ など）に保存し、Pivot Excel も年度ごとに
+outputs/monthly_stats_FY2025.xlsx として出力します。
 """
 
+import argparse
+import os
 import sys
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
 from pathlib import Path
 
 # プロジェクトルートを sys.path に追加
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
-from services.aggregator import (
-    load_excel,
-    parse_target_month,
-    aggregate,
-    save_monthly_result,
-    build_pivot,
-    to_excel_bytes,
-)
+# 集計系（pandas・openpyxl）の import は重いため、--help などでは読み込まないよう
+# 使う関数の中で行う
+
+
+def process_file(file_path: Path, batch_rows: int = 0):
+    """1ファイル分の読み込み＋集計。(集計結果, 件数キューブ, 秒) を返す
+
+    --jobs 指定時はワーカープロセスで実行され、小さな集計結果だけが親に戻る。
+    batch_rows > 0 なら全行を読み込まず、batch_rows 行ずつ読みながら集計する。
+    集計結果はキューブを KEY_COLS で合算したもの。形式が違う Excel は全行を読む前に
+    SchemaError（services/preflight.py）になる。
+    """
+    from services.aggregator import (
+        CUBE_COLS,
+        KEY_COLS,
+        aggregate_batches,
+        aggregate_cube,
+        iter_excel_batches,
+        load_excel,
+        parse_target_month,
+        rollup,
+    )
+    from services.preflight import preflight
+
+    start = time.perf_counter()
+    target_month = parse_target_month(file_path.name)
+    preflight(file_path)
+    if batch_rows > 0:
+        cube = aggregate_batches(iter_excel_batches(file_path, batch_rows), target_month, CUBE_COLS)
+    else:
+        cube = aggregate_cube(load_excel(file_path), target_month)
+    return rollup(cube, KEY_COLS), cube, time.perf_counter() - start
+
+
+def iter_outcomes(files: list[Path], jobs: int, batch_rows: int = 0):
+    """(file_path, Future) を入力順に返す。jobs=1 はプロセス内で逐次実行"""
+    if jobs <= 1:
+        for file_path in files:
+            future = Future()
+            try:
+                future.set_result(process_file(file_path, batch_rows))
+            except Exception as e:
+                future.set_exception(e)
+            yield file_path, future
+        return
+
+    pool = ProcessPoolExecutor(max_workers=jobs)
+    try:
+        futures = [pool.submit(process_file, f, batch_rows) for f in files]
+        yield from zip(files, futures)
+    finally:
+        # エラーで途中終了した場合は未着手のファイルを取り消す
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def year_dirs(results_dir: Path) -> list[Path]:
+    """月別結果のある年度ディレクトリ（年度の昇順）"""
+    from services.aggregator import fiscal_year_dir, list_fiscal_years
+
+    return [fiscal_year_dir(results_dir, y) for y in list_fiscal_years(results_dir)]
+
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="月次受講人数集計")
+    parser.add_argument("--jobs", "-j", type=int, default=1,
+                        help="並列ワーカー数（0 = CPU 数、既定 1 = 逐次）")
+    parser.add_argument("--force", action="store_true",
+                        help="マニフェストを無視して全ファイルを再集計")
+    parser.add_argument("--batch-rows", type=int, default=0,
+                        help="この行数ずつ読みながら集計（既定 0 = 全行を読み込んでから集計）")
+    args = parser.parse_args(argv)
+    if args.jobs < 0:
+        parser.error("--jobs は 0 以上を指定してください")
+    if args.batch_rows < 0:
+        parser.error("--batch-rows は 0 以上を指定してください")
+    args.jobs = args.jobs or os.cpu_count() or 1
+    return args
 
-def main():
+
+def main(argv=None):
     """メイン処理"""
+    args = parse_args(argv)
+
+    from services.aggregator import (
+        RESULT_SUFFIXES,
+        RESULTS_DB,
+        month_partition,
+        parse_target_month,
+        partition_legacy_results,
+        result_store,
+    )
+    from services.atomic_io import bump_generation, read_generation
+    from services.cube import retain_cubes
+    from services.export_cache import retain_exports, write_export
+    from services.manifest import MANIFEST_FILENAME, Manifest
+    from services.month_writer import save_month
+    from services.pivot_cache import cached_pivot, file_digest
+    from services.summary import write_summary
+
     lists_dir = project_root / "lists"
     output_dir = project_root / "outputs"
     results_dir = output_dir / "results"
-    output_file = output_dir / "monthly_stats.xlsx"
 
     # lists ディレクトリの確認
     if not lists_dir.exists():
@@ -43,70 +141,132 @@ def main():
         print(f"Warning: {lists_dir} に Excel ファイルがありません")
         return 0
 
-    # 既存の CSV を削除
     results_dir.mkdir(parents=True, exist_ok=True)
-    for csv in results_dir.glob("*.csv"):
-        csv.unlink()
+    moved = partition_legacy_results(results_dir)
+    if moved:
+        print(f"Moved {len(moved)} month results into fiscal-year directories")
+    if args.force:
+        # 既存の月別結果を削除して全件再集計
+        for year_dir in year_dirs(results_dir):
+            for suffix in RESULT_SUFFIXES.values():
+                for old in year_dir.glob(f"*{suffix}"):
+                    old.unlink()
+            if (year_dir / RESULTS_DB).exists():
+                result_store(year_dir).retain([])
+            retain_cubes(year_dir, set())
+            bump_generation(year_dir)
+        manifest = Manifest(results_dir / MANIFEST_FILENAME)
+    else:
+        manifest = Manifest.load(results_dir)
 
-    print(f"Processing {len(xlsx_files)} files from {lists_dir.name}/")
+    print(f"Processing {len(xlsx_files)} files from {lists_dir.name}/"
+          + (f" ({args.jobs} jobs)" if args.jobs > 1 else ""))
     print("-" * 60)
 
+    targets = {f: parse_target_month(f.name) for f in xlsx_files}
+    keys = {f: f.relative_to(project_root).as_posix() for f in xlsx_files}
+    reused = {f: record for f in xlsx_files
+              if targets[f] and (record := manifest.unchanged(keys[f], f))}
+    outcomes = iter_outcomes([f for f in xlsx_files if targets[f] and f not in reused], args.jobs,
+                             args.batch_rows)
+    started = time.perf_counter()
+
     processed = 0
-    for file_path in xlsx_files:
-        target_month = parse_target_month(file_path.name)
-        if not target_month:
-            print(f"  Skipped: {file_path.name} (invalid filename)")
-            continue
+    try:
+        for file_path in xlsx_files:
+            target_month = targets[file_path]
+            if not target_month:
+                print(f"  Skipped: {file_path.name} (invalid filename)")
+                continue
+
+            record = reused.get(file_path)
+            if record is not None:
+                print(f"  {target_month}: unchanged ({record.result or 'no data'})")
+                processed += record.result is not None
+                continue
 
-        try:
-            df = load_excel(file_path)
-            result = aggregate(df, target_month)
-            if result is not None and len(result) > 0:
-                save_monthly_result(result, target_month, results_dir)
-                print(f"  {target_month}: {len(result)} rows")
-                processed += 1
-            else:
-                print(f"  {target_month}: no data")
-        except Exception as e:
-            print(f"  Error ({target_month}): {e}")
-            return 1
+            _, future = next(outcomes)
+            try:
+                result, cube, elapsed = future.result()
+                if result is not None and len(result) > 0:
+                    year_dir = month_partition(results_dir, target_month)
+                    sha256 = file_digest(file_path)
+                    saved = save_month(result, target_month, year_dir, sha256, cube)
+                    manifest.record(keys[file_path], file_path, str(target_month),
+                                    saved.relative_to(results_dir).as_posix(), sha256)
+                    print(f"  {target_month}: {len(result)} rows ({elapsed:.2f}s)")
+                    processed += 1
+                else:
+                    manifest.record(keys[file_path], file_path, str(target_month), None)
+                    print(f"  {target_month}: no data ({elapsed:.2f}s)")
+            except Exception as e:
+                print(f"  Error ({target_month}): {e}")
+                return 1
+    finally:
+        outcomes.close()
 
+    # 現在の入力に対応しない月別結果（削除された Excel・集計対象なしになった月）を削除
+    manifest.retain({keys[f] for f in xlsx_files if targets[f]})
+    keep = {r.result for r in manifest.records.values() if r.result}
+    kept_months = {r.month for r in manifest.records.values() if r.result}
+    for year_dir in year_dirs(results_dir):
+        removed = []
+        for suffix in RESULT_SUFFIXES.values():
+            for old in year_dir.glob(f"*{suffix}"):
+                if old.relative_to(results_dir).as_posix() not in keep:
+                    old.unlink()
+                    removed.append(old.name)
+        if (year_dir / RESULTS_DB).exists():
+            store_name = f"{year_dir.name}/{RESULTS_DB}"
+            removed += result_store(year_dir).retain(
+                r.month for r in manifest.records.values() if r.result == store_name)
+        if retain_cubes(year_dir, kept_months) or removed:
+            # 削除も保存と同じく世代番号を進め、保存済みのサマリーを無効にする
+            bump_generation(year_dir)
+    manifest.save()
+
+    print(f"  Elapsed: {time.perf_counter() - started:.2f}s")
     print("-" * 60)
 
     if processed == 0:
         print("Error: No data processed")
         return 1
 
-    # Pivot 生成
-    print(f"\nGenerating pivot...")
-    pivot = build_pivot(results_dir)
+    # 年度ごとに Pivot 生成・Excel 出力（月別結果が前回出力時と同じなら書き直さない。
+    # Web の /download と共有）
+    exported = set()
+    for year_dir in year_dirs(results_dir):
+        print(f"\nGenerating pivot ({year_dir.name})...")
+        generation = read_generation(year_dir)
+        pivot = cached_pivot(year_dir)
+        summary = write_summary(year_dir, pivot, generation)
+        if pivot.empty:
+            continue
+        output_file, rewritten = write_export(year_dir, output_dir)
+        exported.add(year_dir.name)
+
+        # 結果表示
+        print(f"Output: {output_file}" + ("" if rewritten else " (unchanged)"))
+        print(f"  Rows: {pivot.shape[0]}")
+        print(f"  Columns: {pivot.shape[1]}")
+        print(f"  Size: {output_file.stat().st_size / 1024:.1f} KB")
 
-    if pivot.empty:
+        # 月別統計（集計時に保存したロールアップから。サマリーと同じ値）
+        totals = summary["month_totals"]
+        if totals:
+            print(f"\nAnnual Summary ({year_dir.name}):")
+            for month, count in totals.items():
+                print(f"  {month}: {count:,}")
+            print(f"  Total: {sum(totals.values()):,}")
+
+    # 月別結果のなくなった年度の Excel と、年度別に分ける前の monthly_stats.xlsx を削除
+    for name in retain_exports(output_dir, exported):
+        print(f"Removed stale output: {name}")
+
+    if not exported:
         print("Error: Failed to generate pivot")
         return 1
 
-    # Excel 出力
-    excel_bytes = to_excel_bytes(pivot)
-    output_dir.mkdir(parents=True, exist_ok=True)
-    output_file.write_bytes(excel_bytes)
-
-    # 結果表示
-    print(f"Output: {output_file}")
-    print(f"  Rows: {pivot.shape[0]}")
-    print(f"  Columns: {pivot.shape[1]}")
-    print(f"  Size: {output_file.stat().st_size / 1024:.1f} KB")
-
-    # 月別統計
-    month_cols = [col for col in pivot.columns if col not in ["学年", "教室", "講座名", "M/C", "担当"]]
-    if month_cols:
-        print(f"\nAnnual Summary:")
-        total = 0
-        for month in month_cols:
-            count = int(pivot[month].sum())
-            total += count
-            print(f"  {month}: {count:,}")
-        print(f"  Total: {total:,}")
-
     return 0
 
 
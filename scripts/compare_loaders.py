@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Excel 読み込み経路の比較スクリプト
+
+load_excel（列射影・ストリーミング）と load_excel_full（pd.read_excel 全列）の
+所要時間・ピークメモリ（RSS）・DataFrame サイズを比較し、集計結果の一致を確認します。
+計測を独立させるため、各経路は別プロセスで1回ずつ実行します。
+
+使用方法:
+  python scripts/compare_loaders.py lists/〔定例報告〕2025AC受講者ﾘｽﾄ_2504.xlsx
+"""
+
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# プロジェクトルートを sys.path に追加
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from services.aggregator import (
+    aggregate,
+    load_excel,
+    load_excel_full,
+    parse_target_month,
+)
+from services.metrics import peak_rss
+
+
+LOADERS = {"load_excel_full": load_excel_full, "load_excel": load_excel}
+
+
+def measure(name: str, file_path: Path):
+    """読み込み1回分の (集計結果, 秒, ピーク RSS 増分, DataFrame バイト数, 形状) を返す"""
+    rss_before = peak_rss()
+    start = time.perf_counter()
+    df = LOADERS[name](file_path)
+    elapsed = time.perf_counter() - start
+    rss_after = peak_rss()
+    peak = rss_after - rss_before if rss_before is not None else None
+    frame_bytes = int(df.memory_usage(deep=True).sum())
+    result = aggregate(df, parse_target_month(file_path.name))
+    return result, elapsed, peak, frame_bytes, df.shape
+
+
+def main():
+    """メイン処理"""
+    if len(sys.argv) != 2:
+        print("Usage: python scripts/compare_loaders.py <file.xlsx>")
+        return 1
+
+    file_path = Path(sys.argv[1])
+    if not file_path.exists():
+        print(f"Error: {file_path} が見つかりません")
+        return 1
+
+    print(f"File: {file_path.name} ({file_path.stat().st_size / 1024:.1f} KB)")
+    print("-" * 60)
+
+    results = {}
+    for name in LOADERS:
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            result, elapsed, peak, frame_bytes, shape = pool.submit(measure, name, file_path).result()
+        peak_str = f"{peak / 1024 ** 2:8.1f} MB" if peak is not None else "     n/a"
+        print(f"  {name:16s} {elapsed:7.2f} s  peak +{peak_str}  "
+              f"frame {frame_bytes / 1024 ** 2:8.1f} MB  ({shape[0]} x {shape[1]})")
+        results[name] = result
+
+    print("-" * 60)
+    full, projected = results["load_excel_full"], results["load_excel"]
+    same = full.reset_index(drop=True).equals(projected.reset_index(drop=True))
+    print(f"Aggregate match: {'OK' if same else 'MISMATCH'}")
+    return 0 if same else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
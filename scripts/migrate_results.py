@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+月別結果の形式変換スクリプト
+
+outputs/results/ の各年度ディレクトリ（FY2025 など）内の月別 CSV を .mcol（列指向バイナリ）に
+一括変換します。変換後に読み戻して内容が一致することを確認してから CSV を削除します。
+変換した年度のサマリー（.summary.json）は最後に作り直します（画面がピボットを組み立て直さないように）。
+--export-csv を指定すると、逆に全月を年度ごとの CSV として書き出します（.mcol は残す）。
+年度別に分ける前の配置（outputs/results 直下）の月別結果は、先に年度ディレクトリへ移します。
+
+使用方法:
+  python scripts/migrate_results.py
+  python scripts/migrate_results.py --keep-csv
+  python scripts/migrate_results.py --export-csv outputs/csv_export
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+# プロジェクトルートを sys.path に追加
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from services.aggregator import (
+    KEY_COLS,
+    RESULT_SUFFIXES,
+    fiscal_year_dir,
+    list_fiscal_years,
+    list_month_files,
+    partition_legacy_results,
+    read_month_frame,
+)
+from services.atomic_io import atomic_path, bump_generation, month_lock
+from services.colstore import write_table
+from services.summary import refresh_summary
+
+
+def migrate(results_dir: Path, keep_csv: bool) -> int:
+    """CSV → .mcol 変換。失敗件数を返す"""
+    csv_files = sorted(results_dir.glob(f"*{RESULT_SUFFIXES['csv']}"))
+    if not csv_files:
+        print(f"Warning: {results_dir} に CSV がありません")
+        return 0
+
+    failed = 0
+    for csv_path in csv_files:
+        col_path = csv_path.with_suffix(RESULT_SUFFIXES["col"])
+        csv_size = csv_path.stat().st_size
+        # 保存と同じく月ロックの下で一時ファイル経由で置き換え、世代番号を進める
+        # （稼働中のアプリが書きかけの .mcol を読まない）
+        with month_lock(results_dir, csv_path.stem):
+            frame = read_month_frame(csv_path)
+            if frame is None:
+                print(f"  Skipped: {csv_path.name} (no month column)")
+                continue
+            with atomic_path(col_path) as tmp:
+                write_table(frame, tmp, KEY_COLS)
+            try:
+                pd.testing.assert_frame_equal(read_month_frame(col_path), frame)
+            except AssertionError as e:
+                col_path.unlink()
+                bump_generation(results_dir)
+                print(f"  Error ({csv_path.name}): 読み戻し不一致 {e}")
+                failed += 1
+                continue
+            if not keep_csv:
+                csv_path.unlink()
+            bump_generation(results_dir)
+        print(f"  {csv_path.name} -> {col_path.name} "
+              f"({csv_size} -> {col_path.stat().st_size} bytes)")
+    return failed
+
+
+def export_csv(results_dir: Path, out_dir: Path) -> int:
+    """全月を CSV として書き出す。書き出し件数を返す"""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    exported = 0
+    for path in list_month_files(results_dir):
+        frame = read_month_frame(path)
+        if frame is None:
+            continue
+        frame.to_csv(out_dir / f"{path.stem}.csv", index=False, encoding="utf-8-sig")
+        print(f"  {path.name} -> {out_dir.name}/{path.stem}.csv")
+        exported += 1
+    return exported
+
+
+def year_dirs(results_dir: Path) -> list[Path]:
+    """年度ディレクトリ一覧（直下の月別結果は先に年度ディレクトリへ移す）"""
+    moved = partition_legacy_results(results_dir)
+    if moved:
+        print(f"  Moved into fiscal-year directories: {', '.join(moved)}")
+    return [fiscal_year_dir(results_dir, y) for y in list_fiscal_years(results_dir)]
+
+
+def main(argv=None):
+    """メイン処理"""
+    parser = argparse.ArgumentParser(description="月別結果の形式変換")
+    parser.add_argument("--results-dir", type=Path, default=project_root / "outputs" / "results")
+    parser.add_argument("--keep-csv", action="store_true", help="変換後も CSV を残す")
+    parser.add_argument("--export-csv", type=Path, metavar="DIR", help="全月を CSV で書き出す")
+    args = parser.parse_args(argv)
+
+    if not args.results_dir.exists():
+        print(f"Error: {args.results_dir} が見つかりません")
+        return 1
+
+    if args.export_csv:
+        exported = sum(export_csv(d, args.export_csv / d.name) for d in year_dirs(args.results_dir))
+        print(f"Exported: {exported} files")
+        return 0
+
+    failed = 0
+    for year_dir in year_dirs(args.results_dir):
+        failed += migrate(year_dir, args.keep_csv)
+        # 変換で世代番号が進み保存済みのサマリーは無効になるため、新しい世代で書き直す
+        summary = refresh_summary(year_dir)
+        print(f"  Summary ({year_dir.name}): {summary['total_rows']} rows")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,15 +3,30 @@
 
 Row 4をヘッダーとして読み込み、1ヶ月分を集計してCSV保存。
 build_pivot() で全月分をマージしてピボットを生成する。
+月別結果は年度ごとのディレクトリ（results_dir/FY2025 など、fiscal_year_dir）に分けて
+保存し、ピボットは年度ディレクトリ単位で作る（月列は「4月」～「3月」の12列）。
 """
 from __future__ import annotations
 
 import io
+import os
 import re
+from collections.abc import Iterable, Iterator
+from itertools import islice
+from operator import itemgetter
 from pathlib import Path
+from typing import BinaryIO
 
+import numpy as np
 import pandas as pd
 
+from services.atomic_io import atomic_path, bump_generation, month_lock
+from services.colstore import read_table, write_table
+from services.course_names import default_resolver, rules_tag
+from services.keycodec import KeyDictionary, shared_dictionary
+from services.result_store import ResultStore
+from services.xlsx_stream import iter_xlsx, write_xlsx
+
 # ── 列番号マッピング（0-indexed、Row 4がヘッダー） ──
 COLUMN_INDICES = {
     "add_date": 2,      # Column C: 受講追加日付
@@ -31,10 +46,38 @@ GRADE_LABELS = {31: "高1", 32: "高2", 33: "高3"}
 TARGET_GRADES = set(GRADE_LABELS.keys())
 
 KEY_COLS = ["学年", "教室", "講座名", "M/C", "担当"]
+# 件数キューブ（aggregate_cube）で KEY_COLS に加える軸 → load_excel の列名
+CUBE_DIMS = {"性別": "gender", "在籍校": "school", "学科": "department"}
+CUBE_COLS = KEY_COLS + list(CUBE_DIMS)
 MONTH_ORDER = ["4月", "5月", "6月", "7月", "8月", "9月",
                "10月", "11月", "12月", "1月", "2月", "3月"]
 
 RESULTS_DIR = Path("outputs/results")
+PARTITION_PREFIX = "FY"  # 年度ディレクトリ名の接頭辞（FY2025 = 2025年4月～2026年3月）
+_PARTITION_NAME = re.compile(rf"{PARTITION_PREFIX}(\d{{4}})")
+_MONTH_STEM = re.compile(r"\d{4}-\d{2}")
+
+# 集計ロジック（load_excel / aggregate）の版。結果が変わる変更時に上げると、
+# CLI の差分実行（services/manifest.py）で全ファイルが再集計される
+# COURSE_RULES_FILE で既定以外の講座名ルール表を使う場合は、その識別子が付く
+# 2: 月別結果と一緒に件数キューブ・ロールアップ（services/cube.py）を保存
+_RULES_TAG = rules_tag(default_resolver().rules)
+AGGREGATOR_VERSION = "2" + (f"+{_RULES_TAG}" if _RULES_TAG else "")
+
+# 月別結果の保存形式: "csv"（UTF-8-SIG CSV）/ "col"（.mcol 列指向バイナリ）/
+# "sqlite"（results_dir/results.sqlite3 の1テーブル、services/result_store.py）
+RESULT_SUFFIXES = {"col": ".mcol", "csv": ".csv"}
+RESULTS_DB = "results.sqlite3"
+RESULT_FORMATS = (*RESULT_SUFFIXES, "sqlite")
+RESULTS_FORMAT = os.environ.get("RESULTS_FORMAT", "csv")
+STORE_INDEXED = ("学年", "教室", "担当")
+
+HEADER_ROW = 3  # 0-indexed（Excel 上の Row 4）
+BATCH_ROWS = 50_000  # iter_excel_batches の既定のバッチ行数
+
+# load_excel が返す列の型区分
+_DATE_FIELDS = ("add_date", "cancel_date")
+_GRADE_FIELD = "grade"
 
 
 def parse_target_month(filename: str) -> pd.Period | None:
@@ -50,17 +93,133 @@ def parse_target_month(filename: str) -> pd.Period | None:
     return pd.Period(f"{year}-{month:02d}", freq="M")
 
 
-def load_excel(file: bytes | Path) -> pd.DataFrame:
+def fiscal_year_of(target_month: pd.Period) -> int:
+    """対象月の年度（4月始まり）。parse_target_month のファイル名の YY と同じ"""
+    return target_month.year if target_month.month >= 4 else target_month.year - 1
+
+
+def fiscal_year_dir(results_dir: Path, fiscal_year: int) -> Path:
+    """年度の月別結果を置くディレクトリ（例: results_dir/FY2025）"""
+    return results_dir / f"{PARTITION_PREFIX}{fiscal_year}"
+
+
+def month_partition(results_dir: Path, target_month: pd.Period) -> Path:
+    """target_month の月別結果を置く年度ディレクトリ"""
+    return fiscal_year_dir(results_dir, fiscal_year_of(target_month))
+
+
+def list_fiscal_years(results_dir: Path = RESULTS_DIR) -> list[int]:
+    """月別結果のある年度（昇順）。各年度ディレクトリの中身は読み込まない"""
+    years = []
+    for path in results_dir.glob(f"{PARTITION_PREFIX}*"):
+        m = _PARTITION_NAME.fullmatch(path.name)
+        if m and path.is_dir() and (list_month_files(path) or (path / RESULTS_DB).exists()):
+            years.append(int(m.group(1)))
+    return sorted(years)
+
+
+def load_excel(file: bytes | Path | BinaryIO) -> pd.DataFrame:
+    """COLUMN_INDICES の列だけを read-only ストリーミングで読み込む
+
+    file は bytes・パス・シーク可能なファイルオブジェクトのいずれか。列名は COLUMN_INDICES のキー。日付は datetime64、学年は Int16、
+    その他の文字列列は category で返す。
+    """
+    return _typed_frame(list(_iter_picked_rows(file)))
+
+
+def iter_excel_batches(file: bytes | Path | BinaryIO,
+                       batch_rows: int = BATCH_ROWS) -> Iterator[pd.DataFrame]:
+    """load_excel と同じ列・型の DataFrame を batch_rows 行ずつ返す
+
+    シートは行単位で読み進めるため、保持するのは1バッチ分の行だけ。
+    """
+    if batch_rows <= 0:
+        raise ValueError(f"batch_rows は 1 以上を指定してください: {batch_rows}")
+    rows = _iter_picked_rows(file)
+    try:
+        while batch := list(islice(rows, batch_rows)):
+            yield _typed_frame(batch)
+    finally:
+        rows.close()
+
+
+def _iter_picked_rows(file: bytes | Path | BinaryIO) -> Iterator[tuple]:
+    """データ行から COLUMN_INDICES の列だけを取り出したタプルを順に返す（空行は除く）"""
+    # openpyxl の import は重いため、Excel を読むときまで遅らせる
+    from openpyxl import load_workbook
+
     src = io.BytesIO(file) if isinstance(file, bytes) else file
-    return pd.read_excel(src, header=3)
+    pick = itemgetter(*COLUMN_INDICES.values())
+    max_col = max(COLUMN_INDICES.values()) + 1
+
+    wb = load_workbook(src, read_only=True, data_only=True)
+    try:
+        ws = wb.active
+        # 保存元によっては dimension が不正確なため、実データ末尾まで読む
+        ws.reset_dimensions()
+        for picked in map(pick, ws.iter_rows(min_row=HEADER_ROW + 2,
+                                             max_col=max_col, values_only=True)):
+            if any(v is not None for v in picked):
+                yield picked
+    finally:
+        wb.close()
+
+
+def _typed_frame(rows: list[tuple]) -> pd.DataFrame:
+    fields = list(COLUMN_INDICES)
+    values = list(zip(*rows)) if rows else [()] * len(fields)
+    return pd.DataFrame({f: _typed_column(f, v) for f, v in zip(fields, values)})
+
+
+def load_excel_full(file: bytes | Path | BinaryIO) -> pd.DataFrame:
+    """全列を pd.read_excel で読み込む従来の経路（比較・検証用）"""
+    src = io.BytesIO(file) if isinstance(file, bytes) else file
+    return pd.read_excel(src, header=HEADER_ROW)
+
+
+def _typed_column(field: str, values: tuple) -> pd.Series:
+    """セル値の列を型付き Series に変換"""
+    raw = pd.Series(values, dtype=object)
+    if field in _DATE_FIELDS:
+        return pd.to_datetime(raw, errors="coerce", format="mixed")
+    if field == _GRADE_FIELD:
+        num = pd.to_numeric(raw, errors="coerce")
+        num = num.where(num.between(-32768, 32767) & (num % 1 == 0))
+        return num.astype("Int16")
+    # pd.read_excel と同じく整数値の float は int として扱う
+    raw = raw.map(lambda v: int(v) if isinstance(v, float) and v.is_integer() else v)
+    return raw.astype("category")
+
+
+def _field(df: pd.DataFrame, name: str) -> pd.Series:
+    """load_excel の名前付き列を優先し、なければ列位置で取得"""
+    if name in df.columns:
+        return df[name]
+    return df.iloc[:, COLUMN_INDICES[name]]
+
+
+def _plain(s: pd.Series) -> pd.Series:
+    """category 列を object 列に戻す（文字列処理・groupby 用）"""
+    return s.astype(object) if isinstance(s.dtype, pd.CategoricalDtype) else s
 
 
 def aggregate(df: pd.DataFrame, target_month: pd.Period | None = None) -> pd.DataFrame:
     """対象月1ヶ月分の受講人数を集計（全操作ベクトル化）"""
-    idx = COLUMN_INDICES
+    return _aggregate(df, target_month, KEY_COLS)
+
+
+def aggregate_cube(df: pd.DataFrame, target_month: pd.Period | None = None) -> pd.DataFrame:
+    """aggregate() のキー列に性別・在籍校・学科（CUBE_DIMS）を加えた件数キューブ
+
+    rollup(cube, KEY_COLS) は aggregate() と同一。
+    """
+    return _aggregate(df, target_month, CUBE_COLS)
 
-    add_date = pd.to_datetime(df.iloc[:, idx["add_date"]], errors="coerce", format="mixed")
-    cancel_date = pd.to_datetime(df.iloc[:, idx["cancel_date"]], errors="coerce", format="mixed")
+
+def _aggregate(df: pd.DataFrame, target_month: pd.Period | None,
+               columns: list[str]) -> pd.DataFrame:
+    add_date = pd.to_datetime(_field(df, "add_date"), errors="coerce", format="mixed")
+    cancel_date = pd.to_datetime(_field(df, "cancel_date"), errors="coerce", format="mixed")
 
     if add_date.dropna().empty:
         return pd.DataFrame()
@@ -68,90 +227,450 @@ def aggregate(df: pd.DataFrame, target_month: pd.Period | None = None) -> pd.Dat
     if target_month is None:
         target_month = add_date.dropna().max().to_period("M") + 1
 
-    # 基準日 = target_month の前月末
-    cutoff = (target_month - 1).to_timestamp(freq="M")
+    cutoff = _cutoff_of(target_month)
     month_label = f"{target_month.month}月"
 
     # アクティブ行フィルタ
     active = (add_date <= cutoff) & (cancel_date.isna() | (cancel_date > cutoff))
-    if not active.any():
+    group_df = _key_frame(df, active, columns[len(KEY_COLS):])
+    if group_df is None:
+        return pd.DataFrame()
+
+    # 整数コードでグループ化し、ラベルはグループ分だけ復元
+    dictionary = shared_dictionary(columns)
+    inverse, keys = dictionary.unique_rows(dictionary.encode(group_df), sort=True)
+    result = dictionary.decode(keys, group_df.dtypes.to_dict())
+    result[month_label] = np.bincount(inverse, minlength=len(keys)).astype(np.int64)
+    return result
+
+
+def aggregate_range(df: pd.DataFrame, months: Iterable[pd.Period]) -> pd.DataFrame:
+    """1つの名簿から複数月の受講人数を1パスで集計し、ピボットで返す
+
+    結果は months の各月で aggregate() を呼び、空でないものを
+    combine_month_frames() で合算したものと同一。
+    学年・担当フィルタとキー構築は1回だけ行い、各行の「追加日以降・取消日まで」を
+    基準日配列上の区間（searchsorted）として、キーごとの累積和で全月の件数を求める。
+    """
+    months = list(months)
+    df = df.reset_index(drop=True)
+    add_date = pd.to_datetime(_field(df, "add_date"), errors="coerce", format="mixed")
+    cancel_date = pd.to_datetime(_field(df, "cancel_date"), errors="coerce", format="mixed")
+    if not months or add_date.dropna().empty:
+        return pd.DataFrame()
+
+    group_df = _key_frame(df, add_date.notna())
+    if group_df is None:
+        return pd.DataFrame()
+    dictionary = shared_dictionary(KEY_COLS)
+    groups, keys = dictionary.unique_rows(dictionary.encode(group_df), sort=True)
+
+    # 基準日（昇順・重複なし）上で、各行が数えられる区間 [start, stop)
+    cutoffs = pd.DatetimeIndex(sorted({_cutoff_of(m) for m in months})).as_unit("ns")
+    n = len(cutoffs)
+    added = add_date.loc[group_df.index].to_numpy(dtype="datetime64[ns]")
+    cancelled = cancel_date.loc[group_df.index].to_numpy(dtype="datetime64[ns]")
+    start = cutoffs.searchsorted(added, side="left")
+    stop = np.where(np.isnat(cancelled), n, cutoffs.searchsorted(cancelled, side="left"))
+    stop = np.maximum(stop, start)
+
+    # キー × 基準日の差分配列（開始で +1、終了で -1）を累積
+    width = n + 1
+    diff = (np.bincount(groups * width + start, minlength=len(keys) * width)
+            - np.bincount(groups * width + stop, minlength=len(keys) * width))
+    counts = diff.reshape(len(keys), width)[:, :n].cumsum(axis=1)
+
+    # 月列名ごとに合算（年度をまたいで同じ「4月」が複数あれば合計）
+    labels = [f"{m.month}月" for m in months]
+    available = [c for c in MONTH_ORDER if c in labels]
+    values = np.zeros((len(keys), len(available)), dtype=np.int64)
+    for month, label in zip(months, labels):
+        if label in available:
+            values[:, available.index(label)] += counts[:, cutoffs.get_loc(_cutoff_of(month))]
+    # 在籍者のいない月は aggregate() が空を返し合算に現れないため、列ごと落とす
+    filled = values.any(axis=0)
+    available = [label for label, keep in zip(available, filled) if keep]
+    values = values[:, filled]
+    present = values.any(axis=1)
+    if not present.any():
         return pd.DataFrame()
+    rows, month_index = np.nonzero(values[present])
+    return pivot_from_codes(keys[present], available, rows, month_index,
+                            values[present][rows, month_index], dictionary)
+
+
+def aggregate_batches(batches: Iterable[pd.DataFrame], target_month: pd.Period,
+                      columns: list[str] = KEY_COLS) -> pd.DataFrame:
+    """行バッチごとに aggregate() と同じフィルタを掛け、部分的な件数を合算して集計
+
+    結果は全バッチを連結して aggregate() したもの（columns=CUBE_COLS なら
+    aggregate_cube()）と同一。保持するのはそれまでに現れたキーの組と件数だけで、
+    メモリは行数ではなくキーの種類数に比例する。
+    既定の対象月は全行の追加日を見ないと決まらないため、target_month は必須。
+    """
+    cutoff = _cutoff_of(target_month)
+    dictionary = shared_dictionary(columns)
+    keys = np.zeros((0, len(columns)), dtype=np.int32)
+    counts = np.zeros(0, dtype=np.int64)
+    dtypes = None
+
+    for batch in batches:
+        add_date = pd.to_datetime(_field(batch, "add_date"), errors="coerce", format="mixed")
+        cancel_date = pd.to_datetime(_field(batch, "cancel_date"), errors="coerce", format="mixed")
+        active = (add_date <= cutoff) & (cancel_date.isna() | (cancel_date > cutoff))
+        group_df = _key_frame(batch, active, columns[len(KEY_COLS):])
+        if group_df is None:
+            continue
+        dtypes = dtypes or group_df.dtypes.to_dict()
+        # これまでの部分集計とこのバッチの行をまとめてキーごとに数え直す
+        codes = np.concatenate([keys, dictionary.encode(group_df)])
+        weights = np.concatenate([counts, np.ones(len(group_df), dtype=np.int64)])
+        inverse, keys = dictionary.unique_rows(codes)
+        counts = np.bincount(inverse, weights=weights, minlength=len(keys)).astype(np.int64)
+
+    if dtypes is None:
+        return pd.DataFrame()
+    inverse, keys = dictionary.unique_rows(keys, sort=True)
+    result = dictionary.decode(keys, dtypes)
+    result[f"{target_month.month}月"] = np.bincount(
+        inverse, weights=counts, minlength=len(keys)).astype(np.int64)
+    return result
+
+
+def rollup(cube: pd.DataFrame, columns: list[str]) -> pd.DataFrame:
+    """キューブ（aggregate_cube の結果）を columns ごとに合算
+
+    行順・キー列の型は aggregate() と同じ規則（ラベル順、欠損は最後）。件数列はそのまま合算する。
+    """
+    if cube.empty:
+        return pd.DataFrame()
+    counts = [c for c in cube.columns if c not in CUBE_COLS]
+    dictionary = shared_dictionary(columns)
+    inverse, keys = dictionary.unique_rows(dictionary.encode(cube), sort=True)
+    result = dictionary.decode(keys, cube.dtypes[columns].to_dict())
+    for c in counts:
+        result[c] = np.bincount(inverse, weights=cube[c].to_numpy(),
+                                minlength=len(keys)).astype(np.int64)
+    return result
+
+
+def _cutoff_of(target_month: pd.Period) -> pd.Timestamp:
+    """基準日 = target_month の前月末"""
+    return (target_month - 1).to_timestamp(freq="M")
 
+
+def _key_frame(df: pd.DataFrame, rows: pd.Series,
+               dims: Iterable[str] = ()) -> pd.DataFrame | None:
+    """rows の行に学年・担当フィルタを掛け、KEY_COLS（+ CUBE_DIMS の dims）のグループ化用
+    DataFrame を返す
+
+    対象行がなければ None。index は df の index を引き継ぐ。
+    """
     # 学年フィルタ
-    grade = df.iloc[:, idx["grade"]]
-    mask = active & grade.isin(TARGET_GRADES)
+    grade = _field(df, "grade")
+    mask = rows & grade.isin(TARGET_GRADES)
     if not mask.any():
-        return pd.DataFrame()
+        return None
 
     sub = df.loc[mask]
 
     # 担当フィルタ：「0」「-」「」を除外
-    teacher = sub.iloc[:, idx["teacher"]].fillna("").astype(str).str.strip()
+    teacher = _stripped(_field(sub, "teacher"))
     teacher_mask = ~teacher.isin(["0", "-", ""])
     if not teacher_mask.any():
-        return pd.DataFrame()
+        return None
     sub = sub[teacher_mask]
 
-    # 講座名解決（ベクトル化）
-    course = sub.iloc[:, idx["course"]].astype(str).str.strip()
-    class_type = sub.iloc[:, idx["class_type"]]
-    class_str = class_type.fillna("").astype(str).str.strip()
-    needs_suffix = course.str.contains("ｱﾄﾞﾊﾞﾝｽ|ﾊｲﾚﾍﾞﾙ", na=False) & class_str.ne("")
-    resolved_course = course.where(~needs_suffix, course + class_str)
+    # 講座名解決（(講座名, M/C) の組ごとに1回）
+    class_type = _field(sub, "class_type")
+    resolved_course = default_resolver().resolve(_field(sub, "course"), class_type)
 
     # グループ化用 DataFrame を一括構築
-    group_df = pd.DataFrame({
-        "学年": sub.iloc[:, idx["grade"]].map(GRADE_LABELS),
-        "教室": sub.iloc[:, idx["classroom"]],
+    return pd.DataFrame({
+        "学年": _field(sub, "grade").map(GRADE_LABELS),
+        "教室": _plain(_field(sub, "classroom")),
         "講座名": resolved_course,
-        "M/C": class_str.values,
+        "M/C": _stripped(class_type).values,
         "担当": teacher.loc[teacher_mask],
+        **{dim: _plain(_field(sub, CUBE_DIMS[dim])) for dim in dims},
     })
 
-    result = group_df.groupby(KEY_COLS, dropna=False).size().reset_index(name=month_label)
-    return result
+
+def _stripped(s: pd.Series) -> pd.Series:
+    """前後空白を除いた文字列列（欠損は空文字）。変換は値の種類ごとに1回"""
+    codes, uniques = pd.factorize(s, use_na_sentinel=False)
+    table = np.array(["" if pd.isna(v) else str(v).strip() for v in uniques], dtype=object)
+    return pd.Series(table[codes], index=s.index, dtype="str")
 
 
 def save_monthly_result(df: pd.DataFrame, target_month: pd.Period,
-                        results_dir: Path = RESULTS_DIR) -> None:
-    """1ヶ月分の集計結果を CSV に保存"""
+                        results_dir: Path = RESULTS_DIR, fmt: str | None = None) -> Path:
+    """1ヶ月分の集計結果を保存し、保存先を返す（fmt 省略時は RESULTS_FORMAT）
+
+    同じ月の別形式の結果は二重計上を避けるため削除する。ファイルは一時ファイルに書いて
+    fsync してから置き換えるため、並行して読む側に書きかけのファイルは見えない。
+    同じ月の保存は月ごとのロックで直列化し（プロセス間も）、完了後に世代番号を進める。
+    キューブ・ソース記録も同じロックの中で書く場合は services/month_writer.py の save_month() を使う。
+    """
     results_dir.mkdir(parents=True, exist_ok=True)
-    df.to_csv(results_dir / f"{target_month}.csv", index=False, encoding="utf-8-sig")
+    with month_lock(results_dir, str(target_month)):
+        path = write_monthly_result(df, target_month, results_dir, fmt)
+        bump_generation(results_dir)
+    return path
+
+
+def write_monthly_result(df: pd.DataFrame, target_month: pd.Period,
+                         results_dir: Path = RESULTS_DIR, fmt: str | None = None) -> Path:
+    """save_monthly_result() の書き込み部分。呼び出し側が month_lock を持ち、世代番号を進める"""
+    fmt = fmt or RESULTS_FORMAT
+    if fmt not in RESULT_FORMATS:
+        raise ValueError(f"未対応の保存形式: {fmt}（{', '.join(RESULT_FORMATS)}）")
+    results_dir.mkdir(parents=True, exist_ok=True)
+    month = str(target_month)
+    if fmt == "sqlite":
+        store = result_store(results_dir)
+        store.replace_month(df, month)
+        path = store.path
+    else:
+        path = results_dir / f"{month}{RESULT_SUFFIXES[fmt]}"
+        with atomic_path(path) as tmp:
+            if fmt == "col":
+                write_table(df, tmp, KEY_COLS)
+            else:
+                df.to_csv(tmp, index=False, encoding="utf-8-sig")
+        if (results_dir / RESULTS_DB).exists():
+            result_store(results_dir).delete_months([month])
+    for other in RESULT_SUFFIXES.values():
+        if other != path.suffix:
+            (results_dir / f"{month}{other}").unlink(missing_ok=True)
+    return path
+
+
+_stores: dict[Path, ResultStore] = {}
+
+
+def result_store(results_dir: Path = RESULTS_DIR) -> ResultStore:
+    """results_dir の SQLite ストア（初回の書き込み・読み出しでファイルを作る）"""
+    key = results_dir.resolve()
+    store = _stores.get(key)
+    if store is None:
+        store = _stores.setdefault(key, ResultStore(results_dir / RESULTS_DB, KEY_COLS, STORE_INDEXED))
+    return store
+
+
+def store_version(results_dir: Path = RESULTS_DIR) -> str | None:
+    """SQLite ストアの内容の版。ストアがなければ None"""
+    if not (results_dir / RESULTS_DB).exists():
+        return None
+    return result_store(results_dir).version()
+
+
+def store_only(results_dir: Path = RESULTS_DIR) -> bool:
+    """results_dir の月別結果が SQLite ストアだけにあるか（月別ファイルがない）"""
+    return (results_dir / RESULTS_DB).exists() and not list_month_files(results_dir)
+
+
+def has_month_result(results_dir: Path, month: str) -> bool:
+    """month の月別結果がいずれかの形式で保存されているか"""
+    if any((results_dir / f"{month}{suffix}").exists() for suffix in RESULT_SUFFIXES.values()):
+        return True
+    return (results_dir / RESULTS_DB).exists() and month in result_store(results_dir).months()
+
+
+def list_month_files(results_dir: Path = RESULTS_DIR) -> list[Path]:
+    """月別結果ファイル一覧。同じ月に両形式がある場合は .mcol を優先"""
+    by_stem: dict[str, Path] = {}
+    for suffix in RESULT_SUFFIXES.values():
+        for f in results_dir.glob(f"*{suffix}"):
+            by_stem.setdefault(f.stem, f)
+    return sorted(by_stem.values())
+
+
+def partition_legacy_results(results_dir: Path = RESULTS_DIR) -> list[str]:
+    """results_dir 直下の月別結果（年度別に分ける前の配置）を年度ディレクトリへ移し、移した月を返す
+
+    ファイルはそのまま移動し、SQLite ストアの月は移動先のストアに書き直す。移動先に
+    同じ月の結果が既にあればそちらを新しいものとして残し、直下の結果は捨てる。
+    """
+    moved = []
+    for suffix in RESULT_SUFFIXES.values():
+        for path in sorted(results_dir.glob(f"*{suffix}")):
+            if not _MONTH_STEM.fullmatch(path.stem):
+                continue
+            month = pd.Period(path.stem, freq="M")
+            partition = month_partition(results_dir, month)
+            partition.mkdir(parents=True, exist_ok=True)
+            with month_lock(partition, path.stem):
+                if has_month_result(partition, path.stem):
+                    path.unlink()
+                    continue
+                os.replace(path, partition / path.name)
+                bump_generation(partition)
+            moved.append(path.stem)
+
+    if (results_dir / RESULTS_DB).exists():
+        store = result_store(results_dir)
+        for month in store.months():
+            frame = store.month_frame(month)
+            partition = month_partition(results_dir, pd.Period(month, freq="M"))
+            if frame is not None and not has_month_result(partition, month):
+                save_monthly_result(frame, pd.Period(month, freq="M"), partition, fmt="sqlite")
+                moved.append(month)
+        _stores.pop(results_dir.resolve(), None)
+        for name in (RESULTS_DB, f"{RESULTS_DB}-wal", f"{RESULTS_DB}-shm"):
+            (results_dir / name).unlink(missing_ok=True)
+    return moved
 
 
 def build_pivot(results_dir: Path = RESULTS_DIR) -> pd.DataFrame:
-    """保存済みの全月CSVを読み込み、concat + groupby でピボット生成"""
-    files = list(results_dir.glob("*.csv"))
-    if not files:
-        return pd.DataFrame()
+    """保存済みの全月の結果を読み込み、キーを整数コード化して合算しピボット生成"""
+    dictionary = shared_dictionary(KEY_COLS)
+    parts = [part for f in list_month_files(results_dir)
+             if (part := read_month_codes(f, dictionary)) is not None]
+    if (results_dir / RESULTS_DB).exists():
+        parts += read_store_codes(result_store(results_dir), dictionary)
+    return pivot_from_months(parts, dictionary)
+
+
+def read_month_frame(path: Path) -> pd.DataFrame | None:
+    """月別ファイルを1つ読み込む（キー列は文字列、月列は int）。月列がなければ None"""
+    if path.suffix == RESULT_SUFFIXES["col"]:
+        mdf = read_table(path)
+        for c in KEY_COLS:
+            if c in mdf.columns:
+                mdf[c] = mdf[c].astype(str)
+    else:
+        mdf = pd.read_csv(path, dtype=str)
+    month_cols = [c for c in mdf.columns if c not in KEY_COLS]
+    if not month_cols:
+        return None
+    col = month_cols[0]
+    mdf[col] = pd.to_numeric(mdf[col], errors="coerce").fillna(0).astype(int)
+    return mdf
+
+
+def read_month_codes(path: Path, dictionary: KeyDictionary
+                     ) -> tuple[str, np.ndarray, np.ndarray] | None:
+    """月別ファイルを (月列名, キーのコード行, 件数) として読む。月列がなければ None
+
+    キー列は category のまま辞書に通すため、行ごとの文字列を作らない。
+    """
+    if path.suffix == RESULT_SUFFIXES["col"]:
+        mdf = read_table(path)
+    else:
+        mdf = pd.read_csv(path, dtype={c: "category" for c in KEY_COLS})
+    month_cols = [c for c in mdf.columns if c not in KEY_COLS]
+    if not month_cols:
+        return None
+    label = month_cols[0]
+    counts = pd.to_numeric(mdf[label], errors="coerce").fillna(0).astype(np.int64).to_numpy()
+    return label, dictionary.encode(mdf), counts
 
-    frames = []
-    for f in files:
-        mdf = pd.read_csv(f, dtype=str)
-        month_cols = [c for c in mdf.columns if c not in KEY_COLS]
-        if not month_cols:
-            continue
-        col = month_cols[0]
-        mdf[col] = pd.to_numeric(mdf[col], errors="coerce").fillna(0).astype(int)
-        frames.append(mdf)
 
+def read_store_codes(store: ResultStore, dictionary: KeyDictionary,
+                     filters: dict[str, list[str]] | None = None
+                     ) -> list[tuple[str, np.ndarray, np.ndarray]]:
+    """SQLite ストアを月ラベルごとに SQL で合算し、(月列名, コード行, 件数) の並びにする
+
+    キーの組はキー表から1回だけ辞書に通し、件数はキー ID で引く。
+    """
+    ids, labels, counts = store.cells(filters)
+    if not len(ids):
+        return []
+    keys = store.keys(filters)
+    codes = dictionary.encode(keys[KEY_COLS])[keys.index.get_indexer(ids)]
+    return [(label, codes[labels == label], counts[labels == label])
+            for label in pd.unique(labels)]
+
+
+def query_store(filters: dict[str, list[str]] | None = None,
+                results_dir: Path = RESULTS_DIR) -> pd.DataFrame:
+    """SQLite ストアだけを対象に、filters に合う行のピボットを SQL の集計から作る"""
+    dictionary = shared_dictionary(KEY_COLS)
+    return pivot_from_months(read_store_codes(result_store(results_dir), dictionary, filters),
+                             dictionary)
+
+
+def combine_month_frames(frames: list[pd.DataFrame]) -> pd.DataFrame:
+    """月別フレームを KEY_COLS で合算し、MONTH_ORDER 順のピボットにする"""
     if not frames:
         return pd.DataFrame()
 
     merged = pd.concat(frames, ignore_index=True)
-
-    # 各月列を集約（同一キーが複数CSVに跨る場合の安全策）
     available = [c for c in MONTH_ORDER if c in merged.columns]
-    for col in available:
-        merged[col] = pd.to_numeric(merged[col], errors="coerce").fillna(0).astype(int)
 
-    result = merged.groupby(KEY_COLS, dropna=False)[available].sum().reset_index()
-    result = result[KEY_COLS + available]
+    # 月列を (行, 月, 件数) の長形式に。0 件のセルは持たない
+    rows, months, counts = [], [], []
+    for j, col in enumerate(available):
+        v = pd.to_numeric(merged[col], errors="coerce").fillna(0).to_numpy(dtype=np.int64)
+        nz = np.flatnonzero(v)
+        rows.append(nz)
+        months.append(np.full(len(nz), j))
+        counts.append(v[nz])
+
+    dictionary = shared_dictionary(KEY_COLS)
+    return pivot_from_codes(dictionary.encode(merged), available,
+                            *_concat_cells(rows, months, counts), dictionary)
+
+
+def pivot_from_months(parts: list[tuple[str, np.ndarray, np.ndarray]],
+                      dictionary: KeyDictionary | None = None) -> pd.DataFrame:
+    """(月列名, コード行, 件数) の並びからピボットを作る。combine_month_frames と同じ結果"""
+    if not parts:
+        return pd.DataFrame()
+    labels = {label for label, _, _ in parts}
+    available = [c for c in MONTH_ORDER if c in labels]
+
+    rows, months, counts = [], [], []
+    start = 0
+    for label, _, part_counts in parts:
+        if label in available:
+            rows.append(np.arange(start, start + len(part_counts)))
+            months.append(np.full(len(part_counts), available.index(label)))
+            counts.append(part_counts)
+        start += len(part_counts)
+    codes = np.concatenate([codes for _, codes, _ in parts])
+    return pivot_from_codes(codes, available, *_concat_cells(rows, months, counts), dictionary)
+
+
+def _concat_cells(rows: list, months: list, counts: list) -> tuple[np.ndarray, ...]:
+    if not rows:
+        return (np.zeros(0, dtype=np.int64),) * 3
+    return np.concatenate(rows), np.concatenate(months), np.concatenate(counts)
+
+
+def pivot_from_codes(codes: np.ndarray, months: list[str], rows: np.ndarray,
+                     month_index: np.ndarray, counts: np.ndarray,
+                     dictionary: KeyDictionary | None = None) -> pd.DataFrame:
+    """キーのコード行と (行, 月, 件数) のセルからピボットを作る
+
+    合算は整数コード上で行い、ラベルはグループ分だけ復元する。
+    キー列は文字列、行は groupby(KEY_COLS, dropna=False) と同じ順に並ぶ。
+    """
+    dictionary = dictionary or shared_dictionary(KEY_COLS)
+    inverse, keys = dictionary.unique_rows(codes, sort=True)
+    width = len(months)
+    # 件数の合計は 2**53 未満なので float の bincount で誤差なく求まる
+    sums = np.bincount(inverse[rows] * width + month_index, weights=counts,
+                       minlength=len(keys) * width).astype(np.int64).reshape(len(keys), width)
+    result = dictionary.decode(keys, "str")
+    for j, col in enumerate(months):
+        result[col] = sums[:, j]
     return result
 
 
+SHEET_NAME = "月次受講人数"
+
+
 def to_excel_bytes(result: pd.DataFrame) -> bytes:
-    buf = io.BytesIO()
-    with pd.ExcelWriter(buf, engine="openpyxl") as writer:
-        result.to_excel(writer, index=False, sheet_name="月次受講人数")
-    return buf.getvalue()
+    return b"".join(iter_excel_chunks(result))
+
+
+def iter_excel_chunks(result: pd.DataFrame) -> Iterator[bytes]:
+    """ピボットを XLSX としてチャンク単位で生成（StreamingResponse 用）"""
+    return iter_xlsx(result, SHEET_NAME)
+
+
+def write_excel(result: pd.DataFrame, path: Path) -> None:
+    """ピボットを XLSX ファイルに直接書き出す"""
+    write_xlsx(result, path, SHEET_NAME)
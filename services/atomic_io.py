@@ -0,0 +1,108 @@
+"""
+月別結果の原子的な書き込み
+
+- atomic_path: 一時ファイルに書いてから fsync し、rename で置き換える。読み手には
+  書き込み前か書き込み後のファイルしか見えない（途中で切れたファイルは見えない）。
+- month_lock: 月ごとのロック。同じプロセスのスレッド間は threading.Lock、プロセス間は
+  results_dir/.locks/{月}.lock の flock（fcntl がない環境ではプロセス内のみ）。
+- 世代番号: 月別結果を保存するたびに results_dir/.generation を1増やす。読み手は
+  読み込みの前後で値を比べ、途中で書き込みがあったかを判定できる。
+"""
+from __future__ import annotations
+
+import os
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+GENERATION_FILENAME = ".generation"
+LOCK_DIRNAME = ".locks"
+
+_thread_locks: dict[Path, threading.Lock] = {}
+_thread_locks_guard = threading.Lock()
+
+
+def _fsync_dir(path: Path) -> None:
+    """rename 自体を永続化するためディレクトリを fsync（できない環境では何もしない）"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def atomic_path(path: Path) -> Iterator[Path]:
+    """path の代わりに書き込む一時ファイルのパスを返し、ブロックを抜けたら置き換える
+
+    一時ファイルは同じディレクトリの "." 始まり・".tmp" 終わりの名前で、月別結果の
+    glob には一致しない。ブロック内で例外が出た場合は一時ファイルを消して元のファイルを残す。
+    """
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        yield tmp
+        with tmp.open("rb+") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    _fsync_dir(path.parent)
+
+
+def _thread_lock(path: Path) -> threading.Lock:
+    with _thread_locks_guard:
+        lock = _thread_locks.get(path)
+        if lock is None:
+            lock = _thread_locks[path] = threading.Lock()
+        return lock
+
+
+@contextmanager
+def file_lock(path: Path) -> Iterator[None]:
+    """path をロックファイルとする排他ロック（スレッド間・プロセス間）"""
+    path = path.resolve()
+    with _thread_lock(path):
+        if fcntl is None:
+            yield
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("a") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def month_lock(results_dir: Path, month: str):
+    """month の月別結果を書き換える間のロック"""
+    return file_lock(results_dir / LOCK_DIRNAME / f"{month}.lock")
+
+
+def read_generation(results_dir: Path) -> int:
+    """月別結果の世代番号。一度も保存していなければ 0"""
+    try:
+        return int((results_dir / GENERATION_FILENAME).read_text(encoding="ascii"))
+    except (OSError, ValueError):
+        return 0
+
+
+def bump_generation(results_dir: Path) -> int:
+    """世代番号を1増やして新しい値を返す"""
+    with file_lock(results_dir / LOCK_DIRNAME / f"{GENERATION_FILENAME}.lock"):
+        generation = read_generation(results_dir) + 1
+        with atomic_path(results_dir / GENERATION_FILENAME) as tmp:
+            tmp.write_text(str(generation), encoding="ascii")
+        return generation
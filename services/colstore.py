@@ -0,0 +1,99 @@
+"""
+月別結果のバイナリ列指向フォーマット（.mcol）
+
+レイアウト:
+  MAGIC (8 bytes) | ヘッダー長 (uint64 LE) | ヘッダー JSON | パディング | 列データ
+
+ヘッダー JSON にスキーマ（列名・種別・dtype・オフセット・辞書）を格納する。
+キー列は辞書エンコード（int32 コード、欠損は -1）、件数列は int32。
+列データは 8 バイト境界に並べ、読み込みは np.memmap 上のビューで行うため
+テキストの解析は発生しない。
+"""
+from __future__ import annotations
+
+import json
+import struct
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+MAGIC = b"MNACOL1\n"
+FORMAT_VERSION = 1
+_ALIGN = 8
+_LEN = struct.Struct("<Q")
+_DTYPE = "<i4"
+
+
+def _align(n: int) -> int:
+    return (n + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def _normalize_keys(s: pd.Series) -> pd.Series:
+    """CSV 経由と同じ意味になるよう、キー値を文字列化し空文字を欠損にする"""
+    s = s.astype(object)
+    s = s.where(s.notna(), None).map(lambda v: None if v is None else str(v))
+    return s.where(s.ne(""), None)
+
+
+def write_table(df: pd.DataFrame, path: Path, key_cols: list[str]) -> None:
+    """key_cols を辞書エンコード、それ以外を int32 件数列として書き込む"""
+    columns = []
+    blocks = []
+    offset = 0
+    for name in df.columns:
+        if name in key_cols:
+            codes, uniques = pd.factorize(_normalize_keys(df[name]), use_na_sentinel=True)
+            arr = codes.astype(_DTYPE)
+            meta = {"name": name, "kind": "dict", "categories": [str(u) for u in uniques]}
+        else:
+            counts = pd.to_numeric(df[name], errors="coerce").fillna(0)
+            arr = counts.to_numpy().astype(_DTYPE)
+            meta = {"name": name, "kind": "count"}
+        meta.update(dtype=_DTYPE, offset=offset)
+        columns.append(meta)
+        data = arr.tobytes()
+        blocks.append(data + b"\0" * (_align(len(data)) - len(data)))
+        offset += _align(len(data))
+
+    header = json.dumps(
+        {"version": FORMAT_VERSION, "rows": len(df), "columns": columns},
+        ensure_ascii=False,
+    ).encode("utf-8")
+    prefix = MAGIC + _LEN.pack(len(header)) + header
+    prefix += b"\0" * (_align(len(prefix)) - len(prefix))
+
+    with path.open("wb") as f:
+        f.write(prefix)
+        for block in blocks:
+            f.write(block)
+
+
+def read_schema(path: Path) -> dict:
+    """ヘッダー（スキーマ）だけを読む"""
+    with path.open("rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path.name}: .mcol 形式ではありません")
+        (length,) = _LEN.unpack(f.read(_LEN.size))
+        header = json.loads(f.read(length).decode("utf-8"))
+    if header.get("version") != FORMAT_VERSION:
+        raise ValueError(f"{path.name}: 未対応のバージョン {header.get('version')}")
+    header["data_start"] = _align(len(MAGIC) + _LEN.size + length)
+    return header
+
+
+def read_table(path: Path) -> pd.DataFrame:
+    """memmap 上で列を復元する。キー列は category、件数列は int32"""
+    schema = read_schema(path)
+    rows = schema["rows"]
+    buf = np.memmap(path, dtype=np.uint8, mode="r")
+
+    data = {}
+    for col in schema["columns"]:
+        arr = np.frombuffer(buf, dtype=col["dtype"], count=rows,
+                            offset=schema["data_start"] + col["offset"])
+        if col["kind"] == "dict":
+            data[col["name"]] = pd.Categorical.from_codes(arr, categories=col["categories"])
+        else:
+            data[col["name"]] = arr
+    return pd.DataFrame(data, copy=False)
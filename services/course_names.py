@@ -0,0 +1,140 @@
+"""
+講座名の解決
+
+名簿の講座名（J 列）と M/C（K 列）から集計用の講座名を決める。
+補正はルール表（SuffixRule の並び）で定義し、最初に一致したルールだけを適用する。
+解決は (講座名, M/C) の組ごとに1回だけ行い、結果は LRU でプロセス内に保持する
+（Web アプリではアップロードをまたいで再利用される）。
+
+ルール表は環境変数 COURSE_RULES_FILE に JSON で指定できる:
+    [{"keyword": "ｱﾄﾞﾊﾞﾝｽ"}, {"keyword": "ﾊｲﾚﾍﾞﾙ", "template": "{class_type}"}]
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+CACHE_SIZE = 4096
+
+
+@dataclass(frozen=True)
+class SuffixRule:
+    """講座名に keyword を含み M/C が空でなければ、template を展開して末尾に付ける"""
+    keyword: str
+    template: str = "{class_type}"
+
+    def apply(self, course: str, class_type: str) -> str | None:
+        if class_type and self.keyword in course:
+            return course + self.template.format(class_type=class_type)
+        return None
+
+
+# ｱﾄﾞﾊﾞﾝｽ・ﾊｲﾚﾍﾞﾙ講座は M/C ごとに別講座として数える
+DEFAULT_RULES = (SuffixRule("ｱﾄﾞﾊﾞﾝｽ"), SuffixRule("ﾊｲﾚﾍﾞﾙ"))
+
+
+def load_rules(path: Path) -> tuple[SuffixRule, ...]:
+    """JSON のルール表を読み込む"""
+    with path.open(encoding="utf-8") as f:
+        entries = json.load(f)
+    if not isinstance(entries, list):
+        raise ValueError(f"{path}: ルール表は配列で指定してください")
+    try:
+        return tuple(SuffixRule(**entry) for entry in entries)
+    except TypeError as e:
+        raise ValueError(f"{path}: 不正なルールです: {e}") from e
+
+
+def rules_tag(rules: tuple[SuffixRule, ...]) -> str:
+    """既定以外のルール表を識別する短いハッシュ（既定なら空文字）"""
+    if rules == DEFAULT_RULES:
+        return ""
+    payload = json.dumps([asdict(r) for r in rules], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:8]
+
+
+def _text(value) -> str | None:
+    """セル値を前後空白なしの文字列に（欠損は None）"""
+    if value is None or pd.isna(value):
+        return None
+    return str(value).strip()
+
+
+class CourseResolver:
+    """(講座名, M/C) → 集計用講座名。結果は最大 cache_size 組まで LRU で保持"""
+
+    def __init__(self, rules: tuple[SuffixRule, ...] = DEFAULT_RULES,
+                 cache_size: int = CACHE_SIZE):
+        self.rules = tuple(rules)
+        self.cache_size = cache_size
+        self._cache: OrderedDict[tuple, str | None] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def resolve_one(self, course, class_type) -> str | None:
+        """1組分の解決（講座名が欠損なら None）"""
+        key = (course, class_type)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+        resolved = self._apply(course, class_type)
+        with self._lock:
+            self.misses += 1
+            self._cache[key] = resolved
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return resolved
+
+    def _apply(self, course, class_type) -> str | None:
+        name = _text(course)
+        if name is None:
+            return None
+        suffix = _text(class_type) or ""
+        for rule in self.rules:
+            resolved = rule.apply(name, suffix)
+            if resolved is not None:
+                return resolved
+        return name
+
+    def resolve(self, course: pd.Series, class_type: pd.Series) -> pd.Series:
+        """行ごとの講座名を、重複しない (講座名, M/C) の組ごとに解決して展開する"""
+        course_codes, courses = pd.factorize(course, use_na_sentinel=False)
+        class_codes, classes = pd.factorize(class_type, use_na_sentinel=False)
+        pair_codes, pairs = pd.factorize(course_codes * max(len(classes), 1) + class_codes)
+
+        width = max(len(classes), 1)
+        table = np.empty(len(pairs), dtype=object)
+        for i, pair in enumerate(pairs):
+            resolved = self.resolve_one(courses[pair // width], classes[pair % width])
+            table[i] = np.nan if resolved is None else resolved
+        return pd.Series(table[pair_codes], index=course.index, dtype="str")
+
+
+_default: CourseResolver | None = None
+_default_lock = threading.Lock()
+
+
+def configured_rules() -> tuple[SuffixRule, ...]:
+    """COURSE_RULES_FILE があればそのルール表、なければ DEFAULT_RULES"""
+    path = os.environ.get("COURSE_RULES_FILE")
+    return load_rules(Path(path)) if path else DEFAULT_RULES
+
+
+def default_resolver() -> CourseResolver:
+    """プロセス内で共有するリゾルバ（LRU はアップロードをまたいで有効）"""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = CourseResolver(configured_rules())
+        return _default
@@ -0,0 +1,146 @@
+"""
+月別の件数キューブとロールアップ
+
+集計時に aggregate_cube() の結果（KEY_COLS + 性別・在籍校・学科ごとの件数）を
+年度ディレクトリの cubes/{YYYY-MM}.mcol に保存し、同時に学年・教室・担当ごとの合計と
+総計（ロールアップ）を cubes/{YYYY-MM}.rollup.json に書いておく。
+集計画面・CLI の Annual Summary はロールアップだけを読み、ピボットを合算し直さない。
+キューブは名簿を読み直さずに性別・在籍校・学科などで内訳を出すときに使う（breakdown()）。
+"""
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from services.aggregator import CUBE_COLS, MONTH_ORDER
+from services.atomic_io import atomic_path, month_lock
+from services.colstore import read_table, write_table
+
+CUBE_DIRNAME = "cubes"
+ROLLUP_DIMS = ("学年", "教室", "担当")
+_ROLLUP_SUFFIX = ".rollup.json"
+
+
+def cube_path(results_dir: Path, month: str) -> Path:
+    return results_dir / CUBE_DIRNAME / f"{month}.mcol"
+
+
+def rollup_path(results_dir: Path, month: str) -> Path:
+    return results_dir / CUBE_DIRNAME / f"{month}{_ROLLUP_SUFFIX}"
+
+
+def compute_rollups(cube: pd.DataFrame, month: str) -> dict:
+    """キューブから ROLLUP_DIMS ごとの合計と総計を求める（キーの欠損は空文字）"""
+    label = next(c for c in cube.columns if c not in CUBE_COLS)
+    counts = cube[label].to_numpy(dtype=np.int64)
+    by = {}
+    for dim in ROLLUP_DIMS:
+        totals = pd.Series(counts).groupby(cube[dim].fillna("").astype(str).to_numpy()).sum()
+        by[dim] = {str(k): int(v) for k, v in totals.items()}
+    return {"month": month, "label": label, "total": int(counts.sum()), "by": by}
+
+
+def save_month_cube(cube: pd.DataFrame, target_month: pd.Period, results_dir: Path) -> Path:
+    """target_month のキューブとロールアップを保存し、キューブのパスを返す
+
+    月別結果と同じ月ごとのロックの下で一時ファイル経由で置き換える。月別結果と一緒に
+    保存する場合は services/month_writer.py の save_month(cube=...) を使う。
+    """
+    with month_lock(results_dir, str(target_month)):
+        return write_month_cube(cube, target_month, results_dir)
+
+
+def write_month_cube(cube: pd.DataFrame, target_month: pd.Period, results_dir: Path) -> Path:
+    """save_month_cube() の書き込み部分。呼び出し側が month_lock を持つ"""
+    month = str(target_month)
+    path = cube_path(results_dir, month)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with atomic_path(path) as tmp:
+        write_table(cube, tmp, CUBE_COLS)
+    with atomic_path(rollup_path(results_dir, month)) as tmp:
+        tmp.write_text(json.dumps(compute_rollups(cube, month), ensure_ascii=False),
+                       encoding="utf-8")
+    return path
+
+
+def load_cube(results_dir: Path, month: str) -> pd.DataFrame | None:
+    """保存済みのキューブ（キー列は category）。なければ None"""
+    path = cube_path(results_dir, month)
+    return read_table(path) if path.exists() else None
+
+
+def load_rollups(results_dir: Path) -> dict[str, dict]:
+    """保存済みの {月: ロールアップ}（月の昇順）。キューブ本体は読まない"""
+    rollups = {}
+    for path in sorted((results_dir / CUBE_DIRNAME).glob(f"*{_ROLLUP_SUFFIX}")):
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            continue
+        rollups[data["month"]] = data
+    return rollups
+
+
+def month_totals(results_dir: Path) -> dict[str, int]:
+    """{月ラベル: 総計}（MONTH_ORDER 順）。ロールアップのある月だけ"""
+    totals: dict[str, int] = {}
+    for data in load_rollups(results_dir).values():
+        totals[data["label"]] = totals.get(data["label"], 0) + data["total"]
+    return {label: totals[label] for label in MONTH_ORDER if label in totals}
+
+
+def pivot_month_totals(results_dir: Path, pivot: pd.DataFrame) -> dict[str, int]:
+    """pivot の月列ごとの総計。ロールアップのある月はそれを使い、ない月（キューブ導入前の
+    結果）だけピボットの列を合算する"""
+    totals = month_totals(results_dir)
+    return {label: totals[label] if label in totals else int(pivot[label].sum())
+            for label in pivot.columns if label not in CUBE_COLS}
+
+
+def summary_table(results_dir: Path, dim: str) -> pd.DataFrame:
+    """dim（ROLLUP_DIMS のいずれか）の値 × 月ラベルの合計表。ロールアップから作る"""
+    if dim not in ROLLUP_DIMS:
+        raise ValueError(f"ロールアップのない列: {dim}（{', '.join(ROLLUP_DIMS)}）")
+    columns: dict[str, dict[str, int]] = {}
+    for data in load_rollups(results_dir).values():
+        column = columns.setdefault(data["label"], {})
+        for value, count in data["by"][dim].items():
+            column[value] = column.get(value, 0) + count
+    labels = [label for label in MONTH_ORDER if label in columns]
+    table = pd.DataFrame({label: pd.Series(columns[label], dtype=np.int64) for label in labels})
+    table = table.fillna(0).astype(np.int64).sort_index()
+    table.index.name = dim
+    return table.reset_index()
+
+
+def retain_cubes(results_dir: Path, months: set[str]) -> list[str]:
+    """months 以外の月のキューブ・ロールアップを削除し、削除した月を返す"""
+    removed = []
+    for path in sorted((results_dir / CUBE_DIRNAME).glob("*.mcol")):
+        if path.stem not in months:
+            path.unlink()
+            rollup_path(results_dir, path.stem).unlink(missing_ok=True)
+            removed.append(path.stem)
+    return removed
+
+
+def breakdown(results_dir: Path, columns: list[str]) -> pd.DataFrame:
+    """保存済みキューブを columns（CUBE_COLS の一部）ごとに合算した月別の表
+
+    例: breakdown(year_dir, ["学年", "性別"])。名簿は読み直さない。
+    """
+    unknown = [c for c in columns if c not in CUBE_COLS]
+    if unknown:
+        raise ValueError(f"未知の列: {unknown}")
+    cubes = [cube for month in load_rollups(results_dir)
+             if (cube := load_cube(results_dir, month)) is not None]
+    if not cubes:
+        return pd.DataFrame(columns=columns)
+    merged = pd.concat([c.astype({k: object for k in CUBE_COLS if k in c}) for c in cubes],
+                       ignore_index=True)
+    labels = [c for c in MONTH_ORDER if c in merged.columns]
+    merged[labels] = merged[labels].fillna(0).astype(np.int64)
+    return merged.groupby(columns, dropna=False, sort=True)[labels].sum().reset_index()
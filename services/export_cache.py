@@ -0,0 +1,124 @@
+"""
+エクスポート成果物キャッシュ
+
+年度ディレクトリ（results/FY2025）ごとのピボットの XLSX（outputs/monthly_stats_FY2025.xlsx）を
+ディスクに保持し、月別結果のフィンガープリントを ETag としてサイドカー
+（monthly_stats_FY2025.xlsx.etag）に記録する。月別結果が変わらない限り XLSX を作り直さない。
+以下の results_dir はいずれも年度ディレクトリ、output_dir は成果物を置くディレクトリ（outputs）。
+"""
+from __future__ import annotations
+
+import os
+import threading
+from collections.abc import Iterator
+from pathlib import Path
+
+import pandas as pd
+
+from services.aggregator import PARTITION_PREFIX, RESULTS_DIR, iter_excel_chunks
+from services.pivot_cache import get_pivot_cache
+
+EXPORT_STEM = "monthly_stats"
+EXPORT_VERSION = 1  # XLSX の書式を変えたら上げる
+LEGACY_EXPORT = f"{EXPORT_STEM}.xlsx"  # 年度別に分ける前の単一の成果物
+
+_write_lock = threading.Lock()
+
+
+def export_path(results_dir: Path, output_dir: Path) -> Path:
+    """results/FY2025 → output_dir/monthly_stats_FY2025.xlsx"""
+    return output_dir / f"{EXPORT_STEM}_{results_dir.name}.xlsx"
+
+
+def _etag_path(path: Path) -> Path:
+    return path.with_name(f"{path.name}.etag")
+
+
+def pivot_with_etag(results_dir: Path = RESULTS_DIR) -> tuple[pd.DataFrame, str]:
+    """(ピボット, ETag) を返す。ETag は引用符付きの強い ETag"""
+    pivot, fingerprint = get_pivot_cache(results_dir).snapshot()
+    return pivot, f'"x{EXPORT_VERSION}-{fingerprint[:40]}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """If-None-Match ヘッダーが etag に一致するか"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [c.strip().removeprefix("W/") for c in if_none_match.split(",")]
+    return etag in candidates
+
+
+def cached_export(etag: str, results_dir: Path, output_dir: Path) -> Path | None:
+    """etag に対応する XLSX がディスクにあればそのパス"""
+    path = export_path(results_dir, output_dir)
+    try:
+        if _etag_path(path).read_text(encoding="utf-8") == etag and path.exists():
+            return path
+    except OSError:
+        pass
+    return None
+
+
+def iter_export(pivot: pd.DataFrame, etag: str, results_dir: Path,
+                output_dir: Path) -> Iterator[bytes]:
+    """XLSX をチャンク単位で返しつつ、同じ内容をディスクキャッシュに書き込む
+
+    最後まで生成できた場合だけ成果物を置き換える（途中切断時は破棄）。
+    """
+    path = export_path(results_dir, output_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    completed = False
+    try:
+        with tmp.open("wb") as f:
+            for chunk in iter_excel_chunks(pivot):
+                f.write(chunk)
+                yield chunk
+        completed = True
+    finally:
+        if completed:
+            _commit(tmp, path, etag)
+        else:
+            tmp.unlink(missing_ok=True)
+
+
+def write_export(results_dir: Path, output_dir: Path) -> tuple[Path, bool] | None:
+    """XLSX 成果物を最新化する。(パス, 書き直したか)。データがなければ None"""
+    pivot, etag = pivot_with_etag(results_dir)
+    if pivot.empty:
+        return None
+    path = cached_export(etag, results_dir, output_dir)
+    if path is not None:
+        return path, False
+    for _ in iter_export(pivot, etag, results_dir, output_dir):
+        pass
+    return export_path(results_dir, output_dir), True
+
+
+def retain_exports(output_dir: Path, years: set[str]) -> list[str]:
+    """years（年度ディレクトリ名）以外の年度の成果物と旧形式の monthly_stats.xlsx を削除する
+
+    ETag のサイドカーも一緒に削除する。削除した XLSX のファイル名を返す。
+    """
+    stale = [path for path in output_dir.glob(f"{EXPORT_STEM}_{PARTITION_PREFIX}*.xlsx")
+             if path.stem.removeprefix(f"{EXPORT_STEM}_") not in years]
+    stale.append(output_dir / LEGACY_EXPORT)
+    removed = []
+    with _write_lock:
+        for path in sorted(stale):
+            if path.exists():
+                path.unlink()
+                removed.append(path.name)
+            _etag_path(path).unlink(missing_ok=True)
+    return removed
+
+
+def _commit(tmp: Path, path: Path, etag: str) -> None:
+    """一時ファイルを成果物に置き換え、ETag を記録"""
+    with _write_lock:
+        os.replace(tmp, path)
+        etag_tmp = _etag_path(tmp)
+        etag_tmp.write_text(etag, encoding="utf-8")
+        os.replace(etag_tmp, _etag_path(path))
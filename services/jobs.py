@@ -0,0 +1,332 @@
+"""
+バックグラウンドジョブキュー
+
+アップロード処理（読み込み・集計・保存・ピボット更新）をイベントループ外の
+ワーカースレッドで実行する。同時実行数と待機数に上限を設け、上限を超えた投入は拒否する。
+ジョブ ID で状態と結果を参照でき、htmx のポーリングから利用する。
+複数ファイルの一括アップロードは JobBatch にまとめ、全ジョブの完了後に後処理
+（ピボット更新）を1回だけ実行する。
+
+state_dir を指定すると、ジョブ・バッチの状態が変わるたびに state_dir/job-{ID}.json・
+batch-{ID}.json に書き出す（atomic_path 経由）。手元にないジョブ・バッチは get() / get_batch() が
+ここから読むため、複数の uvicorn ワーカーのどれにポーリング・SSE の再接続が届いても状態を返せる。
+"""
+from __future__ import annotations
+
+import json
+import logging
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from services.atomic_io import atomic_path
+
+_logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+STATE_TTL = 24 * 60 * 60  # 状態ファイルを残す秒数（起動時にこれより古いものを削除）
+_ID = re.compile(r"[0-9a-f]{32}")
+
+
+@dataclass
+class Job:
+    id: str
+    label: str
+    status: str = QUEUED
+    result: Any = None
+    error: str | None = None
+    created_at: float = field(default_factory=time.monotonic)
+    finished_at: float | None = None
+    batch: JobBatch | None = field(default=None, repr=False, compare=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def state(self) -> dict:
+        """状態ファイルに書く内容"""
+        return {"id": self.id, "label": self.label, "status": self.status,
+                "result": self.result, "error": self.error}
+
+    @classmethod
+    def from_state(cls, state: dict) -> Job:
+        return cls(id=state["id"], label=state["label"], status=state["status"],
+                   result=state["result"], error=state["error"])
+
+
+@dataclass
+class BatchSnapshot:
+    """別のプロセスが書いたバッチの状態（読み取り専用。JobBatch と同じ属性で参照できる）"""
+    id: str
+    jobs: list[Job]
+    finished: bool
+    result: Any
+    error: str | None
+
+
+class JobQueue:
+    """同時実行 max_workers、待機 max_pending までのジョブキュー
+
+    完了済みジョブは新しい順に max_history 件まで保持する（state_dir の状態ファイルも同じ件数）。
+    """
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 8, max_history: int = 200,
+                 state_dir: Path | None = None):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_history = max_history
+        self.state_dir = state_dir
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="job")
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._batches: OrderedDict[str, JobBatch] = OrderedDict()
+        self._lock = threading.Lock()
+        self._sweep_state()
+
+    def submit(self, label: str, fn: Callable[..., Any], *args: Any,
+               on_finished: Callable[[Job], None] | None = None,
+               batch: JobBatch | None = None) -> Job | None:
+        """ジョブを投入する。キューが満杯なら None
+
+        on_finished は完了・失敗の後にワーカースレッドで呼ばれる。batch は状態が変わるたびに
+        状態ファイルを書き直すバッチ。
+        """
+        if not self._slots.acquire(blocking=False):
+            return None
+        job = Job(id=uuid.uuid4().hex, label=label, batch=batch)
+        with self._lock:
+            self._jobs[job.id] = job
+            pruned = self._prune()
+        self._remove_state(pruned)
+        self.save_state(job)
+        try:
+            self._executor.submit(self._run, job, fn, args, on_finished)
+        except RuntimeError:
+            # シャットダウン済み
+            self._slots.release()
+            with self._lock:
+                self._jobs.pop(job.id, None)
+            raise
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        """ジョブ。このプロセスにないものは状態ファイルから読む"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        state = self._read_state(f"job-{job_id}", job_id)
+        return Job.from_state(state) if state is not None else None
+
+    def batch(self, finalize: Callable[[JobBatch], Any]) -> JobBatch:
+        """このキューに投入する JobBatch を作る（ID で get_batch() から参照できる）"""
+        batch = JobBatch(self, finalize)
+        with self._lock:
+            self._batches[batch.id] = batch
+            finished = [b for b in self._batches.values() if b.finished]
+            pruned = finished[:max(0, len(finished) - self.max_history)]
+            for old in pruned:
+                del self._batches[old.id]
+        for old in pruned:
+            self._remove_state([f"batch-{old.id}"])
+        batch.save_state()
+        return batch
+
+    def get_batch(self, batch_id: str) -> JobBatch | BatchSnapshot | None:
+        """バッチ。このプロセスにないものは状態ファイルから読んだ BatchSnapshot"""
+        with self._lock:
+            batch = self._batches.get(batch_id)
+        if batch is not None:
+            return batch
+        state = self._read_state(f"batch-{batch_id}", batch_id)
+        if state is None:
+            return None
+        return BatchSnapshot(id=state["id"], jobs=[Job.from_state(j) for j in state["jobs"]],
+                             finished=state["finished"], result=state["result"],
+                             error=state["error"])
+
+    def save_state(self, job: Job) -> None:
+        """ジョブの状態ファイルを書き、バッチのジョブならバッチの状態ファイルも書き直す"""
+        self._write_state(f"job-{job.id}", job.state())
+        if job.batch is not None:
+            job.batch.save_state()
+
+    def stats(self) -> dict[str, int]:
+        """状態別のジョブ数"""
+        with self._lock:
+            counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            return counts
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _run(self, job: Job, fn: Callable[..., Any], args: tuple,
+             on_finished: Callable[[Job], None] | None) -> None:
+        job.status = RUNNING
+        self.save_state(job)
+        try:
+            job.result = fn(*args)
+            job.status = DONE
+        except Exception as e:
+            _logger.error("ジョブ失敗 %s (%s): %s", job.id, job.label, e, exc_info=True)
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            job.finished_at = time.monotonic()
+            try:
+                self.save_state(job)
+                if on_finished is not None:
+                    on_finished(job)
+            finally:
+                self._slots.release()
+
+    def _prune(self) -> list[str]:
+        """古い完了済みジョブを削除し、消すべき状態ファイルの名前を返す（_lock 取得済みで呼ぶ）"""
+        finished = [j.id for j in self._jobs.values() if j.finished]
+        pruned = finished[:max(0, len(finished) - self.max_history)]
+        for job_id in pruned:
+            del self._jobs[job_id]
+        return [f"job-{job_id}" for job_id in pruned]
+
+    def _state_path(self, name: str) -> Path:
+        return self.state_dir / f"{name}.json"
+
+    def _write_state(self, name: str, state: dict) -> None:
+        if self.state_dir is None:
+            return
+        try:
+            self.state_dir.mkdir(parents=True, exist_ok=True)
+            with atomic_path(self._state_path(name)) as tmp:
+                tmp.write_text(json.dumps(state, ensure_ascii=False, default=str), encoding="utf-8")
+        except OSError as e:
+            _logger.warning("ジョブの状態を書き込めません %s: %s", name, e)
+
+    def _read_state(self, name: str, state_id: str) -> dict | None:
+        if self.state_dir is None or not _ID.fullmatch(state_id):
+            return None
+        try:
+            return json.loads(self._state_path(name).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def _remove_state(self, names: list[str]) -> None:
+        if self.state_dir is None:
+            return
+        for name in names:
+            self._state_path(name).unlink(missing_ok=True)
+
+    def _sweep_state(self) -> None:
+        """STATE_TTL より古い状態ファイル（停止したプロセスの残り）を削除"""
+        if self.state_dir is None or not self.state_dir.exists():
+            return
+        cutoff = time.time() - STATE_TTL
+        for path in self.state_dir.glob("*.json"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except OSError:
+                pass
+
+
+class JobBatch:
+    """まとめて投入したジョブ群
+
+    seal() で投入を締め切った後、全ジョブが終わった時点で finalize(batch) を1回だけ実行し、
+    戻り値を result に保持する。finalize は最後に終わったジョブのワーカースレッド
+    （締め切り時に全て終わっていれば seal() の呼び出し元）で実行される。
+    """
+
+    def __init__(self, queue: JobQueue, finalize: Callable[[JobBatch], Any]):
+        self.id = uuid.uuid4().hex
+        self.result: Any = None
+        self.error: str | None = None
+        self.finished = False
+        self._queue = queue
+        self._finalize = finalize
+        self._jobs: list[Job] = []
+        self._pending = 0
+        self._sealed = False
+        self._lock = threading.Lock()
+        self._state_lock = threading.Lock()
+
+    @property
+    def jobs(self) -> list[Job]:
+        """投入順のジョブ（写し）"""
+        with self._lock:
+            return list(self._jobs)
+
+    def submit(self, label: str, fn: Callable[..., Any], *args: Any) -> Job | None:
+        """ジョブを投入する。キューが満杯なら None（バッチには加えない）"""
+        with self._lock:
+            if self._sealed:
+                raise RuntimeError("締め切り済みのバッチです")
+            self._pending += 1
+        job = self._queue.submit(label, fn, *args, on_finished=self._job_finished, batch=self)
+        with self._lock:
+            if job is None:
+                self._pending -= 1
+            else:
+                self._jobs.append(job)
+        self.save_state()
+        return job
+
+    def add(self, label: str, result: Any) -> Job:
+        """実行せずに結果の決まったジョブ（受け付けなかったファイルなど）を加える"""
+        job = Job(id=uuid.uuid4().hex, label=label, status=DONE, result=result,
+                  finished_at=time.monotonic())
+        with self._lock:
+            self._jobs.append(job)
+        self.save_state()
+        return job
+
+    def seal(self) -> None:
+        """投入を締め切る。全ジョブが終わっていればここで finalize を実行する"""
+        with self._lock:
+            self._sealed = True
+            ready = self._pending == 0
+        if ready:
+            self._run_finalize()
+
+    def _job_finished(self, job: Job) -> None:
+        with self._lock:
+            self._pending -= 1
+            ready = self._sealed and self._pending == 0
+        if ready:
+            self._run_finalize()
+
+    def _run_finalize(self) -> None:
+        try:
+            self.result = self._finalize(self)
+        except Exception as e:
+            _logger.error("バッチの後処理に失敗 %s: %s", self.id, e, exc_info=True)
+            self.error = str(e)
+        finally:
+            self.finished = True
+            self.save_state()
+
+    def save_state(self) -> None:
+        """バッチの状態ファイル（各ジョブの状態を含む）を書き直す"""
+        # 書き込みを直列化し、古い内容が新しい内容を上書きしないようにする
+        with self._state_lock:
+            finished = self.finished
+            self._queue._write_state(f"batch-{self.id}", {
+                "id": self.id,
+                "jobs": [job.state() for job in self.jobs],
+                "finished": finished,
+                "result": self.result if finished else None,
+                "error": self.error,
+            })
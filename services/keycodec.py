@@ -0,0 +1,162 @@
+"""
+キー列の整数エンコード
+
+KEY_COLS（学年・教室・講座名・M/C・担当）の値を、月をまたいで共有する辞書で int32 コードに
+変換する。グループ化はコード列を1つの int64 に詰めた値で行い、ラベルへの復元は
+結果（グループ数分）だけで済ませる。コードは追加順で、一度割り当てたら変わらない。
+"""
+from __future__ import annotations
+
+import threading
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+import pandas as pd
+
+MISSING = -1  # 欠損のコード
+
+
+class KeyDictionary:
+    """列ごとの「値 ⇔ コード」辞書（スレッドセーフ、pickle 可）"""
+
+    def __init__(self, columns: Sequence[str]):
+        self.columns = list(columns)
+        self._labels: dict[str, list] = {c: [] for c in self.columns}
+        self._index: dict[str, dict] = {c: {} for c in self.columns}
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        return {"columns": self.columns, "labels": self._labels}
+
+    def __setstate__(self, state: dict) -> None:
+        self.columns = state["columns"]
+        self._labels = state["labels"]
+        self._index = {c: {v: i for i, v in enumerate(labels)}
+                       for c, labels in self._labels.items()}
+        self._lock = threading.Lock()
+
+    def labels(self) -> dict[str, list]:
+        """列ごとのラベル（コード順）の写し。from_labels() で同じコードの辞書を作り直せる"""
+        with self._lock:
+            return {c: list(labels) for c, labels in self._labels.items()}
+
+    @classmethod
+    def from_labels(cls, labels: Mapping[str, list]) -> KeyDictionary:
+        """labels() の値（列 → コード順のラベル）から辞書を作る"""
+        dictionary = cls(list(labels))
+        for column, values in labels.items():
+            dictionary._labels[column] = list(values)
+            dictionary._index[column] = {v: i for i, v in enumerate(values)}
+        return dictionary
+
+    def size(self, column: str) -> int:
+        return len(self._labels[column])
+
+    def encode(self, frame: pd.DataFrame) -> np.ndarray:
+        """frame のキー列を (行数, 列数) の int32 コード配列に変換。ない列は全て欠損"""
+        codes = np.full((len(frame), len(self.columns)), MISSING, dtype=np.int32)
+        for j, column in enumerate(self.columns):
+            if column in frame.columns:
+                codes[:, j] = self._encode_column(column, frame[column])
+        return codes
+
+    def _encode_column(self, column: str, values: pd.Series) -> np.ndarray:
+        # 値の種類数だけ辞書を引き、行へはコード配列で展開する
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            local, uniques = values.cat.codes.to_numpy(), values.cat.categories
+        else:
+            # 欠損も1つの値として数える方が文字列列では大幅に速い（欠損は下で MISSING に）
+            local, uniques = pd.factorize(values, use_na_sentinel=False)
+        missing = pd.isna(uniques)
+        with self._lock:
+            index, labels = self._index[column], self._labels[column]
+            lookup = np.empty(len(uniques) + 1, dtype=np.int32)
+            for i, value in enumerate(uniques):
+                if missing[i]:
+                    lookup[i] = MISSING
+                    continue
+                code = index.get(value)
+                if code is None:
+                    code = index[value] = len(labels)
+                    labels.append(value)
+                lookup[i] = code
+        lookup[-1] = MISSING  # local の -1（欠損）は末尾を引く
+        return lookup[local]
+
+    def unique_rows(self, codes: np.ndarray, sort: bool = False) -> tuple[np.ndarray, np.ndarray]:
+        """コード行の重複を除く。(各行のグループ番号, グループごとのコード行) を返す
+
+        sort=True のとき、グループは groupby(sort=True, dropna=False) と同じ
+        ラベル順（列ごとの辞書順、欠損は最後）に並ぶ。
+        """
+        with self._lock:
+            sizes = [len(self._labels[c]) for c in self.columns]
+            tables = [self._digit_table(c, sort) for c in self.columns]
+        dims = tuple(n + 1 for n in sizes)
+        digits = [to_digit[codes[:, j]] for j, (to_digit, _) in enumerate(tables)]
+
+        try:
+            packed = np.ravel_multi_index(digits, dims)
+        except ValueError:
+            # 種類数の積が int64 に収まらない場合は行単位で比較
+            stacked = np.stack(digits, axis=1)
+            uniq, inverse = np.unique(stacked, axis=0, return_inverse=True)
+            uniq_digits = list(uniq.T)
+        else:
+            inverse, uniq = pd.factorize(packed)
+            if sort:
+                # 桁値の辞書順 = ラベル順。並べ替えはグループ数分だけ
+                order = np.argsort(uniq)
+                rank = np.empty_like(order)
+                rank[order] = np.arange(len(order))
+                inverse, uniq = rank[inverse], uniq[order]
+            uniq_digits = np.unravel_index(uniq, dims)
+
+        uniq_codes = np.stack(
+            [to_code[d] for (_, to_code), d in zip(tables, uniq_digits)], axis=1,
+        ).astype(np.int32, copy=False)
+        return np.asarray(inverse).reshape(-1), uniq_codes.reshape(-1, len(self.columns))
+
+    def _digit_table(self, column: str, sort: bool) -> tuple[np.ndarray, np.ndarray]:
+        """(コード → 桁値, 桁値 → コード) の表。欠損の桁値は最大（_lock 取得済みで呼ぶ）"""
+        labels = self._labels[column]
+        n = len(labels)
+        if sort and n:
+            rank, _ = pd.factorize(pd.Index(labels, dtype=object), sort=True)
+        else:
+            rank = np.arange(n)
+        to_digit = np.append(rank, n)        # codes の -1 は末尾 = n を引く
+        to_code = np.empty(n + 1, dtype=np.int64)
+        to_code[rank] = np.arange(n)
+        to_code[n] = MISSING
+        return to_digit, to_code
+
+    def decode(self, codes: np.ndarray,
+               dtypes: Mapping[str, object] | object = object) -> pd.DataFrame:
+        """コード配列をキー列の DataFrame に戻す（欠損は NaN）"""
+        data = {}
+        for j, column in enumerate(self.columns):
+            with self._lock:
+                labels = self._labels[column]
+                table = np.empty(len(labels) + 1, dtype=object)
+                table[:-1] = labels
+            table[-1] = np.nan
+            dtype = dtypes.get(column, object) if isinstance(dtypes, Mapping) else dtypes
+            # object 指定時は groupby のキーと同じく Index の型推論に任せる
+            values = pd.Index(table[codes[:, j]], dtype=None if dtype == object else dtype)
+            data[column] = pd.Series(values, copy=False)
+        return pd.DataFrame(data)
+
+
+_shared: dict[tuple[str, ...], KeyDictionary] = {}
+_shared_lock = threading.Lock()
+
+
+def shared_dictionary(columns: Sequence[str]) -> KeyDictionary:
+    """プロセス内で共有する辞書（アップロード・CLI の各月で同じコードを使う）"""
+    key = tuple(columns)
+    with _shared_lock:
+        dictionary = _shared.get(key)
+        if dictionary is None:
+            dictionary = _shared[key] = KeyDictionary(columns)
+        return dictionary
@@ -0,0 +1,139 @@
+"""
+入力ファイルの記録
+
+- Manifest: CLI 差分実行用。入力 Excel ごとに (パス, サイズ, mtime, sha256, 集計版) と
+  生成した月別結果ファイルの results_dir からの相対パス（FY2025/2025-04.csv）を
+  results_dir/.manifest.json に記録する。再実行時は変化のないファイルの集計を省略し、
+  既存の月別結果をそのまま使う。
+- 月別ソース: 月別結果ごとに元になった Excel の sha256 を年度ディレクトリの .sources.json に
+  記録する。同じ内容の再アップロードは集計を省略できる。
+"""
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from services.aggregator import AGGREGATOR_VERSION, RESULTS_DB, has_month_result
+from services.atomic_io import LOCK_DIRNAME, atomic_path, file_lock
+from services.pivot_cache import file_digest
+
+MANIFEST_FILENAME = ".manifest.json"
+SOURCES_FILENAME = ".sources.json"
+
+@dataclass
+class SourceRecord:
+    """入力 Excel 1ファイル分の記録"""
+    size: int
+    mtime_ns: int
+    sha256: str
+    month: str
+    result: str | None  # 生成した月別結果の results_dir からの相対パス。集計対象なしは None
+    aggregator_version: str = AGGREGATOR_VERSION
+
+
+class Manifest:
+    def __init__(self, path: Path, records: dict[str, SourceRecord] | None = None):
+        self.path = path
+        self.records: dict[str, SourceRecord] = records or {}
+
+    @classmethod
+    def load(cls, results_dir: Path) -> Manifest:
+        """マニフェストを読み込む。存在しない・壊れている場合は空"""
+        path = results_dir / MANIFEST_FILENAME
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+            records = {k: SourceRecord(**v) for k, v in data["files"].items()}
+        except (OSError, ValueError, KeyError, TypeError):
+            records = {}
+        return cls(path, records)
+
+    def save(self) -> None:
+        data = {"files": {k: asdict(v) for k, v in sorted(self.records.items())}}
+        tmp = self.path.with_name(f"{MANIFEST_FILENAME}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def unchanged(self, key: str, file_path: Path) -> SourceRecord | None:
+        """前回から変化がなく、結果ファイルも残っていれば記録を返す
+
+        サイズ・mtime が一致すればハッシュは計算しない。mtime だけ変わった場合は
+        ハッシュで内容を比較し、一致すれば mtime を更新して再利用する。
+        """
+        record = self.records.get(key)
+        if record is None or record.aggregator_version != AGGREGATOR_VERSION:
+            return None
+        if record.result is not None and not self._result_exists(record):
+            return None
+        st = file_path.stat()
+        if st.st_size != record.size:
+            return None
+        if st.st_mtime_ns != record.mtime_ns:
+            if file_digest(file_path) != record.sha256:
+                return None
+            record.mtime_ns = st.st_mtime_ns
+        return record
+
+    def _result_exists(self, record: SourceRecord) -> bool:
+        path = self.path.parent / record.result
+        if path.name == RESULTS_DB:
+            return has_month_result(path.parent, record.month)
+        return path.exists()
+
+    def record(self, key: str, file_path: Path, month: str, result: str | None,
+               sha256: str | None = None) -> SourceRecord:
+        """file_path の記録を追加・更新する（sha256 を計算済みなら渡す）"""
+        st = file_path.stat()
+        record = self.records[key] = SourceRecord(
+            size=st.st_size,
+            mtime_ns=st.st_mtime_ns,
+            sha256=sha256 or file_digest(file_path),
+            month=month,
+            result=result,
+        )
+        return record
+
+    def retain(self, keys: set[str]) -> None:
+        """現存しない入力ファイルの記録を削除"""
+        for key in set(self.records) - keys:
+            del self.records[key]
+
+
+def _read_sources(results_dir: Path) -> dict:
+    try:
+        return json.loads((results_dir / SOURCES_FILENAME).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def record_month_source(results_dir: Path, month: str, sha256: str,
+                        result: str, rows: int) -> None:
+    """月別結果 result の元になった Excel の sha256 を記録
+
+    月別結果と同じ month_lock の中で呼ぶ（別のアップロードの sha256 を記録しないため）。
+    .sources.json の読み書きはプロセス間のファイルロックで直列化する。
+    """
+    with file_lock(results_dir / LOCK_DIRNAME / f"{SOURCES_FILENAME}.lock"):
+        sources = _read_sources(results_dir)
+        sources[month] = {
+            "sha256": sha256,
+            "result": result,
+            "rows": rows,
+            "aggregator_version": AGGREGATOR_VERSION,
+        }
+        with atomic_path(results_dir / SOURCES_FILENAME) as tmp:
+            tmp.write_text(json.dumps(sources, ensure_ascii=False, indent=2, sort_keys=True),
+                           encoding="utf-8")
+
+
+def find_month_source(results_dir: Path, month: str, sha256: str) -> dict | None:
+    """month の保存済み結果が同じ sha256 の Excel から作られていれば記録を返す"""
+    entry = _read_sources(results_dir).get(month)
+    if (entry is None or entry.get("sha256") != sha256
+            or entry.get("aggregator_version") != AGGREGATOR_VERSION):
+        return None
+    # 形式変換（CSV ⇔ .mcol ⇔ SQLite）後も同じ月の結果があれば有効
+    if not has_month_result(results_dir, month):
+        return None
+    return entry
@@ -0,0 +1,278 @@
+"""
+アプリ内メトリクス
+
+スレッドセーフなカウンター・ヒストグラムを名前で登録し、Prometheus テキスト形式で出力する。
+stage() で処理段階（読み込み・集計・保存・ピボット・描画）ごとの所要時間・行数・読み込みバイト数・
+プロセスの最大 RSS の増分を記録し、request_trace() の範囲では段階の内訳を1行の JSON ログにまとめる。
+環境変数 STAGE_METRICS=0 で段階計測を無効化すると、stage() / request_trace() は何もしない。
+"""
+from __future__ import annotations
+
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+
+_logger = logging.getLogger(__name__)
+
+STAGE_METRICS = os.environ.get("STAGE_METRICS", "1") != "0"
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BYTES_BUCKETS = tuple(2**20 * n for n in (1, 4, 16, 64, 256, 1024))
+
+
+def _format_labels(label_name: str | None, label: str | None, extra: str = "") -> str:
+    parts = []
+    if label_name is not None and label is not None:
+        escaped = label.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{label_name}="{escaped}"')
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    """単調増加カウンター。label_name を指定するとラベル値ごとに数える"""
+
+    def __init__(self, name: str, help_text: str, label_name: str | None = None):
+        self.name = name
+        self.help_text = help_text
+        self.label_name = label_name
+        self._values: dict[str | None, int] = {} if label_name else {None: 0}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1, label: str | None = None) -> None:
+        with self._lock:
+            self._values[label] = self._values.get(label, 0) + amount
+
+    @property
+    def value(self) -> int:
+        return self._values.get(None, 0)
+
+    def get(self, label: str | None = None) -> int:
+        return self._values.get(label, 0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = sorted(self._values.items(), key=lambda kv: kv[0] or "")
+        return [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} counter",
+            *(f"{self.name}{_format_labels(self.label_name, label)} {v}" for label, v in values),
+        ]
+
+
+class Histogram:
+    """累積バケットのヒストグラム。label_name を指定するとラベル値ごとに集計する"""
+
+    def __init__(self, name: str, help_text: str, buckets: tuple[float, ...] = DURATION_BUCKETS,
+                 label_name: str | None = None):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self.label_name = label_name
+        # ラベル値 → ([バケットごとの件数], 合計, 件数)
+        self._series: dict[str | None, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, label: str | None = None) -> None:
+        with self._lock:
+            series = self._series.get(label)
+            if series is None:
+                series = self._series[label] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def count(self, label: str | None = None) -> int:
+        series = self._series.get(label)
+        return series[2] if series else 0
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted(self._series.items(), key=lambda kv: kv[0] or "")
+            series = [(label, list(s[0]), s[1], s[2]) for label, s in series]
+        for label, counts, total, n in series:
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                le = _format_labels(self.label_name, label, f'le="{bound:g}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            le = _format_labels(self.label_name, label, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {n}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_name, label)} {total:g}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_name, label)} {n}")
+        return lines
+
+
+_registry: dict[str, Counter | Histogram] = {}
+_registry_lock = threading.Lock()
+
+
+def _register(name: str, factory):
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = factory()
+        return metric
+
+
+def counter(name: str, help_text: str, label_name: str | None = None) -> Counter:
+    """name のカウンターを取得（未登録なら作成）"""
+    return _register(name, lambda: Counter(name, help_text, label_name))
+
+
+def histogram(name: str, help_text: str, buckets: tuple[float, ...] = DURATION_BUCKETS,
+              label_name: str | None = None) -> Histogram:
+    """name のヒストグラムを取得（未登録なら作成）"""
+    return _register(name, lambda: Histogram(name, help_text, buckets, label_name))
+
+
+def render_prometheus() -> str:
+    """登録済みの全メトリクスを Prometheus テキスト形式で返す"""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    lines = [line for metric in metrics for line in metric.render()]
+    return "\n".join(lines) + "\n"
+
+
+def peak_rss() -> int | None:
+    """プロセスのピーク RSS（バイト）。取得できない環境では None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KB、macOS はバイト単位
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+# ── 段階計測 ──
+
+stage_seconds = histogram("stage_duration_seconds", "処理段階ごとの所要時間（秒）",
+                          label_name="stage")
+# ru_maxrss はプロセス全体の最大値なので、段階ごとのピークではない。それまでの最大を超えなければ 0、
+# 同時に実行中の段階があれば、その確保による増分もこの段階に計上される
+stage_rss_hwm_growth = histogram("stage_rss_high_water_growth_bytes",
+                                 "処理段階中にプロセスの最大 RSS（ru_maxrss）が増えた量（バイト）",
+                                 BYTES_BUCKETS, label_name="stage")
+stage_rows_in = counter("stage_rows_in_total", "処理段階に入力された行数", "stage")
+stage_rows_out = counter("stage_rows_out_total", "処理段階が出力した行数", "stage")
+stage_bytes_read = counter("stage_bytes_read_total", "処理段階で読み込んだバイト数", "stage")
+
+
+@dataclass
+class StageRecord:
+    """1段階分の計測値。with stage(...) as s: の中で rows_in などを設定する"""
+    name: str
+    seconds: float = 0.0
+    rows_in: int | None = None
+    rows_out: int | None = None
+    bytes_read: int | None = None
+    rss_hwm_growth: int | None = None  # プロセスの最大 RSS の増分（段階ごとのピークではない）
+    error: str | None = None
+
+
+class _Stage:
+    def __init__(self, name: str):
+        self.record = StageRecord(name)
+
+    def __enter__(self) -> StageRecord:
+        self._rss = peak_rss()
+        self._start = time.perf_counter()
+        return self.record
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        record = self.record
+        record.seconds = time.perf_counter() - self._start
+        if self._rss is not None:
+            record.rss_hwm_growth = peak_rss() - self._rss
+            stage_rss_hwm_growth.observe(record.rss_hwm_growth, record.name)
+        if exc_type is not None:
+            record.error = exc_type.__name__
+        stage_seconds.observe(record.seconds, record.name)
+        for metric, value in ((stage_rows_in, record.rows_in), (stage_rows_out, record.rows_out),
+                              (stage_bytes_read, record.bytes_read)):
+            if value is not None:
+                metric.inc(value, record.name)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.stages.append(record)
+
+
+class _Noop:
+    """無効時の stage() / request_trace()。属性の設定も含めて何もしない"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+    def __setattr__(self, name, value) -> None:
+        pass
+
+
+_NOOP = _Noop()
+
+
+def stage(name: str):
+    """処理段階を計測するコンテキストマネージャ（STAGE_METRICS=0 なら何もしない）
+
+        with stage("aggregate") as s:
+            s.rows_in = len(df)
+            result = aggregate(df, month)
+            s.rows_out = len(result)
+    """
+    return _Stage(name) if STAGE_METRICS else _NOOP
+
+
+@dataclass
+class RequestTrace:
+    kind: str
+    fields: dict
+    stages: list[StageRecord] = field(default_factory=list)
+
+
+_current_trace: contextvars.ContextVar[RequestTrace | None] = contextvars.ContextVar(
+    "request_trace", default=None)
+
+
+class _Trace:
+    def __init__(self, kind: str, fields: dict):
+        self.trace = RequestTrace(kind, fields)
+
+    def __enter__(self) -> RequestTrace:
+        self._token = _current_trace.set(self.trace)
+        self._start = time.perf_counter()
+        return self.trace
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        _current_trace.reset(self._token)
+        trace = self.trace
+        entry = {
+            "event": trace.kind,
+            "seconds": round(time.perf_counter() - self._start, 4),
+            **trace.fields,
+            "stages": [
+                {k: (round(v, 4) if k == "seconds" else v)
+                 for k, v in asdict(s).items() if v is not None}
+                for s in trace.stages
+            ],
+        }
+        if exc_type is not None:
+            entry["error"] = exc_type.__name__
+        _logger.info(json.dumps(entry, ensure_ascii=False, default=str))
+
+
+def request_trace(kind: str, **fields):
+    """範囲内の stage() をまとめ、終了時に1行の JSON ログを出す（STAGE_METRICS=0 なら何もしない）"""
+    return _Trace(kind, fields) if STAGE_METRICS else _NOOP
@@ -0,0 +1,33 @@
+"""
+1ヶ月分の保存
+
+月別結果・件数キューブとロールアップ・元になった Excel の sha256（.sources.json）を
+同じ month_lock の中で書き、最後に世代番号を1回だけ進める。同じ月のアップロードが並行しても
+（別プロセスでも）、1つの月の結果・キューブ・ソース記録は同じアップロードのものになり、
+世代番号を比べる読み手には全部が書き終わった状態だけが見える。
+"""
+from __future__ import annotations
+
+from pathlib import Path
+
+import pandas as pd
+
+from services.aggregator import write_monthly_result
+from services.atomic_io import bump_generation, month_lock
+from services.cube import write_month_cube
+from services.manifest import record_month_source
+
+
+def save_month(result: pd.DataFrame, target_month: pd.Period, results_dir: Path,
+               sha256: str | None = None, cube: pd.DataFrame | None = None) -> Path:
+    """月別結果を保存し（cube があればキューブ、sha256 があればソースも）、月別結果のパスを返す"""
+    month = str(target_month)
+    results_dir.mkdir(parents=True, exist_ok=True)
+    with month_lock(results_dir, month):
+        path = write_monthly_result(result, target_month, results_dir)
+        if cube is not None:
+            write_month_cube(cube, target_month, results_dir)
+        if sha256 is not None:
+            record_month_source(results_dir, month, sha256, path.name, len(result))
+        bump_generation(results_dir)
+    return path
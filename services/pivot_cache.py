@@ -0,0 +1,269 @@
+"""
+ピボットキャッシュ
+
+build_pivot() と同じ結果を、プロセス内とディスク（results_dir/.pivot_cache.npz）に
+保持する。月ファイルごとに (mtime, size, sha256) を記録し、変化したファイルの月列だけを
+再計算してピボットに合成し直す。SQLite ストア（RESULTS_FORMAT=sqlite）の分は、
+ストアの版が変わったときだけ SQL で月ラベルごとに集計し直す。キー列はキャッシュ専用の
+辞書で整数コード化して保持し、ラベルに戻すのはピボットを組み立てるときだけ。
+ディスクキャッシュは配列と JSON（辞書のラベル・ファイルごとの記録）だけの npz で、
+allow_pickle=False で読む（results_dir に置かれたファイルからコードを実行しない）。
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+import zipfile
+from dataclasses import dataclass, replace
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from services.aggregator import (
+    KEY_COLS,
+    RESULTS_DIR,
+    list_month_files,
+    pivot_from_months,
+    read_month_codes,
+    read_store_codes,
+    result_store,
+    store_version,
+)
+from services.atomic_io import atomic_path, read_generation
+from services.keycodec import KeyDictionary
+
+CACHE_FILENAME = ".pivot_cache.npz"
+CACHE_VERSION = 4
+_LEGACY_CACHE_FILENAME = ".pivot_cache.pkl"  # 版 3 までの pickle（読まずに削除する）
+READ_ATTEMPTS = 3  # 読み込み中に保存が重なった場合の読み直し回数の上限
+
+
+@dataclass
+class MonthEntry:
+    """月ファイル1つ分のキャッシュ"""
+    stat: tuple[int, int]       # (mtime_ns, size)
+    digest: str                 # sha256
+    label: str | None           # 月列名。月列がないファイルは None
+    codes: np.ndarray | None    # キーのコード行（read_month_codes の結果）
+    counts: np.ndarray | None   # 件数
+
+
+def file_digest(path: Path) -> str:
+    with path.open("rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def _stat_key(path: Path) -> tuple[int, int]:
+    st = path.stat()
+    return st.st_mtime_ns, st.st_size
+
+
+class PivotCache:
+    """results_dir 1つ分のピボットキャッシュ
+
+    get() は全ファイルの stat が前回と同じならキャッシュ済みピボットをそのまま返す。
+    返り値は共有オブジェクトなので呼び出し側で変更しないこと。
+    """
+
+    def __init__(self, results_dir: Path = RESULTS_DIR):
+        self.results_dir = results_dir
+        self.cache_path = results_dir / CACHE_FILENAME
+        self._lock = threading.Lock()
+        self._dictionary = KeyDictionary(KEY_COLS)
+        self._entries: dict[str, MonthEntry] = {}
+        self._columns: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+        self._store: tuple[str | None, list] = (None, [])  # (ストアの版, 月ラベルごとの集計)
+        self._stats: dict[str, tuple[int, int]] | None = None
+        self._pivot: pd.DataFrame | None = None
+        self._fingerprint = ""
+        self._load()
+
+    def get(self) -> pd.DataFrame:
+        return self.snapshot()[0]
+
+    def snapshot(self) -> tuple[pd.DataFrame, str]:
+        """(ピボット, 入力フィンガープリント) を同時に返す
+
+        フィンガープリントは全月ファイルの (ファイル名, sha256) から求めたハッシュで、
+        月別結果の内容が変わったときだけ変わる。
+        読み込み中に他のリクエスト・プロセスが月別結果を保存した場合（世代番号が進んだ、
+        ファイルが消えた）は読み直す。
+        """
+        with self._lock:
+            for attempt in range(READ_ATTEMPTS):
+                generation = read_generation(self.results_dir)
+                try:
+                    result = self._snapshot()
+                except FileNotFoundError:
+                    if attempt == READ_ATTEMPTS - 1:
+                        raise
+                    continue
+                if read_generation(self.results_dir) == generation:
+                    break
+            return result
+
+    def _snapshot(self) -> tuple[pd.DataFrame, str]:
+        stats = {f.name: _stat_key(f) for f in list_month_files(self.results_dir)}
+        version = store_version(self.results_dir)
+        if self._pivot is not None and stats == self._stats and version == self._store[0]:
+            return self._pivot, self._fingerprint
+
+        dirty = self._refresh_entries(stats)
+        for label in dirty:
+            self._rebuild_column(label)
+        store_changed = version != self._store[0]
+        if store_changed:
+            self._store = (version, read_store_codes(result_store(self.results_dir),
+                                                     self._dictionary) if version else [])
+        if dirty or store_changed or self._pivot is None:
+            parts = [(label, codes, counts) for label, (codes, counts) in self._columns.items()]
+            self._pivot = pivot_from_months(parts + self._store[1], self._dictionary)
+        self._fingerprint = self._compute_fingerprint()
+        self._stats = stats
+        self._save()
+        return self._pivot, self._fingerprint
+
+    def _compute_fingerprint(self) -> str:
+        h = hashlib.sha256(f"v{CACHE_VERSION}".encode())
+        for name in sorted(self._entries):
+            h.update(f"\n{name}:{self._entries[name].digest}".encode())
+        if self._store[0]:
+            h.update(f"\nstore:{self._store[0]}".encode())
+        return h.hexdigest()
+
+    def _refresh_entries(self, stats: dict[str, tuple[int, int]]) -> set[str]:
+        """変化したファイルを読み直し、再計算が必要な月列名を返す"""
+        dirty: set[str] = set()
+        # 途中でファイルが消えても状態が半端にならないよう、写しを更新して最後に差し替える
+        entries = dict(self._entries)
+        for name in set(entries) - set(stats):
+            dirty.add(entries.pop(name).label)
+
+        for name, stat in stats.items():
+            entry = entries.get(name)
+            if entry is not None and entry.stat == stat:
+                continue
+            path = self.results_dir / name
+            digest = file_digest(path)
+            if entry is not None and entry.digest == digest:
+                # touch されただけで内容は同一
+                entries[name] = replace(entry, stat=stat)
+                continue
+            part = read_month_codes(path, self._dictionary)
+            label, codes, counts = part if part is not None else (None, None, None)
+            if entry is not None:
+                dirty.add(entry.label)
+            dirty.add(label)
+            entries[name] = MonthEntry(stat, digest, label, codes, counts)
+
+        dirty.discard(None)
+        self._entries = entries
+        return dirty
+
+    def _rebuild_column(self, label: str) -> None:
+        """同じ月列名を持つファイルだけをコード上で合算し直す"""
+        entries = [e for e in self._entries.values() if e.label == label]
+        if not entries:
+            self._columns.pop(label, None)
+            return
+        codes = np.concatenate([e.codes for e in entries])
+        counts = np.concatenate([e.counts for e in entries])
+        inverse, keys = self._dictionary.unique_rows(codes)
+        sums = np.bincount(inverse, weights=counts, minlength=len(keys)).astype(np.int64)
+        self._columns[label] = (keys, sums)
+
+    def _load(self) -> None:
+        """ディスクキャッシュを読み込む。壊れている・版が違う・辞書と合わない場合は無視"""
+        try:
+            with np.load(self.cache_path, allow_pickle=False) as data:
+                meta = json.loads(data["meta"].tobytes().decode("utf-8"))
+                if meta.get("version") != CACHE_VERSION or meta.get("columns") != KEY_COLS:
+                    return
+                arrays = {name: data[name] for name in data.files if name != "meta"}
+            dictionary = KeyDictionary.from_labels(
+                {c: meta["labels"][c] for c in KEY_COLS})
+            sizes = np.array([dictionary.size(c) for c in KEY_COLS])
+
+            def codes(name: str) -> np.ndarray:
+                array = arrays[name]
+                if array.ndim != 2 or array.shape[1] != len(KEY_COLS) or (
+                        len(array) and (array.max(axis=0) >= sizes).any()):
+                    raise ValueError(f"辞書と合わないコード: {name}")
+                return array.astype(np.int32, copy=False)
+
+            entries = {}
+            for i, e in enumerate(meta["entries"]):
+                has_codes = e["label"] is not None
+                entries[e["name"]] = MonthEntry(
+                    tuple(e["stat"]), e["digest"], e["label"],
+                    codes(f"entry{i}_codes") if has_codes else None,
+                    arrays[f"entry{i}_counts"] if has_codes else None)
+            columns = {label: (codes(f"column{i}_keys"), arrays[f"column{i}_sums"])
+                       for i, label in enumerate(meta["column_labels"])}
+            store = (meta["store_version"],
+                     [(label, codes(f"store{i}_codes"), arrays[f"store{i}_counts"])
+                      for i, label in enumerate(meta["store_labels"])])
+        except (OSError, ValueError, KeyError, TypeError, zipfile.BadZipFile):
+            return
+        self._dictionary = dictionary
+        self._entries = entries
+        self._columns = columns
+        self._store = store
+
+    def _save(self) -> None:
+        """ディスクキャッシュを一時ファイル経由で置き換える"""
+        if not self.results_dir.exists():
+            return
+        arrays: dict[str, np.ndarray] = {}
+        entries = []
+        for i, (name, entry) in enumerate(self._entries.items()):
+            entries.append({"name": name, "stat": list(entry.stat), "digest": entry.digest,
+                            "label": entry.label})
+            if entry.label is not None:
+                arrays[f"entry{i}_codes"] = entry.codes
+                arrays[f"entry{i}_counts"] = entry.counts
+        for i, (keys, sums) in enumerate(self._columns.values()):
+            arrays[f"column{i}_keys"] = keys
+            arrays[f"column{i}_sums"] = sums
+        for i, (_, codes, counts) in enumerate(self._store[1]):
+            arrays[f"store{i}_codes"] = codes
+            arrays[f"store{i}_counts"] = counts
+        try:
+            meta = json.dumps({
+                "version": CACHE_VERSION,
+                "columns": KEY_COLS,
+                "labels": self._dictionary.labels(),
+                "entries": entries,
+                "column_labels": list(self._columns),
+                "store_version": self._store[0],
+                "store_labels": [label for label, _, _ in self._store[1]],
+            }, ensure_ascii=False).encode("utf-8")
+        except TypeError:  # JSON にできないラベル（通常はない）。キャッシュを書かない
+            return
+        try:
+            with atomic_path(self.cache_path) as tmp:
+                with tmp.open("wb") as f:
+                    np.savez(f, meta=np.frombuffer(meta, dtype=np.uint8), **arrays)
+        except OSError:
+            return
+        (self.results_dir / _LEGACY_CACHE_FILENAME).unlink(missing_ok=True)
+
+
+_caches: dict[Path, PivotCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_pivot_cache(results_dir: Path = RESULTS_DIR) -> PivotCache:
+    key = results_dir.resolve()
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = _caches[key] = PivotCache(results_dir)
+        return cache
+
+
+def cached_pivot(results_dir: Path = RESULTS_DIR) -> pd.DataFrame:
+    """build_pivot() のキャッシュ版。変化した月ファイルだけを読み直す"""
+    return get_pivot_cache(results_dir).get()
@@ -0,0 +1,238 @@
+"""
+ピボットの索引と検索
+
+キャッシュ済みピボットの各キー列について「値 → 行番号」の転置索引を作り、
+KEY_COLS の任意の組み合わせでの絞り込み・月範囲の指定・キー単位の合算・ページングを行う。
+索引はピボットのフィンガープリントが変わったときだけ作り直す。
+月別結果が SQLite ストアだけにある年度は store_query() で、絞り込みと合算を SQL で行う。
+"""
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from services.aggregator import KEY_COLS, MONTH_ORDER, RESULTS_DIR, query_store, result_store
+from services.pivot_cache import get_pivot_cache
+
+# クエリパラメータ名（英字）→ キー列名。キー列名そのものも使える
+FIELD_ALIASES = {
+    "grade": "学年",
+    "classroom": "教室",
+    "course": "講座名",
+    "class_type": "M/C",
+    "teacher": "担当",
+}
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+class QueryError(ValueError):
+    """検索条件が不正"""
+
+
+def key_column(name: str) -> str:
+    """パラメータ名をキー列名に。未知の名前は QueryError"""
+    column = FIELD_ALIASES.get(name, name)
+    if column not in KEY_COLS:
+        raise QueryError(f"未知の項目: {name}（{', '.join([*FIELD_ALIASES, *KEY_COLS])}）")
+    return column
+
+
+@dataclass
+class _Column:
+    labels: list            # コード → ラベル（欠損は None、最後）
+    codes: np.ndarray       # 行ごとのコード
+    postings: dict          # ラベル → 昇順の行番号配列
+
+
+class PivotIndex:
+    """ピボット1版分の索引（読み取り専用、スレッド間で共有してよい）"""
+
+    def __init__(self, pivot: pd.DataFrame):
+        self.months = [c for c in pivot.columns if c not in KEY_COLS]
+        self.rows = len(pivot)
+        self._values = (pivot[self.months].to_numpy(dtype=np.int64) if self.rows
+                        else np.zeros((0, len(self.months)), dtype=np.int64))
+        self._columns = {c: self._build(pivot[c]) for c in KEY_COLS if c in pivot.columns}
+
+    @staticmethod
+    def _build(values: pd.Series) -> _Column:
+        codes, uniques = pd.factorize(values, sort=True)
+        labels = [str(v) for v in uniques]
+        codes = np.where(codes < 0, len(labels), codes)  # 欠損は末尾のコード
+        labels.append(None)
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(labels) + 1))
+        postings = {label: order[bounds[i]:bounds[i + 1]]
+                    for i, label in enumerate(labels) if bounds[i] < bounds[i + 1]}
+        return _Column(labels, codes, postings)
+
+    def select(self, filters: dict[str, list[str]]) -> np.ndarray:
+        """条件に合う行番号（昇順）。列内は OR、列間は AND。値 "" は欠損に一致
+
+        最も行数の少ない条件の転置リストから始め、残りの条件は行ごとのコードで絞る。
+        """
+        conditions = []
+        for name, wanted in filters.items():
+            column = self._columns.get(key_column(name))
+            if column is None:
+                return np.zeros(0, dtype=np.int64)
+            labels = {v if v != "" else None for v in wanted}
+            parts = [column.postings[v] for v in labels if v in column.postings]
+            size = sum(len(p) for p in parts)
+            codes = np.array([column.codes[p[0]] for p in parts])
+            conditions.append((size, parts, column, codes))
+        if not conditions:
+            return np.arange(self.rows)
+
+        conditions.sort(key=lambda c: c[0])
+        _, parts, _, _ = conditions[0]
+        if not parts:
+            return np.zeros(0, dtype=np.int64)
+        rows = parts[0] if len(parts) == 1 else np.sort(np.concatenate(parts))
+        for _, _, column, codes in conditions[1:]:
+            rows = rows[np.isin(column.codes[rows], codes)]
+        return rows
+
+    def month_range(self, start: str | None = None, end: str | None = None) -> list[str]:
+        """年度順で start〜end に含まれる月列（省略時は端まで）"""
+        for m in (start, end):
+            if m is not None and m not in MONTH_ORDER:
+                raise QueryError(f"未知の月: {m}（例: 4月）")
+        lo = MONTH_ORDER.index(start) if start else 0
+        hi = MONTH_ORDER.index(end) if end else len(MONTH_ORDER) - 1
+        if lo > hi:
+            raise QueryError(f"月の範囲が逆です: {start}〜{end}")
+        wanted = set(MONTH_ORDER[lo:hi + 1])
+        return [m for m in self.months if m in wanted]
+
+    def query(self, filters: dict[str, list[str]] | None = None,
+              month_from: str | None = None, month_to: str | None = None,
+              group_by: list[str] | None = None,
+              offset: int = 0, limit: int = DEFAULT_LIMIT) -> dict:
+        """絞り込み・月範囲・合算・ページングした結果（JSON 化できる dict）
+
+        group_by を省略するとピボットの行をそのまま、指定するとその列の組ごとに合算して返す
+        （空リストなら全体の合計1行）。月の件数がすべて 0 の行は含めない。
+        """
+        if offset < 0 or not 0 < limit <= MAX_LIMIT:
+            raise QueryError(f"offset は 0 以上、limit は 1〜{MAX_LIMIT} で指定してください")
+        rows = self.select(filters or {})
+        months = self.month_range(month_from, month_to)
+        values = self._values[rows]
+        if months != self.months:
+            values = values[:, [self.months.index(m) for m in months]]
+
+        columns = KEY_COLS if group_by is None else [key_column(c) for c in group_by]
+        columns = [c for c in columns if c in self._columns]
+        if group_by is None:
+            keep = values.any(axis=1)
+            rows, values = rows[keep], values[keep]
+            codes = self._codes(columns, rows[offset:offset + limit])
+        else:
+            codes, values = _group_sum(self._codes(columns, rows), values)
+            keep = values.any(axis=1)
+            codes, values = codes[keep][offset:offset + limit], values[keep]
+
+        result_rows = [
+            {
+                **{c: self._columns[c].labels[code] for c, code in zip(columns, key)},
+                "counts": dict(zip(months, map(int, counts))),
+                "total": int(counts.sum()),
+            }
+            for key, counts in zip(codes.tolist(), values[offset:offset + limit])
+        ]
+        total = len(values)
+        return {
+            "months": months,
+            "group_by": columns,
+            "total_rows": total,
+            "offset": offset,
+            "limit": limit,
+            "next_offset": offset + limit if offset + limit < total else None,
+            "totals": dict(zip(months, map(int, values.sum(axis=0)))),
+            "rows": result_rows,
+        }
+
+    def _codes(self, columns: list[str], rows: np.ndarray) -> np.ndarray:
+        """rows の各列のコード（行 × 列）"""
+        if not columns:
+            return np.zeros((len(rows), 0), dtype=np.int64)
+        return np.stack([self._columns[c].codes[rows] for c in columns], axis=1)
+
+
+def _group_sum(codes: np.ndarray, values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """コード行ごとに件数を合算。グループはコード順（= ラベル順）"""
+    if codes.shape[1] == 0:
+        return codes[:1] if len(codes) else np.zeros((1, 0), dtype=np.int64), \
+            values.sum(axis=0, keepdims=True)
+    keys, inverse = np.unique(codes, axis=0, return_inverse=True)
+    sums = np.zeros((len(keys), values.shape[1]), dtype=np.int64)
+    np.add.at(sums, inverse.reshape(-1), values)
+    return keys, sums
+
+
+_indexes: dict[Path, tuple[str, PivotIndex]] = {}
+_indexes_lock = threading.Lock()
+
+
+def pivot_index(results_dir: Path = RESULTS_DIR) -> PivotIndex:
+    """キャッシュ済みピボットの索引。ピボットが変わったときだけ作り直す"""
+    pivot, fingerprint = get_pivot_cache(results_dir).snapshot()
+    key = results_dir.resolve()
+    with _indexes_lock:
+        cached = _indexes.get(key)
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+    index = PivotIndex(pivot)
+    with _indexes_lock:
+        _indexes[key] = (fingerprint, index)
+    return index
+
+
+def store_query(results_dir: Path, filters: dict[str, list[str]] | None = None,
+                month_from: str | None = None, month_to: str | None = None,
+                group_by: list[str] | None = None,
+                offset: int = 0, limit: int = DEFAULT_LIMIT) -> dict:
+    """SQLite ストアの年度で PivotIndex.query() と同じ結果を返す
+
+    絞り込みは SQL の WHERE、group_by 指定時の合算は ResultStore.totals() の GROUP BY で行い、
+    ピボット全体は読み込まない（索引を作るのは SQL の結果の小さな表だけ）。
+    """
+    conditions: dict[str, list[str]] = {}
+    for name, values in (filters or {}).items():
+        column = key_column(name)
+        # 同じ列の条件が別名で重なった場合は AND（値の共通部分）
+        conditions[column] = ([v for v in conditions[column] if v in values]
+                              if column in conditions else list(values))
+    store = result_store(results_dir)
+    if group_by is None:
+        columns = KEY_COLS
+        frame = query_store(conditions, results_dir)
+    else:
+        columns = list(dict.fromkeys(key_column(c) for c in group_by))
+        frame = _wide(store.totals(conditions, columns), columns)
+    # 絞り込みで現れなかった月・列も年度のピボットと同じく結果に含める
+    labels = [m for m in MONTH_ORDER if m in set(store.months().values())]
+    frame = frame.reindex(columns=[*columns, *labels])
+    frame[labels] = frame[labels].fillna(0).astype(np.int64)
+    return PivotIndex(frame).query(None, month_from, month_to, group_by, offset, limit)
+
+
+def _wide(totals: pd.DataFrame, columns: list[str]) -> pd.DataFrame:
+    """ResultStore.totals() の長形式（columns, label, count）を columns + 月列の表に"""
+    if totals.empty:
+        return pd.DataFrame()
+    if not columns:
+        return totals.groupby("label")["count"].sum().to_frame().T.reset_index(drop=True)
+    keyed = totals.assign(**{c: totals[c].astype(object).fillna("") for c in columns})
+    wide = keyed.pivot_table(index=columns, columns="label", values="count",
+                             aggfunc="sum", fill_value=0).reset_index()
+    wide.columns.name = None
+    for c in columns:
+        wide[c] = wide[c].where(wide[c] != "", np.nan)
+    return wide
@@ -0,0 +1,310 @@
+"""
+名簿 Excel の形式の事前確認
+
+load_excel() で全行を読む前に、シートの先頭（ヘッダーの Row 4 とデータの先頭 PREFLIGHT_ROWS 行）
+だけを読み、COLUMN_INDICES の配置どおりかを確かめる。
+- ヘッダー行の必須列（REQUIRED_FIELDS）が空でない
+- 受講追加日付（C）・受講取消日付（G）が日付、学年コード（P）が整数
+型は列ごとに多数決で判定し、確認した値（空欄と "-" などの PLACEHOLDERS を除く）の過半数が
+合わない列だけを形式違いとする。load_excel() が欠損として読む個別のセルでは弾かない。
+形式が違えば SchemaError（列と行を挙げたメッセージ）を送出する。
+
+シートの XML は先頭から必要な行まで読んで打ち切るため、名簿の行数によらず数ミリ秒で終わる。
+確認に通ったヘッダー行のフィンガープリントはプロセス内の LRU に保持し、同じテンプレートの
+2回目以降はヘッダー行だけを読んでデータ行の確認を省く。
+"""
+from __future__ import annotations
+
+import hashlib
+import io
+import threading
+import zipfile
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from collections.abc import Iterator
+from datetime import date, datetime
+from pathlib import Path
+from typing import BinaryIO
+
+import pandas as pd
+
+from services.aggregator import COLUMN_INDICES, HEADER_ROW
+
+PREFLIGHT_ROWS = 20  # 型を確認するデータ行数（空行を除く）
+CACHE_SIZE = 64
+MAX_PROBLEMS = 5  # メッセージに含める問題の数の上限
+# データ行で空欄と同じに扱う値（load_excel() では日付・学年コードとして読めず欠損になる）
+PLACEHOLDERS = frozenset({"-", "－", "ー", "―", "—", "なし", "未定", "N/A", "n/a", "NA"})
+
+# 集計に必須の列と表示名（性別・在籍校・学科はキューブの内訳用で、なくても集計できる）
+REQUIRED_FIELDS = {
+    "add_date": "受講追加日付",
+    "cancel_date": "受講取消日付",
+    "course": "講座名",
+    "class_type": "M/C",
+    "classroom": "受講教室",
+    "grade": "学年コード",
+    "teacher": "担当",
+}
+_DATE_FIELDS = ("add_date", "cancel_date")
+_GRADE_FIELD = "grade"
+
+
+class SchemaError(ValueError):
+    """名簿 Excel の形式が COLUMN_INDICES の配置と合わない"""
+
+    def __init__(self, problems: list[str]):
+        self.problems = problems
+        shown = problems[:MAX_PROBLEMS]
+        more = f"（ほか {len(problems) - len(shown)} 件）" if len(problems) > len(shown) else ""
+        super().__init__("、".join(shown) + more)
+
+
+_validated: OrderedDict[str, None] = OrderedDict()
+_validated_lock = threading.Lock()
+
+
+def preflight(file: bytes | Path | BinaryIO) -> str:
+    """file の先頭だけを読んで形式を確認し、ヘッダー行のフィンガープリントを返す
+
+    ファイルオブジェクトの位置は元に戻す。形式が違えば SchemaError。
+    """
+    if isinstance(file, (bytes, Path, str)):
+        return _preflight(io.BytesIO(file) if isinstance(file, bytes) else file)
+    position = file.tell()
+    try:
+        return _preflight(file)
+    finally:
+        file.seek(position)
+
+
+def clear_cache() -> None:
+    with _validated_lock:
+        _validated.clear()
+
+
+def _preflight(src) -> str:
+    width = max(COLUMN_INDICES.values()) + 1
+    try:
+        with zipfile.ZipFile(src) as zf:
+            head = _SheetHead(zf, width)
+            rows = head.rows(HEADER_ROW + 1)
+            header = next(rows, None)
+            if header is None or header[0] != HEADER_ROW + 1:
+                raise SchemaError([f"ヘッダー行（Row {HEADER_ROW + 1}）がありません"])
+            fingerprint = _fingerprint(header[1])
+            with _validated_lock:
+                if fingerprint in _validated:
+                    _validated.move_to_end(fingerprint)
+                    return fingerprint
+
+            problems = [f"ヘッダー行（Row {HEADER_ROW + 1}）の {_column(field)} 列（{label}）が空です"
+                        for field, label in REQUIRED_FIELDS.items()
+                        if _blank(header[1][COLUMN_INDICES[field]])]
+            checks = {field: _ColumnCheck() for field in (*_DATE_FIELDS, _GRADE_FIELD)}
+            sampled = 0
+            for number, row in rows:
+                if all(row[i] is None for i in COLUMN_INDICES.values()):
+                    continue
+                for field, check in checks.items():
+                    check.add(field, row[COLUMN_INDICES[field]], number)
+                sampled += 1
+                if sampled >= PREFLIGHT_ROWS:
+                    break
+            rows.close()
+            for check in checks.values():
+                problems += check.problems()
+    except (zipfile.BadZipFile, KeyError, IndexError, ValueError, ET.ParseError) as e:
+        if isinstance(e, SchemaError):
+            raise
+        raise SchemaError([f"Excel（.xlsx）ファイルとして読み込めません（{type(e).__name__}）"]) from e
+
+    if problems:
+        raise SchemaError(problems)
+    with _validated_lock:
+        _validated[fingerprint] = None
+        if len(_validated) > CACHE_SIZE:
+            _validated.popitem(last=False)
+    return fingerprint
+
+
+class _SheetHead:
+    """アクティブシートの XML を先頭から読み、必要な行だけを値のタプルにする
+
+    openpyxl はシートを開く時点で共有文字列表全体を読み、dimension のないシートでは
+    シート全体を走査するため使わない。共有文字列は参照された番号まで、書式は日付判定に
+    使う表示形式だけを読む。
+    """
+
+    def __init__(self, zf: zipfile.ZipFile, width: int):
+        self.zf = zf
+        self.width = width
+        self._strings: list[str] = []
+        self._string_iter = None
+        self._date_styles: list[bool] | None = None
+
+    def rows(self, min_row: int) -> Iterator[tuple[int, tuple]]:
+        """(行番号, width 列の値) を min_row 行目から順に返す（値のない行も含む）"""
+        expected = 1
+        with self.zf.open(self._sheet_path()) as f:
+            for _, element in ET.iterparse(f):
+                if element.tag != _ROW:
+                    continue
+                number = int(element.get("r") or expected)
+                expected = number + 1
+                if number >= min_row:
+                    yield number, self._row_values(element)
+                element.clear()
+
+    def _row_values(self, row: ET.Element) -> tuple:
+        values = [None] * self.width
+        position = 0
+        for cell in row.iter(_CELL):
+            ref = cell.get("r")
+            index = _column_index(ref) if ref else position
+            position = index + 1
+            if index < self.width:
+                values[index] = self._cell_value(cell)
+        return tuple(values)
+
+    def _cell_value(self, cell: ET.Element):
+        kind = cell.get("t", "n")
+        if kind == "inlineStr":
+            return "".join(t.text or "" for t in cell.iter(_TEXT))
+        raw = cell.findtext(_VALUE)
+        if raw is None:
+            return None
+        if kind == "s":
+            return self._shared_string(int(raw))
+        if kind in ("str", "e"):
+            return raw
+        if kind == "b":
+            return raw == "1"
+        if kind == "d":
+            return datetime.fromisoformat(raw)
+        number = float(raw)
+        if self._is_date_style(int(cell.get("s", 0))):
+            from openpyxl.utils.datetime import from_excel
+
+            return from_excel(number)
+        return int(number) if number.is_integer() else number
+
+    def _sheet_path(self) -> str:
+        workbook = ET.fromstring(self.zf.read("xl/workbook.xml"))
+        view = workbook.find(f"{_MAIN}bookViews/{_MAIN}workbookView")
+        active = int(view.get("activeTab", 0)) if view is not None else 0
+        sheet = workbook.findall(f"{_MAIN}sheets/{_MAIN}sheet")[active]
+        rel_id = sheet.get(f"{_REL}id")
+        rels = ET.fromstring(self.zf.read("xl/_rels/workbook.xml.rels"))
+        target = next(r.get("Target") for r in rels if r.get("Id") == rel_id)
+        return target[1:] if target.startswith("/") else f"xl/{target}"
+
+    def _shared_string(self, index: int) -> str:
+        """共有文字列表を index 番目まで読み進める"""
+        if self._string_iter is None:
+            self._string_iter = ET.iterparse(self.zf.open("xl/sharedStrings.xml"))
+        for _, element in self._string_iter:
+            if len(self._strings) > index:
+                break
+            if element.tag == _STRING_ITEM:
+                # ふりがな（rPh）の中の t は含めない
+                self._strings.append("".join(
+                    t.text or "" for t in [*element.findall(_TEXT), *element.findall(f"{_MAIN}r/{_TEXT}")]))
+                element.clear()
+        return self._strings[index]
+
+    def _is_date_style(self, style: int) -> bool:
+        if self._date_styles is None:
+            self._date_styles = self._read_date_styles()
+        return style < len(self._date_styles) and self._date_styles[style]
+
+    def _read_date_styles(self) -> list[bool]:
+        from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format
+
+        try:
+            styles = ET.fromstring(self.zf.read("xl/styles.xml"))
+        except KeyError:
+            return []
+        formats = dict(BUILTIN_FORMATS)
+        for fmt in styles.iter(f"{_MAIN}numFmt"):
+            formats[int(fmt.get("numFmtId"))] = fmt.get("formatCode", "")
+        xfs = styles.find(f"{_MAIN}cellXfs")
+        return [is_date_format(formats.get(int(xf.get("numFmtId", 0)), ""))
+                for xf in (xfs if xfs is not None else [])]
+
+
+_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_ROW = f"{_MAIN}row"
+_CELL = f"{_MAIN}c"
+_VALUE = f"{_MAIN}v"
+_TEXT = f"{_MAIN}t"
+_STRING_ITEM = f"{_MAIN}si"
+
+
+def _column_index(ref: str) -> int:
+    """セル参照（"AA5"）→ 0 始まりの列番号"""
+    index = 0
+    for ch in ref:
+        if not ch.isalpha():
+            break
+        index = index * 26 + ord(ch.upper()) - 64
+    return index - 1
+
+
+class _ColumnCheck:
+    """1列分の型の確認（多数決）"""
+
+    def __init__(self):
+        self.checked = 0
+        self.failures: list[str] = []
+
+    def add(self, field: str, value, number: int) -> None:
+        if _blank(value) or (isinstance(value, str) and value.strip() in PLACEHOLDERS):
+            return
+        self.checked += 1
+        if field == _GRADE_FIELD:
+            if not _is_integer(value):
+                self.failures.append(f"{_column(field)} 列（{REQUIRED_FIELDS[field]}）の "
+                                     f"Row {number} 「{value}」が学年コード（例: 31）ではありません")
+        elif not _is_date(value):
+            self.failures.append(f"{_column(field)} 列（{REQUIRED_FIELDS[field]}）の Row {number} "
+                                 f"「{value}」が日付ではありません")
+
+    def problems(self) -> list[str]:
+        """確認した値の過半数が合わなければその一覧、そうでなければ空"""
+        return self.failures if len(self.failures) * 2 > self.checked else []
+
+
+def _fingerprint(header: tuple) -> str:
+    payload = "\x1f".join("" if v is None else str(v) for v in header)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _column(field: str) -> str:
+    from openpyxl.utils import get_column_letter
+
+    return get_column_letter(COLUMN_INDICES[field] + 1)
+
+
+def _blank(value) -> bool:
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _is_date(value) -> bool:
+    """日付セル、または load_excel が日付として読める文字列（数値は不可）"""
+    if isinstance(value, date):
+        return True
+    if not isinstance(value, str):
+        return False
+    return not pd.isna(pd.to_datetime(value.strip(), errors="coerce", format="mixed"))
+
+
+def _is_integer(value) -> bool:
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, int):
+        return True
+    if isinstance(value, float):
+        return value.is_integer()
+    return isinstance(value, str) and value.strip().isdecimal()
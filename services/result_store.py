@@ -0,0 +1,253 @@
+"""
+月別結果の SQLite ストア（任意）
+
+月別結果を1つの SQLite ファイルに保存する。キーの組は keys 表に1回だけ持ち、results 表は
+(月, キー ID) を主キーとする件数だけを持つ。1ヶ月分の置き換えは1トランザクション内で行うため、
+読み手に途中の状態は見えない。WAL モードで開き、読み手を止めずに複数のワーカー
+（スレッド・プロセス）から書き込める。
+キーの欠損は空文字で保存し、読み出し時に欠損に戻す（CSV 経由と同じ意味）。
+"""
+from __future__ import annotations
+
+import sqlite3
+import threading
+import uuid
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+BUSY_TIMEOUT = 10.0  # 秒。他の書き込みトランザクションの終了を待つ上限
+SCHEMA_VERSION = 1
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+class ResultStore:
+    """key_cols をキー列とする月別結果のストア
+
+    indexed に挙げたキー列には単独の索引を張る。接続は操作ごとに開いて閉じるため、
+    インスタンスはスレッド間で共有してよい。
+    """
+
+    def __init__(self, path: Path, key_cols: list[str], indexed: Iterable[str] = ()):
+        self.path = path
+        self.key_cols = list(key_cols)
+        self.indexed = [c for c in indexed if c in self.key_cols]
+        self._keys = ", ".join(_quote(c) for c in self.key_cols)
+        self._ready = False
+        self._schema_lock = threading.Lock()
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        if not self.path.exists():
+            self._ready = False
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+        try:
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if not self._ready:
+                with self._schema_lock:
+                    if not self._ready:
+                        self._create_schema(conn)
+                        self._ready = True
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """書き込みトランザクション。BEGIN IMMEDIATE で書き込みロックを先に取る"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def _create_schema(self, conn: sqlite3.Connection) -> None:
+        conn.execute("PRAGMA journal_mode=WAL")
+        keys = "".join(f"{_quote(c)} TEXT NOT NULL DEFAULT '', " for c in self.key_cols)
+        indexes = "".join(
+            f"CREATE INDEX IF NOT EXISTS {_quote('keys_' + c)} ON keys({_quote(c)});"
+            for c in self.indexed)
+        conn.executescript(f"""
+            BEGIN IMMEDIATE;
+            CREATE TABLE IF NOT EXISTS keys (
+                id INTEGER PRIMARY KEY,
+                {keys}
+                UNIQUE ({self._keys})
+            );
+            CREATE TABLE IF NOT EXISTS months (
+                month TEXT PRIMARY KEY,
+                label TEXT NOT NULL,
+                rows INTEGER NOT NULL,
+                generation INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS results (
+                month TEXT NOT NULL REFERENCES months(month),
+                key_id INTEGER NOT NULL REFERENCES keys(id),
+                count INTEGER NOT NULL,
+                PRIMARY KEY (month, key_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS results_key ON results(key_id);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            {indexes}
+            INSERT OR IGNORE INTO meta VALUES ('schema', '{SCHEMA_VERSION}');
+            INSERT OR IGNORE INTO meta VALUES ('store_id', '{uuid.uuid4().hex}');
+            INSERT OR IGNORE INTO meta VALUES ('generation', '0');
+            COMMIT;
+        """)
+
+    @staticmethod
+    def _next_generation(conn: sqlite3.Connection) -> int:
+        """書き込みごとに1増える世代番号（月を削除しても戻らない）"""
+        conn.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'generation'")
+        return int(conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()[0])
+
+    def replace_month(self, df: pd.DataFrame, month: str) -> int:
+        """month の結果を df で置き換え、書き込んだ行数を返す
+
+        df は key_cols と月列1つ（列名が月ラベル）を持つ集計結果。旧い行の削除と
+        新しい行の upsert（同じキーの重複は合算）を1トランザクションで行う。
+        """
+        labels = [c for c in df.columns if c not in self.key_cols]
+        if len(labels) != 1:
+            raise ValueError(f"月列がちょうど1つ必要です: {labels}")
+        label = labels[0]
+        keys = list(zip(*(_stored_keys(df[c]) if c in df.columns else [""] * len(df)
+                          for c in self.key_cols)))
+        counts = pd.to_numeric(df[label], errors="coerce").fillna(0).astype(np.int64).tolist()
+
+        marks = ", ".join("?" * len(self.key_cols))
+        match = " AND ".join(f"{_quote(c)} = ?" for c in self.key_cols)
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM results WHERE month = ?", (month,))
+            conn.execute("INSERT OR REPLACE INTO months VALUES (?, ?, ?, ?)",
+                         (month, label, len(keys), self._next_generation(conn)))
+            conn.executemany(f"INSERT OR IGNORE INTO keys ({self._keys}) VALUES ({marks})", keys)
+            conn.executemany(
+                f"INSERT INTO results (month, key_id, count) SELECT ?, id, ? FROM keys WHERE {match} "
+                "ON CONFLICT (month, key_id) DO UPDATE SET count = count + excluded.count",
+                [(month, count, *key) for key, count in zip(keys, counts)])
+        return len(keys)
+
+    def delete_months(self, months: Iterable[str]) -> list[str]:
+        """指定した月の結果を削除し、実際に削除した月を返す"""
+        months = list(months)
+        with self._transaction() as conn:
+            deleted = [m for m in months
+                       if conn.execute("DELETE FROM months WHERE month = ?", (m,)).rowcount]
+            for m in deleted:
+                conn.execute("DELETE FROM results WHERE month = ?", (m,))
+            if deleted:
+                self._next_generation(conn)
+        return deleted
+
+    def retain(self, months: Iterable[str]) -> list[str]:
+        """months 以外の月の結果を削除し、削除した月を返す"""
+        keep = set(months)
+        return self.delete_months(m for m in self.months() if m not in keep)
+
+    def months(self) -> dict[str, str]:
+        """保存済みの {月: 月ラベル}（月の昇順）"""
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT month, label FROM months ORDER BY month"))
+
+    def month_frame(self, month: str) -> pd.DataFrame | None:
+        """month の結果を replace_month に渡した形（key_cols + 月ラベル列）で返す。なければ None"""
+        columns = "".join(f"k.{_quote(c)}, " for c in self.key_cols)
+        with self._connect() as conn:
+            row = conn.execute("SELECT label FROM months WHERE month = ?", (month,)).fetchone()
+            if row is None:
+                return None
+            records = conn.execute(
+                f"SELECT {columns}r.count FROM results r JOIN keys k ON k.id = r.key_id "
+                "WHERE r.month = ? ORDER BY r.key_id", (month,)).fetchall()
+        frame = pd.DataFrame.from_records(records, columns=[*self.key_cols, row[0]])
+        frame[row[0]] = frame[row[0]].astype(np.int64)
+        return _restore_missing(frame, self.key_cols)
+
+    def key_count(self) -> int:
+        """件数のあるキーの組の数（全月のピボットの行数）"""
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT COUNT(DISTINCT key_id) FROM results WHERE count <> 0").fetchone()[0]
+
+    def version(self) -> str:
+        """内容の版。書き込みのたびに変わり、ストアを作り直した場合も以前の値に戻らない"""
+        with self._connect() as conn:
+            meta = dict(conn.execute("SELECT key, value FROM meta"))
+        return f"{meta['store_id']}:{meta['generation']}"
+
+    def _where(self, filters: dict[str, list[str]] | None) -> tuple[str, list[str]]:
+        """keys 表に対する WHERE 句（列内は OR、列間は AND、"" は欠損に一致）"""
+        where, params = [], []
+        for c, values in (filters or {}).items():
+            if c not in self.key_cols:
+                raise ValueError(f"未知のキー列: {c}")
+            where.append(f"{_quote(c)} IN ({', '.join('?' * len(values))})")
+            params += [str(v) for v in values]
+        return (f" WHERE {' AND '.join(where)}" if where else ""), params
+
+    def keys(self, filters: dict[str, list[str]] | None = None) -> pd.DataFrame:
+        """filters に合うキーの表（index はキー ID、欠損は NaN）"""
+        where, params = self._where(filters)
+        with self._connect() as conn:
+            records = conn.execute(f"SELECT id, {self._keys} FROM keys{where} ORDER BY id",
+                                   params).fetchall()
+        frame = pd.DataFrame.from_records(records, columns=["id", *self.key_cols], index="id")
+        return _restore_missing(frame, self.key_cols)
+
+    def cells(self, filters: dict[str, list[str]] | None = None
+              ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(キー ID, 月ラベル, 件数) の配列。月ラベルとキーの組ごとに SQL で合算"""
+        where, params = self._where(filters)
+        keyed = f" WHERE r.key_id IN (SELECT id FROM keys{where})" if where else ""
+        with self._connect() as conn:
+            records = conn.execute(
+                "SELECT r.key_id, m.label, SUM(r.count) FROM results r "
+                f"JOIN months m ON m.month = r.month{keyed} GROUP BY m.label, r.key_id",
+                params).fetchall()
+        if not records:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=object), np.zeros(0, dtype=np.int64)
+        ids, labels, counts = zip(*records)
+        return (np.array(ids, dtype=np.int64), np.array(labels, dtype=object),
+                np.array(counts, dtype=np.int64))
+
+    def totals(self, filters: dict[str, list[str]] | None = None,
+               group_by: list[str] | None = None) -> pd.DataFrame:
+        """月ラベルごとの件数の合計を SQL で集計した長形式（group_by の列, label, count）
+
+        filters は {キー列: 値のリスト}。group_by 省略時は全キー列ごと。キーの欠損は NaN で返す。
+        """
+        group = self.key_cols if group_by is None else list(group_by)
+        for c in group:
+            if c not in self.key_cols:
+                raise ValueError(f"未知のキー列: {c}")
+        where, params = self._where(filters)
+        columns = "".join(f"k.{_quote(c)}, " for c in group)
+        with self._connect() as conn:
+            records = conn.execute(
+                f"SELECT {columns}m.label, SUM(r.count) FROM results r "
+                f"JOIN months m ON m.month = r.month JOIN keys k ON k.id = r.key_id{where} "
+                f"GROUP BY {columns}m.label", params).fetchall()
+        frame = pd.DataFrame.from_records(records, columns=[*group, "label", "count"])
+        frame["count"] = frame["count"].astype(np.int64)
+        return _restore_missing(frame, group)
+
+
+def _stored_keys(s: pd.Series) -> list[str]:
+    """キー値を保存用の文字列に（欠損は空文字）"""
+    return ["" if pd.isna(v) else str(v) for v in s.astype(object)]
+
+
+def _restore_missing(frame: pd.DataFrame, columns: list[str]) -> pd.DataFrame:
+    for c in columns:
+        frame[c] = frame[c].astype(object).where(frame[c] != "", np.nan)
+    return frame
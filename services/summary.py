@@ -0,0 +1,81 @@
+"""
+年度ごとの集計サマリー
+
+トップ画面に出す月の一覧・月別総計・ピボットの行数を results_dir/.summary.json に保存する。
+サマリーは書いた時点の世代番号（services/atomic_io.py）を持ち、読み込み時に現在の世代番号と
+違えば（月別結果が保存・削除された後なら）無効として扱う。ピボットを組み立てたときに書くため、
+画面表示ではピボットを読み直さずにこの JSON だけを読めばよい。
+月別結果が SQLite ストアだけにある年度は write_store_summary() で、ピボットを組み立てずに SQL の集計から作る。
+Web アプリ・CLI 以外で月別結果を書き換えたとき（scripts/migrate_results.py）は refresh_summary() で作り直す。
+"""
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import pandas as pd
+
+from services.aggregator import MONTH_ORDER, result_store, store_only
+from services.atomic_io import atomic_path, read_generation
+from services.cube import pivot_month_totals
+
+SUMMARY_FILENAME = ".summary.json"
+
+
+def summary_path(results_dir: Path) -> Path:
+    return results_dir / SUMMARY_FILENAME
+
+
+def write_summary(results_dir: Path, pivot: pd.DataFrame, generation: int) -> dict:
+    """pivot から作ったサマリーを保存して返す
+
+    generation はピボットを読み込む前に読んだ世代番号（読み込み中に保存が重なった場合は
+    古い番号で保存され、次の読み込みで作り直される）。
+    """
+    totals = pivot_month_totals(results_dir, pivot) if not pivot.empty else {}
+    return _save(results_dir, generation, totals, len(pivot))
+
+
+def write_store_summary(results_dir: Path, generation: int) -> dict:
+    """SQLite ストアの月ラベルごとの合計（ResultStore.totals()）から作ったサマリーを保存して返す"""
+    store = result_store(results_dir)
+    totals = store.totals(group_by=[])
+    by_label = dict(zip(totals["label"], totals["count"]))
+    month_totals = {label: int(by_label[label]) for label in MONTH_ORDER if label in by_label}
+    return _save(results_dir, generation, month_totals, store.key_count() if month_totals else 0)
+
+
+def refresh_summary(results_dir: Path) -> dict:
+    """現在の月別結果からサマリーを作り直して保存する（SQLite ストアだけの年度は SQL の集計から）"""
+    from services.pivot_cache import cached_pivot
+
+    generation = read_generation(results_dir)
+    if store_only(results_dir):
+        return write_store_summary(results_dir, generation)
+    return write_summary(results_dir, cached_pivot(results_dir), generation)
+
+
+def _save(results_dir: Path, generation: int, totals: dict[str, int], rows: int) -> dict:
+    summary = {
+        "generation": generation,
+        "months": list(totals),
+        "month_totals": totals,
+        "total_rows": rows,
+    }
+    if results_dir.exists():
+        with atomic_path(summary_path(results_dir)) as tmp:
+            tmp.write_text(json.dumps(summary, ensure_ascii=False), encoding="utf-8")
+    return summary
+
+
+def read_summary(results_dir: Path, generation: int | None = None) -> dict | None:
+    """現在の世代番号（generation 省略時は読み込む）のサマリー。ない・古い・壊れていれば None"""
+    if generation is None:
+        generation = read_generation(results_dir)
+    try:
+        summary = json.loads(summary_path(results_dir).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if not isinstance(summary, dict) or summary.get("generation") != generation:
+        return None
+    return summary
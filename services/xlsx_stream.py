@@ -0,0 +1,225 @@
+"""
+ストリーミング XLSX 書き出し
+
+DataFrame を1シートの XLSX として、行ごとに XML を生成しながら ZIP に流し込む。
+出力はチャンク（bytes）のイテレータとして得られ、全体をメモリ上に組み立てない。
+文字列はインライン文字列（共有文字列表なし）、ヘッダー行は太字。
+シートが ZIP64 の上限を超えうる大きさの場合だけ ZIP64 で書く（小さいファイルは通常の ZIP のまま）。
+"""
+from __future__ import annotations
+
+import math
+import re
+import zipfile
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from xml.sax.saxutils import escape, quoteattr
+
+import pandas as pd
+
+CHUNK_SIZE = 64 * 1024
+
+# シート XML の見積もりがこれを超えるときだけ ZIP64 で書く（zipfile が ZIP64 なしで書ける上限）
+ZIP64_THRESHOLD = zipfile.ZIP64_LIMIT
+# 見積もりに使う1セル・1行あたりの XML の最大長（r="XFD1048576" s="1" などを含む）
+_NUMBER_CELL_BYTES = 64
+_TEXT_CELL_BYTES = 96
+_ROW_BYTES = 32
+# 1文字あたりの最大バイト数（UTF-8 の4バイト、または & のエスケープ "&amp;" の5バイト）
+_CHAR_BYTES = 5
+
+# XML 1.0 で使えない制御文字
+_ILLEGAL_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name={name} sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+    'Target="styles.xml"/>'
+    '</Relationships>'
+)
+# スタイル 0 = 標準、1 = 太字（ヘッダー）
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<sheetData>'
+)
+_SHEET_TAIL = '</sheetData></worksheet>'
+
+
+class _ChunkSink:
+    """ZipFile の書き込み先。書かれたバイト列を溜め、drain() で取り出す（シーク不可）"""
+
+    def __init__(self):
+        self._parts: list[bytes] = []
+        self._size = 0
+        self._pos = 0
+
+    def write(self, data: bytes) -> int:
+        self._parts.append(bytes(data))
+        self._size += len(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self) -> None:
+        pass
+
+    def seekable(self) -> bool:
+        return False
+
+    @property
+    def pending(self) -> int:
+        return self._size
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        self._size = 0
+        return data
+
+
+def _column_letter(index: int) -> str:
+    """0 始まりの列番号 → Excel 列名（0 → A）"""
+    letters = ""
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def _cell(ref: str, value, style: int = 0) -> str:
+    s = f' s="{style}"' if style else ""
+    if value is None or value is pd.NA or value is pd.NaT:
+        return ""
+    if isinstance(value, bool):
+        return f'<c r="{ref}" t="b"{s}><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        if isinstance(value, float) and not math.isfinite(value):
+            return ""
+        return f'<c r="{ref}"{s}><v>{value}</v></c>'
+    text = escape(_ILLEGAL_XML.sub("", str(value)))
+    return f'<c r="{ref}" t="inlineStr"{s}><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _row(number: int, letters: list[str], values: Iterable, style: int = 0) -> str:
+    cells = "".join(_cell(f"{col}{number}", v, style) for col, v in zip(letters, values))
+    return f'<row r="{number}">{cells}</row>'
+
+
+def sheet_size_bound(df: pd.DataFrame) -> int:
+    """df のシート XML の大きさの上限の見積もり（バイト）
+
+    数値列は1セルの最大長、それ以外の列はヘッダーと値の最長の文字列から求める。
+    """
+    width = 0
+    for name in df.columns:
+        column = df[name]
+        longest = len(str(name))
+        if pd.api.types.is_numeric_dtype(column):
+            width += max(_NUMBER_CELL_BYTES, _TEXT_CELL_BYTES + longest * _CHAR_BYTES)
+            continue
+        if len(column):
+            longest = max(longest, int(column.astype(str).str.len().max()))
+        width += _TEXT_CELL_BYTES + longest * _CHAR_BYTES
+    return len(_SHEET_HEAD) + len(_SHEET_TAIL) + (len(df) + 1) * (_ROW_BYTES + width)
+
+
+def _write_workbook(zf: zipfile.ZipFile, df: pd.DataFrame, sheet_name: str) -> Iterator[None]:
+    """zf に XLSX の各パートを書く。シートの行を書くごとに yield する"""
+    letters = [_column_letter(i) for i in range(len(df.columns))]
+    zf.writestr("[Content_Types].xml", _CONTENT_TYPES)
+    zf.writestr("_rels/.rels", _ROOT_RELS)
+    zf.writestr("xl/workbook.xml", _WORKBOOK.format(name=quoteattr(sheet_name[:31])))
+    zf.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS)
+    zf.writestr("xl/styles.xml", _STYLES)
+
+    zip64 = sheet_size_bound(df) > ZIP64_THRESHOLD
+    with zf.open("xl/worksheets/sheet1.xml", "w", force_zip64=zip64) as sheet:
+        sheet.write(_SHEET_HEAD.encode("utf-8"))
+        sheet.write(_row(1, letters, [str(c) for c in df.columns], style=1).encode("utf-8"))
+        for number, values in enumerate(df.itertuples(index=False, name=None), start=2):
+            sheet.write(_row(number, letters, _native(values)).encode("utf-8"))
+            yield
+        sheet.write(_SHEET_TAIL.encode("utf-8"))
+
+
+def iter_xlsx(df: pd.DataFrame, sheet_name: str = "Sheet1",
+              chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """df を XLSX として書き出し、chunk_size 程度のチャンクを順に返す"""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for _ in _write_workbook(zf, df, sheet_name):
+            if sink.pending >= chunk_size:
+                yield sink.drain()
+    if sink.pending:
+        yield sink.drain()
+
+
+def _native(values: tuple) -> Iterator:
+    """numpy スカラーを Python 型に変換（NaN は None）"""
+    for v in values:
+        if hasattr(v, "item"):
+            v = v.item()
+        if isinstance(v, float) and math.isnan(v):
+            v = None
+        yield v
+
+
+def write_xlsx(df: pd.DataFrame, path: Path, sheet_name: str = "Sheet1") -> None:
+    """df を XLSX としてファイルに直接書き出す
+
+    シーク可能なファイルに書くため、各パートのサイズはローカルヘッダーに書き戻される（データ記述子なし）。
+    """
+    with path.open("wb") as f, zipfile.ZipFile(f, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for _ in _write_workbook(zf, df, sheet_name):
+            pass
@@ -0,0 +1,29 @@
+"""
+テスト共通のフィクスチャ
+
+成果物を置く outputs と月別結果の保存先の年度ディレクトリ（一時ディレクトリ内）。
+データフレームを作るヘルパーは tests/helpers.py。
+"""
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from services.aggregator import fiscal_year_dir
+
+
+@pytest.fixture
+def output_dir():
+    """成果物を置く空のディレクトリ（一時ディレクトリ内の outputs）"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        output_dir = Path(tmpdir) / "outputs"
+        output_dir.mkdir()
+        yield output_dir
+
+
+@pytest.fixture
+def results_dir(output_dir):
+    """空の年度ディレクトリ（output_dir/results/FY2025）"""
+    results_dir = fiscal_year_dir(output_dir / "results", 2025)
+    results_dir.mkdir(parents=True)
+    return results_dir
@@ -0,0 +1,38 @@
+"""
+テスト共通のヘルパー
+
+月別結果のデータフレームを作る（フィクスチャは tests/conftest.py）。
+"""
+import pandas as pd
+
+KEY_ROWS = [
+    ("高1", "Room A", "English", "【マスター】", "田中"),
+    ("高2", "Room B", "English", "【コア】", "鈴木"),
+    ("高3", "Room A", "Math", "", "佐藤"),
+]
+
+
+def month_df(label: str, counts: list[int]) -> pd.DataFrame:
+    """KEY_ROWS の先頭から len(counts) 行に人数 counts を入れた月別結果"""
+    rows = KEY_ROWS[:len(counts)]
+    return pd.DataFrame({
+        "学年": [row[0] for row in rows],
+        "教室": [row[1] for row in rows],
+        "講座名": [row[2] for row in rows],
+        "M/C": [row[3] for row in rows],
+        "担当": [row[4] for row in rows],
+        label: counts,
+    })
+
+
+def uniform_month_df(label: str, count: int, rows: int = 3) -> pd.DataFrame:
+    """教室だけが異なる rows 行すべてに人数 count を入れた月別結果"""
+    return pd.DataFrame({
+        "学年": ["高1"] * rows,
+        "教室": [f"Room {i}" for i in range(rows)],
+        "講座名": ["English"] * rows,
+        "M/C": ["【マスター】"] * rows,
+        "担当": ["田中"] * rows,
+        label: [count] * rows,
+    })
+
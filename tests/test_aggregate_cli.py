@@ -0,0 +1,201 @@
+"""
+scripts/aggregate.py のテスト
+
+一時ディレクトリのプロジェクト（lists/ に合成名簿）で main() を実行し、
+--jobs の並列実行が逐次実行と同じ結果になること、失敗時の終了コードと未着手ファイルの取り消し、
+差分実行（変化のないファイルの再利用・--force・入力の削除に伴う月別結果の削除）を検証。
+"""
+import re
+import shutil
+import sqlite3
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from benchmarks.roster import cached_roster
+from scripts import aggregate
+from services import aggregator
+from services.aggregator import RESULTS_DB, fiscal_year_dir
+from services.atomic_io import read_generation
+from services.cube import cube_path
+
+MONTH_FILES = ["roster_2504.xlsx", "roster_2505.xlsx", "roster_2506.xlsx", "roster_2507.xlsx"]
+MONTHS = ["2025-04", "2025-05", "2025-06", "2025-07"]
+_MONTH_LINE = re.compile(r"^  (\d{4}-\d{2}): ", re.MULTILINE)
+_UNCHANGED_LINE = re.compile(r"^  (\d{4}-\d{2}): unchanged ", re.MULTILINE)
+
+
+@pytest.fixture(scope="module")
+def roster():
+    """合成名簿（各月のファイルはこのコピー）"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        yield cached_roster(Path(tmpdir), 300, seed=5)
+
+
+@pytest.fixture
+def make_project(monkeypatch, roster):
+    """lists/ に名簿を置いた一時プロジェクトを作り、aggregate.project_root をそこに向ける関数"""
+    tmpdirs = []
+
+    def make(names=MONTH_FILES, broken=()):
+        tmpdir = tempfile.TemporaryDirectory()
+        tmpdirs.append(tmpdir)
+        root = Path(tmpdir.name)
+        lists = root / "lists"
+        lists.mkdir()
+        for name in names:
+            shutil.copy(roster, lists / name)
+        for name in broken:
+            (lists / name).write_bytes(b"not a workbook")
+        monkeypatch.setattr(aggregate, "project_root", root)
+        return root
+
+    yield make
+    for tmpdir in tmpdirs:
+        tmpdir.cleanup()
+
+
+def _run(capsys, *argv: str) -> tuple[int, str]:
+    code = aggregate.main(list(argv))
+    return code, capsys.readouterr().out
+
+
+def _result_files(root: Path) -> dict[str, bytes]:
+    """outputs/results 以下の月別結果・キューブ（"." 始まりのマニフェスト・キャッシュ・ロックは除く）"""
+    results = root / "outputs" / "results"
+    return {p.relative_to(results).as_posix(): p.read_bytes() for p in sorted(results.rglob("*"))
+            if p.is_file() and not any(part.startswith(".") for part in p.relative_to(results).parts)}
+
+
+def _sheet_xml(path: Path) -> bytes:
+    with zipfile.ZipFile(path) as zf:
+        return zf.read("xl/worksheets/sheet1.xml")
+
+
+class TestJobs:
+    """--jobs の並列実行"""
+
+    def test_parallel_matches_sequential(self, make_project, capsys):
+        """出力順は入力順で、月別結果・キューブ・Excel のシートは逐次実行とバイト単位で一致"""
+        serial = make_project()
+        serial_code, serial_out = _run(capsys, "--jobs", "1")
+        parallel = make_project()
+        parallel_code, parallel_out = _run(capsys, "--jobs", "2")
+
+        assert serial_code == parallel_code == 0
+        assert _MONTH_LINE.findall(serial_out) == _MONTH_LINE.findall(parallel_out) == MONTHS
+        assert _result_files(serial) == _result_files(parallel)
+        assert len(_result_files(parallel)) >= len(MONTHS)
+        export = Path("outputs") / "monthly_stats_FY2025.xlsx"
+        assert _sheet_xml(serial / export) == _sheet_xml(parallel / export)
+
+    def test_broken_workbook_fails(self, make_project, capsys):
+        """読めない Excel があれば終了コード 1"""
+        make_project(broken=["roster_2505.xlsx"])
+
+        code, out = _run(capsys, "--jobs", "2")
+
+        assert code == 1
+        assert "Error (2025-05)" in out
+
+    def test_pending_files_cancelled(self, make_project, capsys, monkeypatch):
+        """失敗で中断したら未着手のファイルを取り消し、それ以降の月は保存しない"""
+        pools = []
+
+        class RecordingPool(ProcessPoolExecutor):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                self.futures = []
+                self.shutdown_kwargs = None
+                pools.append(self)
+
+            def submit(self, *args, **kwargs):
+                future = super().submit(*args, **kwargs)
+                self.futures.append(future)
+                return future
+
+            def shutdown(self, *args, **kwargs):
+                self.shutdown_kwargs = kwargs
+                super().shutdown(*args, **kwargs)
+
+        monkeypatch.setattr(aggregate, "ProcessPoolExecutor", RecordingPool)
+        names = [f"roster_25{month:02d}.xlsx" for month in range(5, 13)]
+        root = make_project(names=names, broken=["roster_2504.xlsx"])
+
+        code, out = _run(capsys, "--jobs", "2")
+
+        assert code == 1
+        (pool,) = pools
+        assert pool.shutdown_kwargs == {"wait": True, "cancel_futures": True}
+        assert all(future.done() for future in pool.futures)
+        assert any(future.cancelled() for future in pool.futures)
+        assert _MONTH_LINE.findall(out) == []
+        assert _result_files(root) == {}
+
+
+def _year_dir(root: Path) -> Path:
+    return fiscal_year_dir(root / "outputs" / "results", 2025)
+
+
+class TestIncremental:
+    """マニフェストによる差分実行"""
+
+    def test_second_run_reuses_results(self, make_project, capsys):
+        """2回目は変化のないファイルを集計せず、月別結果を書き直さない"""
+        root = make_project()
+        _run(capsys, "--jobs", "1")
+        files = _result_files(root)
+        mtimes = {p: p.stat().st_mtime_ns for p in _year_dir(root).rglob("*.csv")}
+        generation = read_generation(_year_dir(root))
+
+        code, out = _run(capsys, "--jobs", "1")
+
+        assert code == 0
+        assert _UNCHANGED_LINE.findall(out) == _MONTH_LINE.findall(out) == MONTHS
+        assert _result_files(root) == files
+        assert {p: p.stat().st_mtime_ns for p in mtimes} == mtimes
+        assert read_generation(_year_dir(root)) == generation
+
+    def test_force_rebuilds_all(self, make_project, capsys):
+        """--force は変化のないファイルも含めて全月を集計し直す"""
+        root = make_project()
+        _run(capsys, "--jobs", "1")
+        files = _result_files(root)
+        generation = read_generation(_year_dir(root))
+
+        code, out = _run(capsys, "--force")
+
+        assert code == 0
+        assert _UNCHANGED_LINE.findall(out) == []
+        assert _MONTH_LINE.findall(out) == MONTHS
+        assert _result_files(root) == files
+        assert read_generation(_year_dir(root)) > generation
+
+    @pytest.mark.parametrize("fmt", ["csv", "sqlite"])
+    def test_removed_input_drops_month(self, make_project, capsys, monkeypatch, fmt):
+        """入力を削除した月の月別結果・キューブ・SQLite の行を削除し、世代番号を進める"""
+        monkeypatch.setattr(aggregator, "RESULTS_FORMAT", fmt)
+        root = make_project()
+        _run(capsys, "--jobs", "1")
+        year_dir = _year_dir(root)
+        generation = read_generation(year_dir)
+        assert cube_path(year_dir, "2025-06").exists()
+
+        (root / "lists" / "roster_2506.xlsx").unlink()
+        code, out = _run(capsys, "--jobs", "1")
+
+        assert code == 0
+        assert _UNCHANGED_LINE.findall(out) == ["2025-04", "2025-05", "2025-07"]
+        assert cube_path(year_dir, "2025-05").exists()
+        assert not cube_path(year_dir, "2025-06").exists()
+        assert read_generation(year_dir) > generation
+        if fmt == "csv":
+            assert sorted(p.stem for p in year_dir.glob("*.csv")) == ["2025-04", "2025-05", "2025-07"]
+        else:
+            with sqlite3.connect(year_dir / RESULTS_DB) as conn:
+                months = [m for (m,) in conn.execute("SELECT DISTINCT month FROM results ORDER BY month")]
+                listed = [m for (m,) in conn.execute("SELECT month FROM months ORDER BY month")]
+            assert months == listed == ["2025-04", "2025-05", "2025-07"]
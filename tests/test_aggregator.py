@@ -7,18 +7,34 @@ import io
 import tempfile
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 import pytest
 
 from services.aggregator import (
     COLUMN_INDICES,
+    CUBE_COLS,
     GRADE_LABELS,
     KEY_COLS,
     MONTH_ORDER,
     aggregate,
+    aggregate_batches,
+    aggregate_cube,
+    aggregate_range,
     build_pivot,
+    combine_month_frames,
+    fiscal_year_dir,
+    fiscal_year_of,
+    iter_excel_batches,
+    list_fiscal_years,
     load_excel,
+    load_excel_full,
+    month_partition,
     parse_target_month,
+    partition_legacy_results,
+    read_month_frame,
+    result_store,
+    rollup,
     save_monthly_result,
 )
 
@@ -90,6 +106,74 @@ class TestLoadExcel:
             df = load_excel(xlsx_path)
             assert isinstance(df, pd.DataFrame)
 
+    def _create_roster_workbook(self) -> bytes:
+        """COLUMN_INDICES 配置の名簿 Excel（Row 1-3 タイトル、Row 4 ヘッダー）"""
+        from datetime import datetime
+
+        from openpyxl import Workbook
+
+        rows = [
+            # add_date, cancel_date, course, class_type, classroom, grade, teacher
+            (datetime(2025, 4, 1), None, "英語ｱﾄﾞﾊﾞﾝｽ", "【マスター】", "本校", 31, "田中"),
+            (datetime(2025, 4, 3), None, "英語ｱﾄﾞﾊﾞﾝｽ", "【コア】", "本校", 31, "田中"),
+            (datetime(2025, 4, 5), datetime(2025, 4, 20), "数学", "【コア】", "本校", 32, "鈴木"),
+            ("2025/04/07", None, "数学", None, "駅前", 33, "鈴木"),
+            (datetime(2025, 4, 9), None, "数学", "【コア】", "駅前", 32, 0),
+            (datetime(2025, 4, 11), None, "国語", "【マスター】", "駅前", 21, "佐藤"),
+            (datetime(2025, 5, 2), None, "国語", "【マスター】", "駅前", 33, "佐藤"),
+            (datetime(2025, 4, 12), None, "国語", "【マスター】", "駅前", 33, " 佐藤 "),
+        ]
+        wb = Workbook()
+        ws = wb.active
+        ws.append(["受講者リスト"])
+        ws.append([])
+        ws.append([])
+        ws.append([f"col{i}" for i in range(max(COLUMN_INDICES.values()) + 1)])
+        for add, cancel, course, class_type, room, grade, teacher in rows:
+            row = [None] * (max(COLUMN_INDICES.values()) + 1)
+            row[COLUMN_INDICES["add_date"]] = add
+            row[COLUMN_INDICES["cancel_date"]] = cancel
+            row[COLUMN_INDICES["course"]] = course
+            row[COLUMN_INDICES["class_type"]] = class_type
+            row[COLUMN_INDICES["classroom"]] = room
+            row[COLUMN_INDICES["grade"]] = grade
+            row[COLUMN_INDICES["teacher"]] = teacher
+            ws.append(row)
+        buf = io.BytesIO()
+        wb.save(buf)
+        return buf.getvalue()
+
+    def test_projected_columns_are_typed(self):
+        """必要列のみ、型付きで読み込まれる"""
+        df = load_excel(self._create_roster_workbook())
+
+        assert list(df.columns) == list(COLUMN_INDICES)
+        assert len(df) == 8
+        assert pd.api.types.is_datetime64_any_dtype(df["add_date"])
+        assert str(df["grade"].dtype) == "Int16"
+        assert isinstance(df["course"].dtype, pd.CategoricalDtype)
+
+    def test_load_from_file_object(self):
+        """シーク可能なファイルオブジェクトからも読み込める"""
+        with tempfile.SpooledTemporaryFile(max_size=1024) as f:
+            f.write(self._create_roster_workbook())
+            f.seek(0)
+
+            df = load_excel(f)
+
+        assert len(df) == 8
+
+    def test_projected_matches_full_read(self):
+        """従来の全列読み込みと集計結果が一致"""
+        contents = self._create_roster_workbook()
+        target_month = pd.Period("2025-05", "M")
+
+        expected = aggregate(load_excel_full(contents), target_month)
+        result = aggregate(load_excel(contents), target_month)
+
+        pd.testing.assert_frame_equal(result.reset_index(drop=True),
+                                      expected.reset_index(drop=True))
+
 
 class TestAggregate:
     """aggregate() のテスト"""
@@ -154,6 +238,139 @@ class TestAggregate:
         assert len(result) > 0
 
 
+class TestAggregateRange:
+    """aggregate_range() のテスト"""
+
+    @staticmethod
+    def _looped(df, months):
+        """従来どおり1ヶ月ずつ aggregate() して合算"""
+        frames = [r for m in months if not (r := aggregate(df, m)).empty]
+        return combine_month_frames(frames)
+
+    def _create_random_roster(self, rows: int = 2000) -> pd.DataFrame:
+        """取消日が追加日より前・基準日ちょうど・欠損キーを含む名簿"""
+        rng = np.random.default_rng(42)
+        add = pd.Timestamp("2025-03-01") + pd.to_timedelta(rng.integers(0, 400, rows), unit="D")
+        cancel = add + pd.to_timedelta(rng.integers(-20, 200, rows), unit="D")
+        return pd.DataFrame({
+            "add_date": pd.Series(add).where(rng.random(rows) > 0.05),
+            "cancel_date": pd.Series(cancel).where(rng.random(rows) > 0.5),
+            "course": pd.Categorical(rng.choice(["英語ｱﾄﾞﾊﾞﾝｽ", "数学", " 物理ﾊｲﾚﾍﾞﾙ"], rows)),
+            "class_type": pd.Categorical(rng.choice(["【マスター】", "【コア】", None], rows)),
+            "classroom": pd.Categorical(rng.choice(["Room A", "Room B", None], rows)),
+            "grade": pd.array(rng.choice([31, 32, 33, 21], rows), dtype="Int16"),
+            "teacher": pd.Categorical(rng.choice(["田中", "鈴木", "0", "-", " "], rows)),
+        })
+
+    def test_identical_to_looped_aggregate(self):
+        """1ヶ月ずつ aggregate() した結果と完全に一致"""
+        df = self._create_random_roster()
+        months = list(pd.period_range("2025-04", "2026-03", freq="M"))
+        pd.testing.assert_frame_equal(aggregate_range(df, months), self._looped(df, months),
+                                      check_exact=True)
+
+    def test_positional_columns(self):
+        """列位置の DataFrame（pd.read_excel 相当）でも一致"""
+        df = TestAggregate()._create_mock_dataframe()
+        months = [pd.Period("2025-05", "M"), pd.Period("2025-06", "M")]
+        result = aggregate_range(df, months)
+        pd.testing.assert_frame_equal(result, self._looped(df, months))
+        assert list(result.columns) == KEY_COLS + ["5月", "6月"]
+        assert result["6月"].sum() == 2  # 2025-05-01 取消の行は 6月には含まれない
+
+    def test_empty_month_dropped(self):
+        """在籍者のいない月は列を作らない（1ヶ月ずつ aggregate() して合算した結果と一致）"""
+        df = TestAggregate()._create_mock_dataframe()
+        months = list(pd.period_range("2025-03", "2025-06", freq="M"))
+        assert aggregate(df, months[0]).empty
+        result = aggregate_range(df, months)
+        pd.testing.assert_frame_equal(result, self._looped(df, months), check_exact=True)
+        assert "3月" not in result.columns
+
+    def test_no_active_rows(self):
+        """どの月にも在籍者がいなければ空の DataFrame"""
+        df = TestAggregate()._create_mock_dataframe()
+        assert aggregate_range(df, [pd.Period("2025-04", "M")]).empty
+        assert aggregate_range(df, []).empty
+
+
+@pytest.fixture(scope="module")
+def roster():
+    """benchmarks の合成名簿（500 行）"""
+    from benchmarks.roster import cached_roster
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        yield cached_roster(Path(tmpdir), 500, seed=1)
+
+
+class TestAggregateBatches:
+    """aggregate_batches() / iter_excel_batches() のテスト"""
+
+    @pytest.mark.parametrize("batch_rows", [1, 37, 500, 10_000])
+    def test_identical_to_aggregate(self, roster, batch_rows):
+        """バッチの大きさによらず、全行を読み込んで aggregate() した結果と一致"""
+        for month in (pd.Period("2025-06", "M"), pd.Period("2026-02", "M")):
+            expected = aggregate(load_excel(roster), month)
+            result = aggregate_batches(iter_excel_batches(roster, batch_rows), month)
+            pd.testing.assert_frame_equal(result, expected, check_exact=True)
+
+    def test_batches_match_load_excel(self, roster):
+        """バッチを連結すると load_excel() と同じ行・型"""
+        batches = list(iter_excel_batches(roster, 200))
+        assert [len(b) for b in batches] == [200, 200, 100]
+        expected = load_excel(roster)
+        combined = pd.concat(batches, ignore_index=True)
+        for col in COLUMN_INDICES:
+            assert combined[col].astype(object).equals(expected[col].astype(object))
+
+    def test_no_active_rows(self):
+        """在籍者がいない・バッチがない場合は空の DataFrame"""
+        df = TestAggregate()._create_mock_dataframe()
+        assert aggregate_batches([df], pd.Period("2025-04", "M")).empty
+        assert aggregate_batches([], pd.Period("2025-05", "M")).empty
+
+    def test_invalid_batch_rows(self, roster):
+        """batch_rows は 1 以上"""
+        with pytest.raises(ValueError):
+            next(iter_excel_batches(roster, 0))
+
+
+class TestAggregateCube:
+    """aggregate_cube() / rollup() のテスト"""
+
+    def test_rollup_matches_aggregate(self, roster):
+        """キューブを KEY_COLS で合算すると aggregate() と完全に一致"""
+        df = load_excel(roster)
+        for month in (pd.Period("2025-06", "M"), pd.Period("2026-02", "M")):
+            cube = aggregate_cube(df, month)
+            assert list(cube.columns[:len(CUBE_COLS)]) == CUBE_COLS
+            assert len(cube) >= len(aggregate(df, month))
+            pd.testing.assert_frame_equal(rollup(cube, KEY_COLS), aggregate(df, month),
+                                          check_exact=True)
+
+    def test_batches_match_cube(self, roster):
+        """aggregate_batches(columns=CUBE_COLS) は aggregate_cube() と一致"""
+        month = pd.Period("2025-09", "M")
+        pd.testing.assert_frame_equal(
+            aggregate_batches(iter_excel_batches(roster, 123), month, CUBE_COLS),
+            aggregate_cube(load_excel(roster), month), check_exact=True)
+
+    def test_rollup_subset(self, roster):
+        """一部の列での合算は総数を保つ"""
+        cube = aggregate_cube(load_excel(roster), pd.Period("2025-06", "M"))
+        by_grade = rollup(cube, ["学年"])
+        assert list(by_grade.columns) == ["学年", "6月"]
+        assert by_grade["6月"].sum() == cube["6月"].sum()
+        assert by_grade["学年"].is_unique
+
+    def test_empty(self):
+        """在籍者がいなければキューブもロールアップも空"""
+        df = TestAggregate()._create_mock_dataframe()
+        cube = aggregate_cube(df, pd.Period("2025-04", "M"))
+        assert cube.empty
+        assert rollup(cube, KEY_COLS).empty
+
+
 class TestBuildPivot:
     """build_pivot() のテスト"""
 
@@ -255,3 +472,124 @@ class TestSaveMonthlyResult:
 
             loaded = pd.read_csv(csv_path)
             assert len(loaded) == len(df)
+
+    def test_save_monthly_result_columnar(self):
+        """fmt="col" で .mcol に保存され、CSV と同じ内容で読み戻せる"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            results_dir = Path(tmpdir)
+            df = pd.DataFrame({
+                "学年": ["高1", "高2"],
+                "教室": ["Room A", "Room B"],
+                "講座名": ["English", "English"],
+                "M/C": ["【マスター】", ""],
+                "担当": ["田中", "鈴木"],
+                "4月": [5, 3],
+            })
+            target_month = pd.Period("2025-04", "M")
+
+            save_monthly_result(df, target_month, results_dir, fmt="csv")
+            from_csv = read_month_frame(results_dir / "2025-04.csv")
+            save_monthly_result(df, target_month, results_dir, fmt="col")
+
+            # 同じ月の CSV は置き換えられる
+            assert not (results_dir / "2025-04.csv").exists()
+            from_col = read_month_frame(results_dir / "2025-04.mcol")
+            pd.testing.assert_frame_equal(from_col, from_csv)
+
+    def test_build_pivot_mixed_formats(self):
+        """CSV と .mcol が混在してもピボットは同一"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            csv_dir = Path(tmpdir) / "csv"
+            mixed_dir = Path(tmpdir) / "mixed"
+            for month, counts in [("2025-04", [5, 3]), ("2025-05", [6, 2])]:
+                df = pd.DataFrame({
+                    "学年": ["高1", "高2"],
+                    "教室": ["Room A", "Room B"],
+                    "講座名": ["English", "English"],
+                    "M/C": ["【マスター】", ""],
+                    "担当": ["田中", "鈴木"],
+                    f"{int(month[-2:])}月": counts,
+                })
+                period = pd.Period(month, "M")
+                save_monthly_result(df, period, csv_dir, fmt="csv")
+                save_monthly_result(df, period, mixed_dir,
+                                    fmt="col" if month == "2025-04" else "csv")
+
+            pd.testing.assert_frame_equal(build_pivot(mixed_dir), build_pivot(csv_dir))
+
+    def test_save_monthly_result_unknown_format(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with pytest.raises(ValueError):
+                save_monthly_result(pd.DataFrame(), pd.Period("2025-04", "M"),
+                                    Path(tmpdir), fmt="xml")
+
+
+class TestFiscalYearPartitions:
+    """年度ディレクトリ（fiscal_year_dir など）のテスト"""
+
+    @staticmethod
+    def _month_df(label: str, count: int) -> pd.DataFrame:
+        return pd.DataFrame({"学年": ["高1"], "教室": ["本校"], "講座名": ["English"],
+                             "M/C": [""], "担当": ["田中"], label: [count]})
+
+    def test_fiscal_year_matches_filename_rule(self):
+        """ファイル名の YY（年度）と同じ年度になる"""
+        for name in ("file_2504.xlsx", "file_2512.xlsx", "file_2501.xlsx", "file_2503.xlsx"):
+            assert fiscal_year_of(parse_target_month(name)) == 2025
+
+    def test_same_month_label_in_different_years(self):
+        """別年度の同じ月ラベルは別ディレクトリに保存され、合算されない"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            results_dir = Path(tmpdir)
+            for month, count in [("2025-04", 5), ("2026-03", 2), ("2026-04", 7)]:
+                period = pd.Period(month, "M")
+                save_monthly_result(self._month_df(f"{period.month}月", count), period,
+                                    month_partition(results_dir, period))
+
+            assert list_fiscal_years(results_dir) == [2025, 2026]
+            fy2025 = build_pivot(fiscal_year_dir(results_dir, 2025))
+            assert list(fy2025.columns[-2:]) == ["4月", "3月"]
+            assert fy2025["4月"].tolist() == [5]
+            assert build_pivot(fiscal_year_dir(results_dir, 2026))["4月"].tolist() == [7]
+
+    def test_empty_year_dir_is_not_listed(self):
+        """月別結果のない年度ディレクトリ・年度名でないディレクトリは含めない"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            results_dir = Path(tmpdir)
+            fiscal_year_dir(results_dir, 2024).mkdir()
+            (results_dir / "FYxx").mkdir()
+            assert list_fiscal_years(results_dir) == []
+
+    def test_legacy_results_are_moved(self):
+        """直下の月別結果（CSV・SQLite）が年度ディレクトリへ移り、ピボットは変わらない"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            results_dir = Path(tmpdir)
+            save_monthly_result(self._month_df("4月", 5), pd.Period("2025-04", "M"), results_dir)
+            save_monthly_result(self._month_df("1月", 3), pd.Period("2026-01", "M"), results_dir,
+                                fmt="sqlite")
+            save_monthly_result(self._month_df("4月", 7), pd.Period("2026-04", "M"), results_dir,
+                                fmt="col")
+            # 年度別に分ける前は別年度の4月が1列に合算されていた
+            assert build_pivot(results_dir)[["4月", "1月"]].sum().tolist() == [12, 3]
+
+            assert sorted(partition_legacy_results(results_dir)) == ["2025-04", "2026-01", "2026-04"]
+            assert list_fiscal_years(results_dir) == [2025, 2026]
+            assert not (results_dir / "2025-04.csv").exists()
+            assert build_pivot(results_dir).empty
+            fy2025 = build_pivot(fiscal_year_dir(results_dir, 2025))
+            assert fy2025[["4月", "1月"]].sum().tolist() == [5, 3]
+            assert "2026-01" in result_store(fiscal_year_dir(results_dir, 2025)).months()
+            assert build_pivot(fiscal_year_dir(results_dir, 2026))["4月"].tolist() == [7]
+            assert partition_legacy_results(results_dir) == []
+
+    def test_newer_partitioned_result_wins(self):
+        """年度ディレクトリに同じ月があれば、直下の古い結果は捨てる"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            results_dir = Path(tmpdir)
+            month = pd.Period("2025-04", "M")
+            save_monthly_result(self._month_df("4月", 1), month, results_dir)
+            save_monthly_result(self._month_df("4月", 9), month, month_partition(results_dir, month))
+
+            assert partition_legacy_results(results_dir) == []
+            assert not (results_dir / "2025-04.csv").exists()
+            assert build_pivot(month_partition(results_dir, month))["4月"].tolist() == [9]
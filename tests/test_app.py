@@ -0,0 +1,316 @@
+"""
+app/main.py のエンドポイントのテスト
+
+一時ディレクトリの outputs を使うように切り替えたアプリに TestClient で要求を送り、
+応答の状態コード・ヘッダー・本文を検証する。yossy_portal_lib がない環境では素通しのミドルウェアで代用する。
+"""
+import importlib
+import importlib.util
+import re
+import sys
+import tempfile
+import time
+import types
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from benchmarks.roster import cached_roster
+from services import pivot_cache
+from services.aggregator import fiscal_year_dir, save_monthly_result
+from services.jobs import JobQueue
+from tests.helpers import month_df
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+
+XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def _portal_stub() -> types.ModuleType:
+    """yossy_portal_lib の代わり（認証・CSP なしで通す）"""
+    module = types.ModuleType("yossy_portal_lib")
+
+    async def passthrough(request, call_next):
+        request.state.csp_nonce = "test"
+        return await call_next(request)
+
+    def add_health_endpoint(app):
+        @app.get("/health")
+        def health():
+            return {"status": "ok"}
+
+    module.portal_auth_middleware = passthrough
+    module.csp_middleware = passthrough
+    module.add_health_endpoint = add_health_endpoint
+    return module
+
+
+@pytest.fixture
+def main(monkeypatch, output_dir):
+    """outputs を output_dir に切り替えた app.main"""
+    if "app.main" not in sys.modules and importlib.util.find_spec("yossy_portal_lib") is None:
+        monkeypatch.setitem(sys.modules, "yossy_portal_lib", _portal_stub())
+    module = importlib.import_module("app.main")
+    monkeypatch.setattr(module, "OUTPUT_DIR", output_dir)
+    monkeypatch.setattr(module, "RESULTS_DIR", output_dir / "results")
+    for queue in (module.upload_jobs, module.batch_jobs):
+        monkeypatch.setattr(queue, "state_dir", output_dir / ".jobs")
+    module._partitioned.cache_clear()
+    module._fragments.clear()
+    yield module
+    module._partitioned.cache_clear()
+
+
+@pytest.fixture
+def client(main):
+    from fastapi.testclient import TestClient
+
+    # 起動・終了フックは使わない（終了フックはジョブキューを止めてしまう）
+    return TestClient(main.app)
+
+
+@pytest.fixture(scope="module")
+def roster():
+    """アップロードする合成名簿（2025年度）の内容"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        yield cached_roster(Path(tmpdir), 200, seed=3).read_bytes()
+
+
+def _sse_events(text: str) -> list[tuple[str, str]]:
+    """SSE の本文を (イベント名, data を改行でつないだもの) の列に分ける"""
+    events = []
+    for block in text.split("\n\n"):
+        lines = block.splitlines()
+        names = [line[len("event: "):] for line in lines if line.startswith("event: ")]
+        if names:
+            data = "\n".join(line[len("data: "):] for line in lines if line.startswith("data: "))
+            events.append((names[0], data))
+    return events
+
+
+def _wait(job, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not job.finished and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert job.finished
+
+
+class TestYearSelection:
+    """?year= の年度の選択"""
+
+    def test_unknown_year_not_cached(self, client, results_dir):
+        """保存済みでも今年度でもない年度は 404。年度ごとのキャッシュを作らない"""
+        save_monthly_result(month_df("4月", [5, 3]), pd.Period("2025-04", "M"), results_dir)
+        results = results_dir.parent
+
+        for year in ["1", "99999", "1999"]:
+            assert client.get(f"/download?year={year}").status_code == 404
+            assert client.get(f"/api/query?year={year}").status_code == 404
+            assert client.get(f"/api/summary?year={year}").status_code == 404
+            assert fiscal_year_dir(results, int(year)).resolve() not in pivot_cache._caches
+
+    def test_index_falls_back_to_latest(self, client, results_dir):
+        """トップ画面は未知の年度なら保存済みの最新年度を表示する"""
+        save_monthly_result(month_df("4月", [5, 3]), pd.Period("2025-04", "M"), results_dir)
+
+        response = client.get("/?year=1")
+
+        assert response.status_code == 200
+        assert "2025年度" in response.text
+        assert "1年度" not in response.text
+
+    def test_leading_zeros_share_year(self, client, results_dir):
+        """先頭に 0 を付けても同じ年度として扱う"""
+        save_monthly_result(month_df("4月", [5, 3]), pd.Period("2025-04", "M"), results_dir)
+
+        assert client.get("/api/query?year=00002025").json()["year"] == 2025
+
+
+class TestJobStatus:
+    """GET /jobs/{job_id}"""
+
+    def test_job_from_other_worker(self, client, output_dir):
+        """別のワーカーが受け付けたジョブも状態ファイルから結果を表示する"""
+        other = JobQueue(state_dir=output_dir / ".jobs")
+        job = other.submit("roster_2504.xlsx", lambda: {
+            "month": "2025-04", "rows": 3, "year": 2025, "months": ["4月"], "total_rows": 3})
+        other.shutdown()
+
+        response = client.get(f"/jobs/{job.id}")
+
+        assert "集計完了 — 2025-04（2025年度）" in response.text
+
+    def test_unknown_job(self, client):
+        """どのワーカーにもないジョブは見つからない旨を返す"""
+        assert "処理状況が見つかりません" in client.get(f"/jobs/{'0' * 32}").text
+
+
+class TestUpload:
+    """POST /upload"""
+
+    def test_same_file_deduplicated(self, client, main, monkeypatch, roster):
+        """保存済みの月と同じ内容のファイルはジョブに回さず、重複カウンターを増やす"""
+        submitted = []
+        submit = main.upload_jobs.submit
+
+        def recording_submit(*args, **kwargs):
+            job = submit(*args, **kwargs)
+            submitted.append(job)
+            return job
+
+        monkeypatch.setattr(main.upload_jobs, "submit", recording_submit)
+        files = {"file": ("roster_2504.xlsx", roster, XLSX)}
+
+        first = client.post("/upload", files=files)
+        (job,) = submitted
+        assert f"jobs/{job.id}" in first.text
+        _wait(job)
+        assert job.result["month"] == "2025-04"
+        hits, misses = main.upload_dedup_hits.value, main.upload_dedup_misses.value
+
+        second = client.post("/upload", files=files)
+
+        assert second.status_code == 200
+        assert "再集計を省略しました" in second.text
+        assert "集計完了 — 2025-04（2025年度）" in second.text
+        assert len(submitted) == 1
+        assert main.upload_dedup_hits.value == hits + 1
+        assert main.upload_dedup_misses.value == misses
+
+
+class TestDownload:
+    """GET /download"""
+
+    def test_etag_revalidation(self, client, results_dir):
+        """If-None-Match が一致すれば 304、月を保存すると ETag が変わる"""
+        save_monthly_result(month_df("4月", [5, 3]), pd.Period("2025-04", "M"), results_dir)
+
+        first = client.get("/download?year=2025")
+        assert first.status_code == 200
+        assert first.headers["content-type"] == XLSX
+        assert first.content[:2] == b"PK"
+        etag = first.headers["etag"]
+
+        cached = client.get("/download?year=2025", headers={"If-None-Match": etag})
+        assert cached.status_code == 304
+        assert cached.headers["etag"] == etag
+        assert cached.content == b""
+
+        save_monthly_result(month_df("5月", [4, 2, 1]), pd.Period("2025-05", "M"), results_dir)
+        updated = client.get("/download?year=2025", headers={"If-None-Match": etag})
+
+        assert updated.status_code == 200
+        assert updated.headers["etag"] != etag
+        assert updated.content != first.content
+        assert client.get("/download?year=2025", headers={
+            "If-None-Match": updated.headers["etag"]}).status_code == 304
+
+
+class TestQuery:
+    """GET /api/query"""
+
+    @pytest.fixture(autouse=True)
+    def saved(self, results_dir):
+        save_monthly_result(month_df("4月", [5, 3]), pd.Period("2025-04", "M"), results_dir)
+        save_monthly_result(month_df("5月", [4, 2, 1]), pd.Period("2025-05", "M"), results_dir)
+
+    def test_filters(self, client):
+        """同じ項目の繰り返しは OR、項目どうしは AND で絞り込む（項目名は別名でも列名でもよい）"""
+        result = client.get("/api/query", params=[
+            ("year", "2025"), ("grade", "高1"), ("grade", "高3"), ("教室", "Room A")]).json()
+
+        assert result["year"] == 2025
+        assert result["months"] == ["4月", "5月"]
+        assert [(row["学年"], row["counts"]) for row in result["rows"]] == [
+            ("高1", {"4月": 5, "5月": 4}), ("高3", {"4月": 0, "5月": 1})]
+        assert result["totals"] == {"4月": 5, "5月": 5}
+
+    def test_group_by_and_month_range(self, client):
+        """group_by はカンマ区切り、month_from / month_to で月を絞る"""
+        result = client.get("/api/query?group_by=classroom,+grade&month_from=5月&month_to=5月").json()
+
+        assert result["group_by"] == ["教室", "学年"]
+        assert result["months"] == ["5月"]
+        assert [(row["教室"], row["学年"], row["total"]) for row in result["rows"]] == [
+            ("Room A", "高1", 4), ("Room A", "高3", 1), ("Room B", "高2", 2)]
+
+    def test_paging(self, client):
+        """offset / limit は整数に変換し、続きがあれば next_offset を返す"""
+        result = client.get("/api/query?offset=1&limit=1").json()
+
+        assert (result["offset"], result["limit"], result["next_offset"]) == (1, 1, 2)
+        assert result["total_rows"] == 3
+        assert len(result["rows"]) == 1
+
+    @pytest.mark.parametrize("params", [
+        "group_by=unknown",
+        "grade=高1&group_by=grade,unknown",
+        "limit=abc",
+        "limit=0",
+        "limit=1001",
+        "offset=-1",
+        "offset=1.5",
+        "month_from=13月",
+        "year=abc",
+    ])
+    def test_bad_parameters(self, client, params):
+        """未知の group_by・範囲外や整数でないページング・年度でない year は 400"""
+        response = client.get(f"/api/query?{params}")
+
+        assert response.status_code == 400, params
+        assert response.json()["error"]
+
+
+class TestBatchUpload:
+    """POST /upload/batch と GET /upload/batch/{id}/events（SSE）"""
+
+    def test_events(self, client, main, monkeypatch, roster):
+        """ファイルごとに1回 file-N イベント、最後に年度ごとの結果を含む complete イベントを送る"""
+        monkeypatch.setattr(main, "BATCH_POLL_INTERVAL", 0.01)
+        files = [
+            ("files", ("roster_2504.xlsx", roster, XLSX)),
+            ("files", ("notes.xlsx", roster, XLSX)),
+            ("files", ("roster_2505.xlsx", b"not a workbook", XLSX)),
+        ]
+
+        response = client.post("/upload/batch", files=files)
+
+        assert response.status_code == 200
+        assert "一括集計 — 3 ファイル" in response.text
+        batch_id = re.search(r"upload/batch/([0-9a-f]{32})/events", response.text)[1]
+        _wait(main.batch_jobs.get_batch(batch_id))
+
+        with client.stream("GET", f"/upload/batch/{batch_id}/events") as stream:
+            assert stream.headers["content-type"].startswith("text/event-stream")
+            events = _sse_events("".join(stream.iter_text()))
+
+        assert [name for name, _ in events] == ["file-0", "file-1", "file-2", "complete"]
+        data = dict(events)
+        assert "roster_2504.xlsx" in data["file-0"] and "2025-04: " in data["file-0"]
+        assert "ファイル名からターゲット月を判定できません" in data["file-1"]
+        assert "Excel の形式が想定と異なります" in data["file-2"]
+        assert "2025年度の集計済み月数: </span>1 ヶ月" in data["complete"]
+        assert "download?year=2025" in data["complete"]
+
+    def test_events_follow_progress(self, client, main, monkeypatch, roster):
+        """処理中に接続しても、状態が変わったファイルの行を送り直してから complete で終わる"""
+        monkeypatch.setattr(main, "BATCH_POLL_INTERVAL", 0.01)
+        files = [("files", (f"roster_25{month:02d}.xlsx", roster, XLSX)) for month in (4, 5)]
+
+        response = client.post("/upload/batch", files=files)
+        batch_id = re.search(r"upload/batch/([0-9a-f]{32})/events", response.text)[1]
+        with client.stream("GET", f"/upload/batch/{batch_id}/events") as stream:
+            events = _sse_events("".join(stream.iter_text()))
+
+        names = [name for name, _ in events]
+        assert names[-1] == "complete" and names.count("complete") == 1
+        assert {"file-0", "file-1"} <= set(names)
+        last = {name: data for name, data in events}
+        assert "2025-04: " in last["file-0"] and "2025-05: " in last["file-1"]
+        assert "2025年度の集計済み月数: </span>2 ヶ月" in last["complete"]
+
+    def test_unknown_batch(self, client):
+        """どのワーカーにもないバッチは 404"""
+        assert client.get(f"/upload/batch/{'0' * 32}/events").status_code == 404
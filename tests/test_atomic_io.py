@@ -0,0 +1,122 @@
+"""
+services/atomic_io.py と save_monthly_result() の原子的な保存のテスト
+
+書き込み中・失敗時に読み手が壊れたファイルを見ないこと、同じ月の保存が直列化されること、
+保存ごとに世代番号が進むことを検証。
+"""
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from services import aggregator
+from services.aggregator import build_pivot, list_month_files, save_monthly_result
+from services.atomic_io import atomic_path, month_lock, read_generation
+from services.pivot_cache import PivotCache
+from tests.helpers import uniform_month_df
+
+
+class TestAtomicPath:
+    """atomic_path()"""
+
+    def test_replaces_on_success(self, results_dir):
+        path = results_dir / "a.csv"
+        path.write_text("old")
+        with atomic_path(path) as tmp:
+            tmp.write_text("new")
+            assert path.read_text() == "old"
+        assert path.read_text() == "new"
+        assert [p.name for p in results_dir.iterdir()] == ["a.csv"]
+
+    def test_keeps_original_on_failure(self, results_dir):
+        path = results_dir / "a.csv"
+        path.write_text("old")
+        with pytest.raises(RuntimeError):
+            with atomic_path(path) as tmp:
+                tmp.write_text("partial")
+                raise RuntimeError("boom")
+        assert path.read_text() == "old"
+        assert [p.name for p in results_dir.iterdir()] == ["a.csv"]
+
+    def test_temp_file_is_not_a_month_file(self, results_dir):
+        with atomic_path(results_dir / "2025-04.csv") as tmp:
+            tmp.write_text("x")
+            assert list_month_files(results_dir) == []
+
+
+class TestSaveMonthlyResult:
+    """save_monthly_result() の並行保存"""
+
+    def test_generation_advances(self, results_dir):
+        assert read_generation(results_dir) == 0
+        save_monthly_result(uniform_month_df("4月", 1), pd.Period("2025-04", "M"), results_dir)
+        save_monthly_result(uniform_month_df("5月", 1), pd.Period("2025-05", "M"), results_dir, fmt="col")
+        assert read_generation(results_dir) == 2
+
+    def test_failed_write_keeps_previous_result(self, results_dir, monkeypatch):
+        month = pd.Period("2025-04", "M")
+        save_monthly_result(uniform_month_df("4月", 1), month, results_dir, fmt="col")
+        before = build_pivot(results_dir)
+
+        def broken(df, path, key_cols):
+            path.write_bytes(b"MNACOL1\n")
+            raise OSError("disk full")
+
+        monkeypatch.setattr(aggregator, "write_table", broken)
+        with pytest.raises(OSError):
+            save_monthly_result(uniform_month_df("4月", 9), month, results_dir, fmt="col")
+        pd.testing.assert_frame_equal(build_pivot(results_dir), before)
+        assert read_generation(results_dir) == 1
+
+    def test_same_month_saves_are_serialized(self, results_dir):
+        """月ロック中は同じ月の保存が待たされる"""
+        month = pd.Period("2025-04", "M")
+        saved = threading.Event()
+
+        def save():
+            save_monthly_result(uniform_month_df("4月", 2), month, results_dir)
+            saved.set()
+
+        with month_lock(results_dir, str(month)):
+            thread = threading.Thread(target=save)
+            thread.start()
+            time.sleep(0.2)
+            assert not saved.is_set()
+        thread.join()
+        assert saved.is_set()
+
+    def test_readers_never_see_partial_files(self, results_dir):
+        """保存と並行してピボットを読んでも、常にいずれかの版の完全な結果が見える"""
+        month = pd.Period("2025-04", "M")
+        save_monthly_result(uniform_month_df("4月", 1, rows=2000), month, results_dir)
+        stop = threading.Event()
+        errors = []
+
+        def writer(count):
+            while not stop.is_set():
+                save_monthly_result(uniform_month_df("4月", count, rows=2000), month, results_dir)
+
+        def reader():
+            cache = PivotCache(results_dir)
+            for _ in range(30):
+                try:
+                    totals = set(cache.get()["4月"])
+                    if len(totals) != 1 or totals - {1, 2}:
+                        errors.append(totals)
+                    counted = set(build_pivot(results_dir)["4月"])
+                    if len(counted) != 1:
+                        errors.append(counted)
+                except Exception as e:
+                    errors.append(e)
+
+        threads = [threading.Thread(target=writer, args=(c,)) for c in (1, 2)]
+        for t in threads:
+            t.start()
+        try:
+            reader()
+        finally:
+            stop.set()
+            for t in threads:
+                t.join()
+        assert errors == []
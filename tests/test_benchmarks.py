@@ -0,0 +1,88 @@
+"""
+benchmarks/ のユニットテスト
+
+合成名簿が COLUMN_INDICES の配置で読み込めること、
+レポート比較が悪化だけを検出することを検証。
+"""
+import copy
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from benchmarks.roster import cached_roster, roster_columns
+from benchmarks.run import STAGES, compare, run_size
+from services.aggregator import aggregate, load_excel, load_excel_full, parse_target_month
+
+
+@pytest.fixture(scope="module")
+def roster():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        yield cached_roster(Path(tmpdir), 500, seed=1)
+
+
+class TestRoster:
+    """合成名簿のテスト"""
+
+    def test_layout_matches_loader(self, roster):
+        """load_excel で全行を型付きで読み込め、全列読み込みと集計が一致"""
+        df = load_excel(roster)
+        assert len(df) == 500
+        assert str(df["add_date"].dtype).startswith("datetime64")
+        assert set(df["grade"].dropna()) <= {31, 32, 33, 21, 22, 23}
+
+        month = parse_target_month(roster.name)
+        assert month == pd.Period("2026-03", "M")
+        result = aggregate(df, month)
+        assert result["3月"].sum() > 0
+        pd.testing.assert_frame_equal(result, aggregate(load_excel_full(roster), month))
+
+    def test_reused_from_cache(self, roster):
+        """同じ条件なら生成し直さない"""
+        mtime = roster.stat().st_mtime_ns
+        assert cached_roster(roster.parent, 500, seed=1) == roster
+        assert roster.stat().st_mtime_ns == mtime
+
+    def test_distributions(self):
+        """除外対象の担当・取消・学年外の行を含む"""
+        columns = roster_columns(5000, seed=2)
+        teachers = pd.Series(columns["teacher"])
+        assert teachers.isin(["0", "-"]).any() and teachers.isna().any()
+        assert 0.15 < pd.Series(columns["cancel_date"]).notna().mean() < 0.35
+        assert (columns["grade"] < 30).any()
+
+
+class TestReport:
+    """計測とレポート比較のテスト"""
+
+    def test_run_size_records_all_stages(self, roster):
+        """全段階の秒数が記録される"""
+        run = run_size(500, roster.parent, seed=1)
+        assert set(run["stages"]) == set(STAGES)
+        assert all(s["seconds"] >= 0 for s in run["stages"].values())
+        assert run["pivot_rows"] >= run["result_rows"] > 0
+
+    def _report(self, seconds: float, peak: int) -> dict:
+        return {"runs": [{"rows": 1000, "peak_rss": peak,
+                          "stages": {s: {"seconds": seconds} for s in STAGES}}]}
+
+    def test_compare_detects_regression(self):
+        """しきい値を超えた遅延・メモリ増加を検出"""
+        baseline = self._report(1.0, 100 * 2**20)
+        report = copy.deepcopy(baseline)
+        report["runs"][0]["stages"]["aggregate"]["seconds"] = 1.5
+        report["runs"][0]["peak_rss"] = 200 * 2**20
+        regressions = compare(report, baseline, threshold=0.2)
+        assert len(regressions) == 2
+        assert "aggregate" in regressions[0]
+
+    def test_compare_ignores_noise(self):
+        """しきい値内・誤差程度の差、ベースラインにない行数は無視"""
+        baseline = self._report(0.01, 100 * 2**20)
+        report = self._report(0.03, 110 * 2**20)
+        assert compare(report, baseline, threshold=0.2) == []
+
+        other = self._report(5.0, 999 * 2**20)
+        other["runs"][0]["rows"] = 2000
+        assert compare(other, baseline) == []
@@ -0,0 +1,85 @@
+"""
+services/colstore.py のユニットテスト
+
+.mcol の書き込み・読み込み往復とスキーマ検証。
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.aggregator import KEY_COLS
+from services.colstore import MAGIC, read_schema, read_table, write_table
+
+
+def _mixed_df() -> pd.DataFrame:
+    """教室に数値、M/C に欠損を含む月別結果"""
+    return pd.DataFrame({
+        "学年": ["高1", "高2", "高1"],
+        "教室": ["Room A", 101, "Room A"],
+        "講座名": ["English", "English", "Math"],
+        "M/C": ["【マスター】", "", None],
+        "担当": ["田中", "鈴木", "田中"],
+        "4月": [5, 3, 1],
+    })
+
+
+@pytest.fixture
+def mcol_path(results_dir):
+    path = results_dir / "2025-04.mcol"
+    write_table(_mixed_df(), path, KEY_COLS)
+    return path
+
+
+class TestColstore:
+    """write_table() / read_table() のテスト"""
+
+    def test_schema_stored_in_file(self, mcol_path):
+        """ヘッダーに列名・種別・辞書が格納される"""
+        schema = read_schema(mcol_path)
+
+        assert schema["rows"] == 3
+        assert [c["name"] for c in schema["columns"]] == KEY_COLS + ["4月"]
+        kinds = {c["name"]: c["kind"] for c in schema["columns"]}
+        assert kinds["4月"] == "count"
+        assert all(kinds[c] == "dict" for c in KEY_COLS)
+        classroom = next(c for c in schema["columns"] if c["name"] == "教室")
+        assert classroom["categories"] == ["Room A", "101"]
+
+    def test_round_trip(self, mcol_path):
+        """キー列は文字列化、空文字・欠損は NaN、件数は int32"""
+        df = read_table(mcol_path)
+
+        assert isinstance(df["学年"].dtype, pd.CategoricalDtype)
+        assert df["4月"].dtype == np.int32
+        assert df["4月"].tolist() == [5, 3, 1]
+        assert df["教室"].tolist() == ["Room A", "101", "Room A"]
+        assert df["M/C"].isna().tolist() == [False, True, True]
+
+    def test_columns_are_memory_mapped(self, mcol_path):
+        """件数列はファイルの memmap を参照するビュー"""
+        counts = read_table(mcol_path)["4月"].to_numpy()
+
+        assert not counts.flags.owndata
+        assert not counts.flags.writeable
+
+    def test_empty_table(self, results_dir):
+        """0行でも往復できる"""
+        path = results_dir / "empty.mcol"
+        write_table(_mixed_df().iloc[:0], path, KEY_COLS)
+
+        df = read_table(path)
+
+        assert len(df) == 0
+        assert list(df.columns) == KEY_COLS + ["4月"]
+
+    def test_invalid_magic_raises(self, results_dir):
+        """.mcol 以外のファイルは ValueError"""
+        path = results_dir / "bad.mcol"
+        path.write_bytes(b"not a table")
+
+        with pytest.raises(ValueError):
+            read_table(path)
+
+    def test_magic_prefix(self, mcol_path):
+        """先頭にマジックバイトが書かれる"""
+        assert mcol_path.read_bytes().startswith(MAGIC)
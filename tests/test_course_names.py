@@ -0,0 +1,101 @@
+"""
+services/course_names.py のユニットテスト
+
+ルール表による講座名の補正、組ごとの解決と LRU、ルール表の読み込みを検証。
+"""
+import json
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.course_names import (
+    DEFAULT_RULES,
+    CourseResolver,
+    SuffixRule,
+    load_rules,
+    rules_tag,
+)
+
+
+class TestResolveOne:
+    """resolve_one() のテスト"""
+
+    def test_default_rules(self):
+        """ｱﾄﾞﾊﾞﾝｽ・ﾊｲﾚﾍﾞﾙ講座だけ M/C を付ける"""
+        r = CourseResolver()
+        assert r.resolve_one(" 英語ｱﾄﾞﾊﾞﾝｽ ", "【マスター】 ") == "英語ｱﾄﾞﾊﾞﾝｽ【マスター】"
+        assert r.resolve_one("数学ﾊｲﾚﾍﾞﾙ", "【コア】") == "数学ﾊｲﾚﾍﾞﾙ【コア】"
+        assert r.resolve_one("英語ｱﾄﾞﾊﾞﾝｽ", None) == "英語ｱﾄﾞﾊﾞﾝｽ"
+        assert r.resolve_one("英語", "【マスター】") == "英語"
+        assert r.resolve_one(np.nan, "【マスター】") is None
+
+    def test_first_matching_rule_wins(self):
+        """複数一致時は先頭のルールだけを適用"""
+        r = CourseResolver((SuffixRule("英語", "({class_type})"), SuffixRule("ｱﾄﾞﾊﾞﾝｽ")))
+        assert r.resolve_one("英語ｱﾄﾞﾊﾞﾝｽ", "M") == "英語ｱﾄﾞﾊﾞﾝｽ(M)"
+
+    def test_lru_is_bounded(self):
+        """保持件数は cache_size まで。再利用はヒットとして数える"""
+        r = CourseResolver(cache_size=2)
+        r.resolve_one("A", "x")
+        r.resolve_one("B", "x")
+        r.resolve_one("A", "x")
+        r.resolve_one("C", "x")  # 最も古い B が追い出される
+        r.resolve_one("B", "x")
+        assert (r.hits, r.misses) == (1, 4)
+
+
+class TestResolve:
+    """resolve() のテスト"""
+
+    def test_matches_row_wise_rule(self):
+        """従来の行単位の正規表現と同じ結果"""
+        rng = np.random.default_rng(0)
+        course = pd.Series(rng.choice(["英語ｱﾄﾞﾊﾞﾝｽ", " 数学 ", "物理ﾊｲﾚﾍﾞﾙ", None], 300))
+        course = course.astype("category")
+        class_type = pd.Series(rng.choice(["【マスター】", " 【コア】", None], 300)).astype("category")
+
+        c = course.astype(object).astype(str).str.strip()
+        k = class_type.astype(object).fillna("").astype(str).str.strip()
+        needs = c.str.contains("ｱﾄﾞﾊﾞﾝｽ|ﾊｲﾚﾍﾞﾙ", na=False) & k.ne("")
+        expected = c.where(~needs, c + k)
+
+        pd.testing.assert_series_equal(CourseResolver().resolve(course, class_type), expected)
+
+    def test_resolves_each_pair_once(self):
+        """行数によらず組の数だけ解決する"""
+        r = CourseResolver()
+        course = pd.Series(["英語ｱﾄﾞﾊﾞﾝｽ", "数学"] * 500)
+        class_type = pd.Series(["M", "C"] * 500)
+        r.resolve(course, class_type)
+        r.resolve(course, class_type)
+        assert (r.misses, r.hits) == (2, 2)
+
+
+class TestRules:
+    """ルール表のテスト"""
+
+    def test_load_rules(self):
+        """JSON のルール表を読み込む"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "rules.json"
+            rules = [{"keyword": "ｱﾄﾞﾊﾞﾝｽ"}, {"keyword": "特進", "template": "-{class_type}"}]
+            path.write_text(json.dumps(rules), encoding="utf-8")
+            rules = load_rules(path)
+        assert rules == (SuffixRule("ｱﾄﾞﾊﾞﾝｽ"), SuffixRule("特進", "-{class_type}"))
+
+    def test_invalid_rules(self):
+        """不正なルール表は ValueError"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "rules.json"
+            path.write_text(json.dumps([{"word": "x"}]), encoding="utf-8")
+            with pytest.raises(ValueError):
+                load_rules(path)
+
+    def test_rules_tag(self):
+        """既定のルール表では空、変更すると識別子が付く"""
+        assert rules_tag(DEFAULT_RULES) == ""
+        assert len(rules_tag((SuffixRule("特進"),))) == 8
@@ -0,0 +1,149 @@
+"""
+services/cube.py のユニットテスト
+
+キューブ・ロールアップの保存と読み出し、ロールアップからの月別合計・内訳を検証。
+"""
+import json
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from services.aggregator import (
+    CUBE_COLS,
+    KEY_COLS,
+    aggregate_cube,
+    load_excel,
+)
+from services.cube import (
+    breakdown,
+    compute_rollups,
+    cube_path,
+    load_cube,
+    load_rollups,
+    month_totals,
+    pivot_month_totals,
+    retain_cubes,
+    rollup_path,
+    save_month_cube,
+    summary_table,
+)
+
+MONTHS = [pd.Period("2025-04", "M"), pd.Period("2025-05", "M")]
+
+
+@pytest.fixture(scope="module")
+def roster_df():
+    """benchmarks の合成名簿（400 行）"""
+    from benchmarks.roster import cached_roster
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        yield load_excel(cached_roster(Path(tmpdir), 400, seed=3))
+
+
+def _cube_sum(cube: pd.DataFrame, dim: str, label: str) -> dict[str, int]:
+    grouped = cube.groupby(cube[dim].astype(object).fillna(""), dropna=False)[label].sum()
+    return {str(k): int(v) for k, v in grouped.items()}
+
+
+class TestRollups:
+    """compute_rollups() のテスト"""
+
+    def test_totals(self, roster_df):
+        """総計・学年／教室／担当ごとの合計がキューブの合算と一致（欠損は空文字）"""
+        cube = aggregate_cube(roster_df, MONTHS[0])
+        data = compute_rollups(cube, "2025-04")
+        assert data["label"] == "4月"
+        assert data["total"] == int(cube["4月"].sum())
+        for dim in ("学年", "教室", "担当"):
+            assert data["by"][dim] == _cube_sum(cube, dim, "4月")
+            assert sum(data["by"][dim].values()) == data["total"]
+
+
+class TestSaveLoad:
+    """save_month_cube() / load_cube() / load_rollups() のテスト"""
+
+    def test_round_trip(self, roster_df, results_dir):
+        """保存したキューブを読み戻すと同じ内容（キー列は category）"""
+        cube = aggregate_cube(roster_df, MONTHS[0])
+        path = save_month_cube(cube, MONTHS[0], results_dir)
+        assert path == cube_path(results_dir, "2025-04")
+        assert rollup_path(results_dir, "2025-04").exists()
+
+        loaded = load_cube(results_dir, "2025-04")
+        assert len(loaded) == len(cube)
+        # 空文字のキーは月別結果と同じく欠損として読み戻る
+        for c in CUBE_COLS:
+            assert loaded[c].astype(object).fillna("").tolist() == \
+                cube[c].astype(object).fillna("").tolist()
+        assert loaded["4月"].tolist() == cube["4月"].tolist()
+        assert load_cube(results_dir, "2025-05") is None
+
+    def test_no_temp_files(self, roster_df, results_dir):
+        """保存後に一時ファイルが残らない"""
+        save_month_cube(aggregate_cube(roster_df, MONTHS[0]), MONTHS[0], results_dir)
+        assert not list((results_dir / "cubes").glob("*.tmp"))
+
+    def test_broken_rollup_ignored(self, roster_df, results_dir):
+        """壊れたロールアップは読み飛ばす"""
+        save_month_cube(aggregate_cube(roster_df, MONTHS[0]), MONTHS[0], results_dir)
+        rollup_path(results_dir, "2025-05").write_text("{", encoding="utf-8")
+        assert list(load_rollups(results_dir)) == ["2025-04"]
+
+
+class TestSummaries:
+    """month_totals() / pivot_month_totals() / summary_table() / breakdown() のテスト"""
+
+    @pytest.fixture
+    def cubes(self, roster_df, results_dir):
+        cubes = {str(m): aggregate_cube(roster_df, m) for m in MONTHS}
+        for m in MONTHS:
+            save_month_cube(cubes[str(m)], m, results_dir)
+        return cubes
+
+    def test_month_totals(self, cubes, results_dir):
+        """月ラベルごとの総計（年度の月順）"""
+        assert month_totals(results_dir) == {
+            "4月": int(cubes["2025-04"]["4月"].sum()),
+            "5月": int(cubes["2025-05"]["5月"].sum()),
+        }
+
+    def test_pivot_month_totals_fallback(self, cubes, results_dir):
+        """ロールアップのない月はピボットの列を合算する"""
+        pivot = pd.DataFrame({**{c: ["x"] for c in KEY_COLS}, "4月": [1], "5月": [2], "6月": [7]})
+        totals = pivot_month_totals(results_dir, pivot)
+        assert list(totals) == ["4月", "5月", "6月"]
+        assert totals["4月"] == int(cubes["2025-04"]["4月"].sum())
+        assert totals["6月"] == 7
+
+    def test_summary_table(self, cubes, results_dir):
+        """学年 × 月の合計表"""
+        table = summary_table(results_dir, "学年")
+        assert list(table.columns) == ["学年", "4月", "5月"]
+        for label, month in (("4月", "2025-04"), ("5月", "2025-05")):
+            expected = _cube_sum(cubes[month], "学年", label)
+            assert {k: v for k, v in zip(table["学年"], table[label]) if v} == \
+                {k: v for k, v in expected.items() if v}
+
+    def test_summary_table_unknown_dim(self, results_dir):
+        """ロールアップのない列は ValueError"""
+        with pytest.raises(ValueError):
+            summary_table(results_dir, "性別")
+
+    def test_breakdown(self, cubes, results_dir):
+        """キューブを任意の列で合算（名簿は読み直さない）"""
+        table = breakdown(results_dir, ["学年", "性別"])
+        assert list(table.columns) == ["学年", "性別", "4月", "5月"]
+        assert table["4月"].sum() == cubes["2025-04"]["4月"].sum()
+        assert table["5月"].sum() == cubes["2025-05"]["5月"].sum()
+        with pytest.raises(ValueError):
+            breakdown(results_dir, ["講師"])
+
+    def test_retain(self, cubes, results_dir):
+        """指定した月以外のキューブとロールアップを削除"""
+        assert retain_cubes(results_dir, {"2025-05"}) == ["2025-04"]
+        assert list(load_rollups(results_dir)) == ["2025-05"]
+        assert not cube_path(results_dir, "2025-04").exists()
+        data = json.loads(rollup_path(results_dir, "2025-05").read_text(encoding="utf-8"))
+        assert data["month"] == "2025-05"
@@ -0,0 +1,117 @@
+"""
+services/export_cache.py のユニットテスト
+
+XLSX 成果物が月別結果の変化時だけ作り直され、ETag と対応することを検証。
+"""
+import pandas as pd
+import pytest
+from openpyxl import load_workbook
+
+from services.aggregator import fiscal_year_dir, save_monthly_result
+from services.export_cache import (
+    cached_export,
+    etag_matches,
+    export_path,
+    iter_export,
+    pivot_with_etag,
+    retain_exports,
+    write_export,
+)
+from tests.helpers import month_df
+
+
+@pytest.fixture
+def results_dir(results_dir):
+    save_monthly_result(month_df("4月", [5, 3]), pd.Period("2025-04", "M"), results_dir)
+    return results_dir
+
+
+class TestEtag:
+    """ETag のテスト"""
+
+    def test_stable_without_changes(self, results_dir):
+        """月別結果が変わらなければ同じ ETag"""
+        assert pivot_with_etag(results_dir)[1] == pivot_with_etag(results_dir)[1]
+
+    def test_changes_with_results(self, results_dir):
+        """月別結果を保存し直すと ETag が変わる"""
+        _, before = pivot_with_etag(results_dir)
+        save_monthly_result(month_df("5月", [2]), pd.Period("2025-05", "M"), results_dir)
+        _, after = pivot_with_etag(results_dir)
+        assert before != after
+
+    def test_if_none_match(self):
+        """If-None-Match の一致判定（リスト・弱い ETag・* に対応）"""
+        assert etag_matches('"a"', '"a"')
+        assert etag_matches('"b", W/"a"', '"a"')
+        assert etag_matches("*", '"a"')
+        assert not etag_matches('"b"', '"a"')
+        assert not etag_matches(None, '"a"')
+
+
+class TestExportArtifact:
+    """XLSX 成果物キャッシュのテスト"""
+
+    def test_write_and_reuse(self, results_dir, output_dir):
+        """初回は生成、入力が同じなら再生成しない"""
+        path, rewritten = write_export(results_dir, output_dir)
+        assert rewritten and path == export_path(results_dir, output_dir)
+        assert path == output_dir / "monthly_stats_FY2025.xlsx"
+        assert write_export(results_dir, output_dir) == (path, False)
+
+        ws = load_workbook(path).active
+        assert [c.value for c in ws[1]][-1] == "4月"
+        assert [c.value for c in ws[2]][-1] == 5
+
+    def test_regenerates_after_save(self, results_dir, output_dir):
+        """月別結果が変わると再生成される"""
+        write_export(results_dir, output_dir)
+        save_monthly_result(month_df("5月", [2]), pd.Period("2025-05", "M"), results_dir)
+        _, etag = pivot_with_etag(results_dir)
+        assert cached_export(etag, results_dir, output_dir) is None
+
+        path, rewritten = write_export(results_dir, output_dir)
+        assert rewritten
+        assert cached_export(etag, results_dir, output_dir) == path
+        ws = load_workbook(path).active
+        assert [c.value for c in ws[1]][-2:] == ["4月", "5月"]
+
+    def test_streamed_bytes_match_artifact(self, results_dir, output_dir):
+        """ストリーミングで返したバイト列がそのまま保存される"""
+        pivot, etag = pivot_with_etag(results_dir)
+        data = b"".join(iter_export(pivot, etag, results_dir, output_dir))
+        assert cached_export(etag, results_dir, output_dir).read_bytes() == data
+
+    def test_aborted_stream_not_cached(self, results_dir, output_dir):
+        """途中で打ち切られた生成は成果物にしない"""
+        pivot, etag = pivot_with_etag(results_dir)
+        stream = iter_export(pivot, etag, results_dir, output_dir)
+        next(stream)
+        stream.close()
+        assert cached_export(etag, results_dir, output_dir) is None
+        assert list(output_dir.glob("*.tmp")) == []
+
+    def test_one_artifact_per_fiscal_year(self, results_dir, output_dir):
+        """年度ごとに別の成果物になり、他の年度の月別結果は含まない"""
+        other = fiscal_year_dir(results_dir.parent, 2026)
+        save_monthly_result(month_df("4月", [7]), pd.Period("2026-04", "M"), other)
+
+        path, _ = write_export(results_dir, output_dir)
+        other_path, _ = write_export(other, output_dir)
+        assert path != other_path
+        assert [c.value for c in load_workbook(other_path).active[2]][-1] == 7
+        assert load_workbook(path).active.max_row == 3
+
+    def test_retain_removes_stale_years(self, results_dir, output_dir):
+        """月別結果のなくなった年度の成果物・ETag と旧形式の単一の XLSX を削除する"""
+        other = fiscal_year_dir(results_dir.parent, 2026)
+        save_monthly_result(month_df("4月", [7]), pd.Period("2026-04", "M"), other)
+        path, _ = write_export(results_dir, output_dir)
+        stale, _ = write_export(other, output_dir)
+        legacy = output_dir / "monthly_stats.xlsx"
+        legacy.write_bytes(b"old")
+
+        assert retain_exports(output_dir, {results_dir.name}) == [legacy.name, stale.name]
+        assert sorted(p.name for p in output_dir.iterdir()) == [
+            path.name, f"{path.name}.etag", "results"]
+        assert retain_exports(output_dir, {results_dir.name}) == []
@@ -0,0 +1,229 @@
+"""
+services/jobs.py のユニットテスト
+
+JobQueue の実行・失敗記録・上限による拒否と、JobBatch の後処理、
+状態ファイルを共有する別のキュー（別のワーカープロセス）からの参照を検証。
+"""
+import os
+import threading
+import time
+
+import pytest
+
+from services.jobs import DONE, FAILED, RUNNING, BatchSnapshot, JobQueue
+
+
+def _wait(job, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not job.finished and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return job
+
+
+@pytest.fixture
+def queue():
+    q = JobQueue(max_workers=1, max_pending=1, max_history=2)
+    yield q
+    q.shutdown()
+
+
+class TestJobQueue:
+    """JobQueue のテスト"""
+
+    def test_job_result(self, queue):
+        """結果が ID で参照できる"""
+        job = queue.submit("a", lambda x: x * 2, 21)
+
+        assert _wait(job).status == DONE
+        assert queue.get(job.id).result == 42
+
+    def test_job_failure(self, queue):
+        """例外は FAILED として記録される"""
+        def fail():
+            raise ValueError("broken")
+
+        job = _wait(queue.submit("a", fail))
+
+        assert job.status == FAILED
+        assert job.error == "broken"
+
+    def test_rejects_when_full(self, queue):
+        """実行中 + 待機が上限に達すると None"""
+        release = threading.Event()
+        running = queue.submit("running", release.wait)
+        waiting = queue.submit("waiting", lambda: None)
+
+        assert queue.submit("rejected", lambda: None) is None
+
+        release.set()
+        _wait(running)
+        _wait(waiting)
+        assert queue.submit("accepted", lambda: None) is not None
+
+    def test_history_is_bounded(self, queue):
+        """完了済みジョブは max_history 件まで"""
+        jobs = [_wait(queue.submit(str(i), lambda: None)) for i in range(4)]
+        queue.submit("last", lambda: None)
+
+        assert queue.get(jobs[0].id) is None
+        assert queue.get(jobs[-1].id) is not None
+
+
+def _wait_batch(batch, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not batch.finished and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return batch
+
+
+class TestJobBatch:
+    """JobBatch のテスト"""
+
+    def test_finalize_once_after_all_jobs(self):
+        """全ジョブの完了後に finalize が1回だけ、全ジョブの結果を見て実行される"""
+        queue = JobQueue(max_workers=2, max_pending=8)
+        calls = []
+        release = threading.Event()
+
+        def finalize(batch):
+            calls.append([job.result for job in batch.jobs])
+            return "ok"
+
+        batch = queue.batch(finalize)
+        for i in range(4):
+            batch.submit(str(i), lambda i=i: release.wait(5) and i)
+        batch.add("skipped", "dup")
+        batch.seal()
+        assert not batch.finished
+        release.set()
+
+        assert _wait_batch(batch).result == "ok"
+        assert calls == [[0, 1, 2, 3, "dup"]]
+        assert queue.get_batch(batch.id) is batch
+        queue.shutdown()
+
+    def test_seal_after_jobs_finished(self):
+        """締め切り前に全ジョブが終わっていれば seal() で finalize する"""
+        queue = JobQueue(max_workers=1, max_pending=1)
+        batch = queue.batch(lambda b: len(b.jobs))
+        _wait(batch.submit("a", lambda: 1))
+        assert not batch.finished
+        batch.seal()
+        assert batch.finished and batch.result == 1
+        queue.shutdown()
+
+    def test_empty_and_failures(self):
+        """ジョブの失敗・finalize の例外は記録され、バッチは完了する"""
+        queue = JobQueue(max_workers=1, max_pending=1)
+        batch = queue.batch(lambda b: 1 / 0)
+        batch.submit("bad", lambda: 1 / 0)
+        batch.seal()
+        _wait_batch(batch)
+        assert batch.jobs[0].status == FAILED
+        assert batch.error is not None and batch.result is None
+
+        empty = queue.batch(lambda b: "done")
+        empty.seal()
+        assert empty.result == "done"
+        with pytest.raises(RuntimeError):
+            empty.submit("late", lambda: None)
+        queue.shutdown()
+
+    def test_rejected_job_not_counted(self):
+        """キューが満杯で拒否されたジョブはバッチに加わらず、完了を妨げない"""
+        queue = JobQueue(max_workers=1, max_pending=0)
+        release = threading.Event()
+        batch = queue.batch(lambda b: len(b.jobs))
+        assert batch.submit("a", release.wait, 5) is not None
+        assert batch.submit("b", lambda: None) is None
+        batch.seal()
+        release.set()
+        assert _wait_batch(batch).result == 1
+        queue.shutdown()
+
+
+@pytest.fixture
+def shared(output_dir):
+    """状態ファイルを共有する2つのキュー（別々のワーカープロセスに相当）"""
+    state_dir = output_dir / ".jobs"
+    owner = JobQueue(max_workers=2, max_pending=8, max_history=2, state_dir=state_dir)
+    other = JobQueue(state_dir=state_dir)
+    yield owner, other
+    owner.shutdown()
+    other.shutdown()
+
+
+class TestSharedState:
+    """state_dir の状態ファイル"""
+
+    def test_job_visible_from_other_queue(self, shared):
+        """投入していないキューからも状態と結果を読める"""
+        owner, other = shared
+        release = threading.Event()
+        job = owner.submit("a.xlsx", lambda: release.wait(5) and {"month": "2025-04", "rows": 3})
+        deadline = time.monotonic() + 5
+        while other.get(job.id).status != RUNNING and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert other.get(job.id).label == "a.xlsx"
+
+        release.set()
+        _wait(job)
+        seen = other.get(job.id)
+        assert (seen.status, seen.result, seen.finished) == (DONE, {"month": "2025-04", "rows": 3}, True)
+
+    def test_failed_job_visible(self, shared):
+        """失敗も別のキューから見える"""
+        owner, other = shared
+        job = _wait(owner.submit("bad", lambda: 1 / 0))
+        assert other.get(job.id).status == FAILED
+        assert other.get(job.id).error == job.error
+
+    def test_batch_visible_from_other_queue(self, shared):
+        """バッチのジョブの状態・完了・後処理の結果を別のキューから読める"""
+        owner, other = shared
+        release = threading.Event()
+        batch = owner.batch(lambda b: [{"year": 2025}])
+        batch.submit("a", lambda: release.wait(5) and {"month": "2025-04"})
+        batch.add("b", {"error": "skipped"})
+        batch.seal()
+
+        snapshot = other.get_batch(batch.id)
+        assert isinstance(snapshot, BatchSnapshot) and not snapshot.finished
+        assert [job.label for job in snapshot.jobs] == ["a", "b"]
+        assert snapshot.jobs[1].result == {"error": "skipped"}
+
+        release.set()
+        _wait_batch(batch)
+        snapshot = other.get_batch(batch.id)
+        assert snapshot.finished and snapshot.result == [{"year": 2025}]
+        assert [job.status for job in snapshot.jobs] == [DONE, DONE]
+        assert snapshot.jobs[0].result == {"month": "2025-04"}
+
+    def test_unknown_and_invalid_ids(self, shared):
+        """ない ID・ID の形式でないもの（パスなど）は None"""
+        _, other = shared
+        assert other.get("0" * 32) is None
+        assert other.get("../../etc/passwd") is None
+        assert other.get_batch("../x") is None
+
+    def test_pruned_jobs_removed(self, shared):
+        """max_history を超えて削除したジョブは状態ファイルも消える"""
+        owner, other = shared
+        first = [_wait(owner.submit(str(i), lambda: None)) for i in range(3)]
+        _wait(owner.submit("last", lambda: None))
+        assert other.get(first[0].id) is None
+        assert other.get(first[-1].id) is not None
+
+    def test_stale_files_swept(self, output_dir):
+        """起動時に STATE_TTL より古い状態ファイルを削除する"""
+        state_dir = output_dir / ".jobs"
+        state_dir.mkdir()
+        old = state_dir / f"job-{'a' * 32}.json"
+        new = state_dir / f"job-{'b' * 32}.json"
+        for path in (old, new):
+            path.write_text("{}", encoding="utf-8")
+        os.utime(old, (0, 0))
+
+        JobQueue(state_dir=state_dir).shutdown()
+
+        assert not old.exists() and new.exists()
@@ -0,0 +1,100 @@
+"""
+services/keycodec.py のユニットテスト
+
+コードが月をまたいで安定し、整数コード上のグループ化が
+groupby(KEY_COLS, dropna=False) と同じ結果になることを検証。
+"""
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from services import keycodec
+from services.keycodec import MISSING, KeyDictionary
+
+COLUMNS = ["教室", "担当"]
+
+
+def _frame(rooms, teachers) -> pd.DataFrame:
+    return pd.DataFrame({"教室": pd.Series(rooms, dtype="str"),
+                         "担当": pd.Series(teachers, dtype="str")})
+
+
+class TestEncode:
+    """encode() のテスト"""
+
+    def test_codes_are_stable_across_frames(self):
+        """既出の値は後の月でも同じコード"""
+        d = KeyDictionary(COLUMNS)
+        first = d.encode(_frame(["B", "A"], ["田中", "鈴木"]))
+        second = d.encode(_frame(["A", "C", "B"], ["鈴木", "田中", "佐藤"]))
+        assert first.tolist() == [[0, 0], [1, 1]]
+        assert second.tolist() == [[1, 1], [2, 0], [0, 2]]
+
+    def test_missing_and_absent_columns(self):
+        """欠損と存在しない列は MISSING"""
+        d = KeyDictionary(COLUMNS)
+        codes = d.encode(pd.DataFrame({"教室": ["A", None, np.nan]}))
+        assert codes.tolist() == [[0, MISSING], [MISSING, MISSING], [MISSING, MISSING]]
+
+    def test_categorical_matches_plain(self):
+        """category 列と文字列列で同じコード"""
+        d = KeyDictionary(COLUMNS)
+        plain = _frame(["A", None, "B"], ["x", "y", None])
+        categorical = plain.astype("category")
+        np.testing.assert_array_equal(d.encode(plain), d.encode(categorical))
+
+
+class TestUniqueRows:
+    """unique_rows() / decode() のテスト"""
+
+    def _frame_with_gaps(self) -> pd.DataFrame:
+        rng = np.random.default_rng(0)
+        return _frame(rng.choice(["B", "A", "C", None], 500),
+                      rng.choice(["鈴木", "田中", None], 500))
+
+    def test_sorted_groups_match_groupby(self):
+        """sort=True のグループ順・件数が groupby と一致"""
+        df = self._frame_with_gaps()
+        d = KeyDictionary(COLUMNS)
+        d.encode(_frame(["Z", "C"], ["佐藤", "田中"]))  # 先に別の値を登録しておく
+        inverse, keys = d.unique_rows(d.encode(df), sort=True)
+
+        result = d.decode(keys, "str")
+        result["n"] = np.bincount(inverse)
+        expected = df.groupby(COLUMNS, dropna=False).size().reset_index(name="n")
+        pd.testing.assert_frame_equal(result, expected)
+
+    def test_unsorted_groups_round_trip(self):
+        """sort=False でも各行のキーを復元できる"""
+        df = self._frame_with_gaps()
+        d = KeyDictionary(COLUMNS)
+        inverse, keys = d.unique_rows(d.encode(df))
+        pd.testing.assert_frame_equal(d.decode(keys[inverse], "str"), df)
+
+    def test_fallback_without_packing(self, monkeypatch):
+        """種類数の積が int64 を超える場合の行比較でも同じ結果"""
+        df = self._frame_with_gaps()
+        d = KeyDictionary(COLUMNS)
+        codes = d.encode(df)
+        expected = d.unique_rows(codes, sort=True)
+
+        def overflow(*args, **kwargs):
+            raise ValueError("too large")
+
+        monkeypatch.setattr(keycodec.np, "ravel_multi_index", overflow)
+        inverse, keys = d.unique_rows(codes, sort=True)
+        np.testing.assert_array_equal(inverse, expected[0])
+        np.testing.assert_array_equal(keys, expected[1])
+
+
+class TestPersistence:
+    """pickle のテスト"""
+
+    def test_pickle_keeps_codes(self):
+        """復元後も同じコードを割り当てる"""
+        d = KeyDictionary(COLUMNS)
+        codes = d.encode(_frame(["A", "B"], ["x", "y"]))
+        restored = pickle.loads(pickle.dumps(d))
+        np.testing.assert_array_equal(restored.encode(_frame(["A", "B"], ["x", "y"])), codes)
+        assert restored.encode(_frame(["C"], ["z"])).tolist() == [[2, 2]]
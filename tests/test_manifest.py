@@ -0,0 +1,146 @@
+"""
+services/manifest.py のユニットテスト
+
+変化のない入力ファイルだけが再利用対象になることを検証。
+"""
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from services import manifest as manifest_module
+from services.manifest import Manifest, find_month_source, record_month_source
+
+
+@pytest.fixture
+def workspace():
+    """(results_dir, 入力ファイル, 記録済みマニフェスト)"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        results_dir = Path(tmpdir) / "results"
+        results_dir.mkdir()
+        source = Path(tmpdir) / "list_2504.xlsx"
+        source.write_bytes(b"roster v1")
+        (results_dir / "2025-04.csv").write_text("dummy")
+
+        manifest = Manifest.load(results_dir)
+        manifest.record("lists/list_2504.xlsx", source, "2025-04", "2025-04.csv")
+        manifest.save()
+        yield results_dir, source, Manifest.load(results_dir)
+
+
+def _record_months(results_dir: Path, prefix: str, count: int) -> None:
+    """別プロセスから count 件のソースを記録する"""
+    for i in range(count):
+        record_month_source(results_dir, f"{prefix}-{i:02d}", prefix, f"{prefix}-{i:02d}.csv", i)
+
+
+class TestManifest:
+    """Manifest.unchanged() のテスト"""
+
+    def test_result_in_fiscal_year_dir(self, workspace):
+        """結果は results_dir からの相対パス（年度ディレクトリ）で記録できる"""
+        results_dir, source, manifest = workspace
+        (results_dir / "FY2025").mkdir()
+        (results_dir / "2025-04.csv").rename(results_dir / "FY2025" / "2025-04.csv")
+        assert manifest.unchanged("lists/list_2504.xlsx", source) is None
+
+        manifest.record("lists/list_2504.xlsx", source, "2025-04", "FY2025/2025-04.csv")
+        assert manifest.unchanged("lists/list_2504.xlsx", source) is not None
+
+    def test_unchanged_file_is_reused(self, workspace):
+        """保存・再読み込み後も変化なしと判定"""
+        _, source, manifest = workspace
+
+        record = manifest.unchanged("lists/list_2504.xlsx", source)
+
+        assert record is not None
+        assert record.result == "2025-04.csv"
+
+    def test_unknown_file(self, workspace):
+        """未記録のファイルは再集計対象"""
+        _, source, manifest = workspace
+        assert manifest.unchanged("lists/other_2505.xlsx", source) is None
+
+    def test_changed_content(self, workspace):
+        """内容が変わったファイルは再集計対象"""
+        _, source, manifest = workspace
+        source.write_bytes(b"roster v2")
+
+        assert manifest.unchanged("lists/list_2504.xlsx", source) is None
+
+    def test_touched_without_change(self, workspace):
+        """mtime だけ変わった場合はハッシュ一致で再利用"""
+        _, source, manifest = workspace
+        st = source.stat()
+        os.utime(source, ns=(st.st_atime_ns, st.st_mtime_ns + 10_000_000_000))
+
+        assert manifest.unchanged("lists/list_2504.xlsx", source) is not None
+
+    def test_missing_result_file(self, workspace):
+        """月別結果が消えていれば再集計対象"""
+        results_dir, source, manifest = workspace
+        (results_dir / "2025-04.csv").unlink()
+
+        assert manifest.unchanged("lists/list_2504.xlsx", source) is None
+
+    def test_aggregator_version_change(self, workspace, monkeypatch):
+        """集計版が変わると全ファイル再集計対象"""
+        _, source, manifest = workspace
+        monkeypatch.setattr(manifest_module, "AGGREGATOR_VERSION", "999")
+
+        assert manifest.unchanged("lists/list_2504.xlsx", source) is None
+
+    def test_corrupt_manifest_is_empty(self, workspace):
+        """壊れたマニフェストは空として扱う"""
+        results_dir, _, _ = workspace
+        (results_dir / manifest_module.MANIFEST_FILENAME).write_text("{broken")
+
+        assert Manifest.load(results_dir).records == {}
+
+
+class TestMonthSource:
+    """record_month_source() / find_month_source() のテスト"""
+
+    def test_same_hash_is_found(self, workspace):
+        """同じ sha256 なら保存済みの記録を返す"""
+        results_dir, _, _ = workspace
+        record_month_source(results_dir, "2025-04", "abc", "2025-04.csv", 12)
+
+        entry = find_month_source(results_dir, "2025-04", "abc")
+
+        assert entry is not None
+        assert entry["rows"] == 12
+
+    def test_different_hash_or_month(self, workspace):
+        """sha256 や月が違えば None"""
+        results_dir, _, _ = workspace
+        record_month_source(results_dir, "2025-04", "abc", "2025-04.csv", 12)
+
+        assert find_month_source(results_dir, "2025-04", "def") is None
+        assert find_month_source(results_dir, "2025-05", "abc") is None
+
+    def test_result_in_other_format(self, workspace):
+        """結果が別形式に変換されていても有効、結果がなくなれば None"""
+        results_dir, _, _ = workspace
+        record_month_source(results_dir, "2025-04", "abc", "2025-04.csv", 12)
+        (results_dir / "2025-04.csv").rename(results_dir / "2025-04.mcol")
+
+        assert find_month_source(results_dir, "2025-04", "abc") is not None
+
+        (results_dir / "2025-04.mcol").unlink()
+        assert find_month_source(results_dir, "2025-04", "abc") is None
+
+    def test_concurrent_processes_keep_all_entries(self, workspace):
+        """複数プロセスが同時に記録しても、互いの記録を消さない"""
+        results_dir, _, _ = workspace
+        prefixes = ["p0", "p1", "p2", "p3"]
+        with ProcessPoolExecutor(len(prefixes), mp_context=multiprocessing.get_context("fork")) as pool:
+            list(pool.map(_record_months, [results_dir] * len(prefixes), prefixes, [15] * len(prefixes)))
+
+        sources = manifest_module._read_sources(results_dir)
+        assert len(sources) == 15 * len(prefixes)
+        assert sources["p2-14"]["sha256"] == "p2"
+        assert not list(results_dir.glob("*.tmp"))
@@ -0,0 +1,131 @@
+"""
+services/metrics.py のユニットテスト
+"""
+import json
+import logging
+
+import pytest
+
+from services import metrics
+from services.metrics import counter, histogram, render_prometheus, request_trace, stage
+
+
+class TestCounter:
+    """counter() / render_prometheus() のテスト"""
+
+    def test_same_name_returns_same_counter(self):
+        """同じ名前は同じカウンター"""
+        a = counter("test_same_total", "test")
+        b = counter("test_same_total", "test")
+        a.inc()
+        b.inc(2)
+
+        assert a is b
+        assert a.value == 3
+
+    def test_prometheus_text(self):
+        """HELP / TYPE / 値の3行で出力"""
+        counter("test_render_total", "レンダリング確認").inc()
+
+        text = render_prometheus()
+
+        assert "# HELP test_render_total レンダリング確認\n" in text
+        assert "# TYPE test_render_total counter\n" in text
+        assert "\ntest_render_total 1\n" in text
+
+    def test_labeled_counter(self):
+        """ラベル値ごとに数え、ラベル付きで出力"""
+        c = counter("test_labeled_total", "ラベル付き", "stage")
+        c.inc(3, "read")
+        c.inc(2, "read")
+        c.inc(1, "save")
+
+        assert c.get("read") == 5
+        text = render_prometheus()
+        assert '\ntest_labeled_total{stage="read"} 5\n' in text
+        assert '\ntest_labeled_total{stage="save"} 1\n' in text
+
+
+class TestHistogram:
+    """histogram() のテスト"""
+
+    def test_cumulative_buckets(self):
+        """バケットは累積、+Inf・_sum・_count を出力"""
+        h = histogram("test_seconds", "時間", buckets=(0.1, 1.0), label_name="stage")
+        for v in (0.05, 0.5, 0.7, 3.0):
+            h.observe(v, "read")
+
+        text = render_prometheus()
+        assert '\ntest_seconds_bucket{stage="read",le="0.1"} 1\n' in text
+        assert '\ntest_seconds_bucket{stage="read",le="1"} 3\n' in text
+        assert '\ntest_seconds_bucket{stage="read",le="+Inf"} 4\n' in text
+        assert '\ntest_seconds_sum{stage="read"} 4.25\n' in text
+        assert '\ntest_seconds_count{stage="read"} 4\n' in text
+
+
+class TestStage:
+    """stage() / request_trace() のテスト"""
+
+    def test_stage_records_metrics(self):
+        """所要時間・行数・バイト数をメトリクスに記録"""
+        before = metrics.stage_seconds.count("test_stage")
+        rows_in = metrics.stage_rows_in.get("test_stage")
+
+        with stage("test_stage") as s:
+            s.rows_in = 10
+            s.rows_out = 4
+            s.bytes_read = 1024
+
+        assert metrics.stage_seconds.count("test_stage") == before + 1
+        assert metrics.stage_rows_in.get("test_stage") == rows_in + 10
+        assert s.seconds >= 0
+
+    def test_rss_high_water_growth(self):
+        """最大 RSS の増分はプロセス全体の最大値の差で、以前の最大を超えない段階は 0"""
+        if metrics.peak_rss() is None:
+            pytest.skip("ru_maxrss を取得できない環境")
+        before = metrics.stage_rss_hwm_growth.count("test_rss")
+        with stage("test_rss") as s:
+            pass
+        assert s.rss_hwm_growth == 0
+        assert metrics.stage_rss_hwm_growth.count("test_rss") == before + 1
+        assert "stage_rss_high_water_growth_bytes_count" in render_prometheus()
+
+    def test_trace_logs_one_json_line(self, caplog):
+        """request_trace の範囲の段階を1行の JSON ログにまとめる"""
+        with caplog.at_level(logging.INFO, logger="services.metrics"):
+            with request_trace("upload", file="a_2504.xlsx"):
+                with stage("load_excel") as s:
+                    s.rows_out = 5
+                with stage("aggregate"):
+                    pass
+
+        [record] = [r for r in caplog.records if r.name == "services.metrics"]
+        entry = json.loads(record.getMessage())
+        assert entry["event"] == "upload"
+        assert entry["file"] == "a_2504.xlsx"
+        assert [s["name"] for s in entry["stages"]] == ["load_excel", "aggregate"]
+        assert entry["stages"][0]["rows_out"] == 5
+
+    def test_error_is_recorded(self, caplog):
+        """段階内の例外は error として記録し、そのまま送出"""
+        with caplog.at_level(logging.INFO, logger="services.metrics"):
+            with pytest.raises(ValueError):
+                with request_trace("upload"), stage("aggregate"):
+                    raise ValueError("bad")
+
+        entry = json.loads(caplog.records[-1].getMessage())
+        assert entry["error"] == "ValueError"
+        assert entry["stages"][0]["error"] == "ValueError"
+
+    def test_disabled_is_noop(self, monkeypatch, caplog):
+        """STAGE_METRICS 無効時は何も記録しない"""
+        monkeypatch.setattr(metrics, "STAGE_METRICS", False)
+        before = metrics.stage_seconds.count("disabled_stage")
+
+        with caplog.at_level(logging.INFO, logger="services.metrics"):
+            with request_trace("upload"), stage("disabled_stage") as s:
+                s.rows_in = 1
+
+        assert metrics.stage_seconds.count("disabled_stage") == before
+        assert caplog.records == []
@@ -0,0 +1,32 @@
+"""
+scripts/migrate_results.py のテスト
+
+CSV を .mcol に変換した後、年度のサマリーが新しい世代番号で書き直されていることを検証。
+"""
+import pandas as pd
+
+from scripts import migrate_results
+from services.aggregator import build_pivot, save_monthly_result
+from services.atomic_io import read_generation
+from services.summary import read_summary, write_summary
+from tests.helpers import month_df
+
+
+class TestMigrate:
+    """CSV → .mcol の変換"""
+
+    def test_summary_rewritten(self, results_dir):
+        """変換後もサマリーが有効で、トップ画面がピボットを組み立て直さない"""
+        save_monthly_result(month_df("4月", [5, 3]), pd.Period("2025-04", "M"), results_dir, fmt="csv")
+        save_monthly_result(month_df("5月", [2]), pd.Period("2025-05", "M"), results_dir, fmt="csv")
+        before = write_summary(results_dir, build_pivot(results_dir), read_generation(results_dir))
+
+        assert migrate_results.main(["--results-dir", str(results_dir.parent)]) == 0
+
+        assert sorted(p.name for p in results_dir.glob("*.csv")) == []
+        assert sorted(p.name for p in results_dir.glob("*.mcol")) == ["2025-04.mcol", "2025-05.mcol"]
+        summary = read_summary(results_dir)
+        assert summary is not None
+        assert summary["generation"] == read_generation(results_dir) > before["generation"]
+        assert {k: v for k, v in summary.items() if k != "generation"} == \
+            {k: v for k, v in before.items() if k != "generation"}
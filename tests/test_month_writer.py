@@ -0,0 +1,59 @@
+"""
+services/month_writer.py のユニットテスト
+
+月別結果・キューブ・ソース記録が同じ月ロックの中で書かれ、世代番号が1回だけ進むことを検証。
+"""
+import threading
+import time
+
+import pandas as pd
+
+from services.aggregator import CUBE_COLS
+from services.atomic_io import month_lock, read_generation
+from services.cube import load_cube, load_rollups
+from services.manifest import find_month_source
+from services.month_writer import save_month
+from tests.helpers import uniform_month_df
+
+
+class TestSaveMonth:
+    """save_month() のテスト"""
+
+    def test_records_source(self, results_dir):
+        """月別結果を保存してソースを記録し、世代番号を1つ進める"""
+        path = save_month(uniform_month_df("4月", 2), pd.Period("2025-04", "M"), results_dir, "abc")
+        entry = find_month_source(results_dir, "2025-04", "abc")
+        assert entry == {**entry, "result": path.name, "rows": 3}
+        assert read_generation(results_dir) == 1
+
+    def test_without_source(self, results_dir):
+        """sha256 がなければソースは記録しない"""
+        save_month(uniform_month_df("4月", 2), pd.Period("2025-04", "M"), results_dir)
+        assert find_month_source(results_dir, "2025-04", "abc") is None
+        assert read_generation(results_dir) == 1
+
+    def test_source_written_under_month_lock(self, results_dir):
+        """月ロック中はソースの記録も待たされる（結果とソースが別のアップロードの組にならない）"""
+        month = pd.Period("2025-04", "M")
+        saved = threading.Event()
+
+        def save():
+            save_month(uniform_month_df("4月", 2), month, results_dir, "abc")
+            saved.set()
+
+        with month_lock(results_dir, str(month)):
+            thread = threading.Thread(target=save)
+            thread.start()
+            time.sleep(0.2)
+            assert find_month_source(results_dir, "2025-04", "abc") is None
+        thread.join()
+        assert saved.is_set()
+        assert find_month_source(results_dir, "2025-04", "abc") is not None
+
+    def test_cube_in_same_save(self, results_dir):
+        """キューブとロールアップも同じ保存で書き、世代番号は1回だけ進める"""
+        cube = pd.DataFrame({**{c: ["x", "y"] for c in CUBE_COLS}, "4月": [2, 5]})
+        save_month(uniform_month_df("4月", 2), pd.Period("2025-04", "M"), results_dir, "abc", cube)
+        assert load_cube(results_dir, "2025-04")["4月"].tolist() == [2, 5]
+        assert load_rollups(results_dir)["2025-04"]["total"] == 7
+        assert read_generation(results_dir) == 1
@@ -0,0 +1,148 @@
+"""
+services/pivot_cache.py のユニットテスト
+
+cached_pivot() が build_pivot() と同一の結果を返し、
+変化した月ファイルだけを読み直すことを検証。
+"""
+import os
+import pickle
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from services import pivot_cache
+from services.aggregator import build_pivot, save_monthly_result
+from services.pivot_cache import PivotCache
+from tests.helpers import month_df
+
+
+@pytest.fixture
+def results_dir(results_dir):
+    save_monthly_result(month_df("4月", [5, 3, 1]), pd.Period("2025-04", "M"), results_dir)
+    save_monthly_result(month_df("5月", [6, 2]), pd.Period("2025-05", "M"), results_dir)
+    save_monthly_result(month_df("4月", [1]), pd.Period("2026-04", "M"), results_dir)
+    return results_dir
+
+
+@pytest.fixture
+def read_calls(monkeypatch):
+    """read_month_codes の呼び出し対象ファイル名を記録"""
+    calls = []
+    original = pivot_cache.read_month_codes
+
+    def counting(path, dictionary):
+        calls.append(path.name)
+        return original(path, dictionary)
+
+    monkeypatch.setattr(pivot_cache, "read_month_codes", counting)
+    return calls
+
+
+class TestPivotCache:
+    """PivotCache のテスト"""
+
+    def test_matches_build_pivot(self, results_dir):
+        """build_pivot() と同一の結果"""
+        pd.testing.assert_frame_equal(PivotCache(results_dir).get(), build_pivot(results_dir))
+
+    def test_unchanged_files_are_not_reread(self, results_dir, read_calls):
+        """2回目以降は CSV を読み直さない"""
+        cache = PivotCache(results_dir)
+        first = cache.get()
+        read_calls.clear()
+
+        assert cache.get() is first
+        assert read_calls == []
+
+    def test_only_changed_month_is_reread(self, results_dir, read_calls):
+        """保存し直した月だけを読み直し、結果は build_pivot() と一致"""
+        cache = PivotCache(results_dir)
+        cache.get()
+        read_calls.clear()
+
+        save_monthly_result(month_df("5月", [9, 9, 9]), pd.Period("2025-05", "M"), results_dir)
+        pivot = cache.get()
+
+        assert read_calls == ["2025-05.csv"]
+        pd.testing.assert_frame_equal(pivot, build_pivot(results_dir))
+
+    def test_removed_month_is_dropped(self, results_dir):
+        """削除された月ファイルはピボットから消える"""
+        cache = PivotCache(results_dir)
+        cache.get()
+
+        (results_dir / "2025-05.csv").unlink()
+
+        pd.testing.assert_frame_equal(cache.get(), build_pivot(results_dir))
+
+    def test_touch_without_change_is_not_reread(self, results_dir, read_calls):
+        """mtime だけ変わってもハッシュが同じなら読み直さない"""
+        cache = PivotCache(results_dir)
+        cache.get()
+        read_calls.clear()
+
+        path = results_dir / "2025-04.csv"
+        st = path.stat()
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10_000_000_000))
+        cache.get()
+
+        assert read_calls == []
+
+    def test_disk_cache_survives_new_instance(self, results_dir, read_calls):
+        """ディスクキャッシュにより新しいプロセス相当でも CSV を読み直さない"""
+        PivotCache(results_dir).get()
+        read_calls.clear()
+
+        pivot = PivotCache(results_dir).get()
+
+        assert read_calls == []
+        pd.testing.assert_frame_equal(pivot, build_pivot(results_dir))
+
+    def test_corrupt_disk_cache_is_ignored(self, results_dir):
+        """壊れたディスクキャッシュは無視して再構築"""
+        (results_dir / pivot_cache.CACHE_FILENAME).write_bytes(b"broken")
+
+        pd.testing.assert_frame_equal(PivotCache(results_dir).get(), build_pivot(results_dir))
+
+    def test_disk_cache_is_not_pickle(self, results_dir):
+        """ディスクキャッシュは pickle を使わない npz（allow_pickle=False で読める）"""
+        PivotCache(results_dir).get()
+        with np.load(results_dir / pivot_cache.CACHE_FILENAME, allow_pickle=False) as data:
+            assert "meta" in data.files
+            assert all(data[name].dtype != object for name in data.files)
+
+    def test_legacy_pickle_is_never_loaded(self, results_dir):
+        """results_dir に置かれた旧形式の pickle は読み込まず（コードを実行せず）削除する"""
+        marker = results_dir / "executed"
+        legacy = results_dir / ".pivot_cache.pkl"
+        legacy.write_bytes(pickle.dumps(_Payload(str(marker))))
+
+        pd.testing.assert_frame_equal(PivotCache(results_dir).get(), build_pivot(results_dir))
+        assert not marker.exists()
+        assert not legacy.exists()
+
+    def test_codes_outside_dictionary_are_ignored(self, results_dir, read_calls):
+        """辞書の範囲外を指すコードを含むキャッシュは無視して読み直す"""
+        PivotCache(results_dir).get()
+        path = results_dir / pivot_cache.CACHE_FILENAME
+        with np.load(path, allow_pickle=False) as data:
+            arrays = {name: data[name] for name in data.files}
+        arrays["column0_keys"] = arrays["column0_keys"] + 1000
+        with path.open("wb") as f:
+            np.savez(f, **arrays)
+        read_calls.clear()
+
+        pd.testing.assert_frame_equal(PivotCache(results_dir).get(), build_pivot(results_dir))
+        assert read_calls
+
+
+class _Payload:
+    """読み込まれると marker を作る pickle"""
+
+    def __init__(self, marker: str):
+        self.marker = marker
+
+    def __reduce__(self):
+        return (Path(self.marker).touch, ())
@@ -0,0 +1,180 @@
+"""
+services/pivot_index.py のユニットテスト
+
+索引による絞り込み・月範囲・合算・ページングの結果が、
+ピボットを pandas で直接絞り込んだ結果と一致することを検証。
+"""
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.aggregator import KEY_COLS, build_pivot, save_monthly_result, store_only
+from services.pivot_index import MAX_LIMIT, PivotIndex, QueryError, pivot_index, store_query
+
+
+@pytest.fixture
+def pivot():
+    return pd.DataFrame({
+        "学年": ["高1", "高2", "高2", "高2", "高3"],
+        "教室": ["Room A", "Room A", "Room A", "Room B", "Room B"],
+        "講座名": ["English", "English", "Math", "Math", "Math"],
+        "M/C": ["【マスター】", "【コア】", np.nan, "【コア】", "【マスター】"],
+        "担当": ["田中", "鈴木", "田中", "鈴木", "佐藤"],
+        "4月": [5, 3, 1, 0, 2],
+        "5月": [6, 2, 0, 4, 0],
+        "3月": [1, 0, 0, 0, 7],
+    })
+
+
+class TestSelect:
+    """絞り込み"""
+
+    def test_no_filter_returns_all_rows(self, pivot):
+        result = PivotIndex(pivot).query()
+        assert result["total_rows"] == 5
+        assert [r["担当"] for r in result["rows"]] == list(pivot["担当"])
+        assert result["rows"][0]["counts"] == {"4月": 5, "5月": 6, "3月": 1}
+        assert result["rows"][0]["total"] == 12
+
+    def test_and_between_columns(self, pivot):
+        result = PivotIndex(pivot).query({"grade": ["高2"], "教室": ["Room A"]})
+        assert [(r["講座名"], r["担当"]) for r in result["rows"]] == [("English", "鈴木"), ("Math", "田中")]
+
+    def test_or_within_column(self, pivot):
+        result = PivotIndex(pivot).query({"teacher": ["田中", "佐藤"]})
+        assert [r["担当"] for r in result["rows"]] == ["田中", "田中", "佐藤"]
+
+    def test_missing_value_matches_empty_string(self, pivot):
+        result = PivotIndex(pivot).query({"class_type": [""]})
+        assert len(result["rows"]) == 1
+        assert result["rows"][0]["M/C"] is None
+
+    def test_unknown_value_is_empty(self, pivot):
+        result = PivotIndex(pivot).query({"teacher": ["山田"]})
+        assert result["total_rows"] == 0
+        assert result["rows"] == []
+
+    def test_unknown_field_raises(self, pivot):
+        with pytest.raises(QueryError):
+            PivotIndex(pivot).query({"生徒": ["x"]})
+
+
+class TestMonthsAndGrouping:
+    """月範囲と合算"""
+
+    def test_month_range_in_fiscal_order(self, pivot):
+        result = PivotIndex(pivot).query(month_from="5月", month_to="3月")
+        assert result["months"] == ["5月", "3月"]
+
+    def test_rows_with_no_counts_in_range_are_dropped(self, pivot):
+        result = PivotIndex(pivot).query(month_from="3月")
+        assert [r["担当"] for r in result["rows"]] == ["田中", "佐藤"]
+
+    def test_invalid_month_raises(self, pivot):
+        with pytest.raises(QueryError):
+            PivotIndex(pivot).query(month_from="13月")
+        with pytest.raises(QueryError):
+            PivotIndex(pivot).query(month_from="3月", month_to="4月")
+
+    def test_group_by_matches_pandas(self, pivot):
+        result = PivotIndex(pivot).query({"grade": ["高2"]}, group_by=["teacher"])
+        expected = (pivot[pivot["学年"] == "高2"]
+                    .groupby("担当")[["4月", "5月", "3月"]].sum())
+        assert result["group_by"] == ["担当"]
+        assert {r["担当"]: list(r["counts"].values()) for r in result["rows"]} == \
+            {k: list(v) for k, v in expected.iterrows()}
+
+    def test_empty_group_by_is_grand_total(self, pivot):
+        result = PivotIndex(pivot).query(group_by=[])
+        assert result["rows"] == [{"counts": {"4月": 11, "5月": 12, "3月": 8}, "total": 31}]
+        assert result["totals"] == {"4月": 11, "5月": 12, "3月": 8}
+
+
+class TestPagination:
+    """ページング"""
+
+    def test_pages_cover_all_rows(self, pivot):
+        index = PivotIndex(pivot)
+        first = index.query(limit=2)
+        assert first["next_offset"] == 2
+        rows = first["rows"]
+        offset = first["next_offset"]
+        while offset is not None:
+            page = index.query(offset=offset, limit=2)
+            rows += page["rows"]
+            offset = page["next_offset"]
+        assert rows == index.query()["rows"]
+
+    def test_totals_cover_all_pages(self, pivot):
+        result = PivotIndex(pivot).query(limit=1)
+        assert len(result["rows"]) == 1
+        assert result["totals"]["4月"] == 11
+
+    def test_invalid_limit_raises(self, pivot):
+        with pytest.raises(QueryError):
+            PivotIndex(pivot).query(limit=MAX_LIMIT + 1)
+        with pytest.raises(QueryError):
+            PivotIndex(pivot).query(offset=-1)
+
+
+class TestPivotIndexCache:
+    """pivot_index() の再利用"""
+
+    def test_reused_until_results_change(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            results_dir = Path(tmpdir)
+            month = pd.DataFrame({c: ["x"] for c in KEY_COLS} | {"4月": [3]})
+            save_monthly_result(month, pd.Period("2025-04", "M"), results_dir)
+            index = pivot_index(results_dir)
+            assert pivot_index(results_dir) is index
+
+            month["4月"] = [9]
+            save_monthly_result(month, pd.Period("2025-04", "M"), results_dir)
+            updated = pivot_index(results_dir)
+            assert updated is not index
+            assert updated.query()["totals"] == {"4月": 9}
+
+    def test_empty_results(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            result = pivot_index(Path(tmpdir)).query()
+            assert result["total_rows"] == 0
+            assert result["rows"] == []
+
+
+class TestStoreQuery:
+    """store_query()（SQLite ストアの SQL 集計）が PivotIndex.query() と一致すること"""
+
+    @pytest.fixture
+    def store_dir(self, pivot):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            results_dir = Path(tmpdir)
+            for month, label in (("2025-04", "4月"), ("2025-05", "5月"), ("2026-03", "3月")):
+                frame = pivot[[*KEY_COLS, label]]
+                save_monthly_result(frame[frame[label] > 0], pd.Period(month, "M"), results_dir,
+                                    fmt="sqlite")
+            assert store_only(results_dir)
+            yield results_dir
+
+    @pytest.mark.parametrize("args", [
+        {},
+        {"filters": {"grade": ["高2"], "教室": ["Room A"]}},
+        {"filters": {"class_type": [""]}},
+        {"filters": {"teacher": ["田中", "佐藤"]}, "month_from": "5月"},
+        {"group_by": ["担当"]},
+        {"group_by": ["classroom", "M/C"], "month_to": "5月"},
+        {"group_by": []},
+        {"filters": {"teacher": ["山田"]}, "group_by": ["学年"]},
+        {"offset": 1, "limit": 2},
+    ])
+    def test_matches_pivot_index(self, store_dir, args):
+        expected = PivotIndex(build_pivot(store_dir)).query(**args)
+        assert store_query(store_dir, **args) == expected
+
+    def test_unknown_field_raises(self, store_dir):
+        with pytest.raises(QueryError):
+            store_query(store_dir, {"生徒": ["x"]})
+        with pytest.raises(QueryError):
+            store_query(store_dir, group_by=["生徒"])
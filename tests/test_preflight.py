@@ -0,0 +1,137 @@
+"""
+services/preflight.py のユニットテスト
+
+名簿 Excel の先頭だけを読む形式確認（ヘッダー・日付列・学年コード）と、
+確認済みテンプレートのキャッシュを検証。
+"""
+import io
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+from openpyxl import Workbook
+
+from services.aggregator import COLUMN_INDICES, load_excel
+from services.preflight import PREFLIGHT_ROWS, SchemaError, clear_cache, preflight
+
+WIDTH = max(COLUMN_INDICES.values()) + 1
+
+
+def _workbook(rows: list[dict], header: list | None = None) -> bytes:
+    """Row 1-3 タイトル、Row 4 ヘッダー、Row 5 以降に rows（列名 → 値）"""
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["受講者リスト"])
+    ws.append([])
+    ws.append([])
+    ws.append(header if header is not None else [f"列{i + 1}" for i in range(WIDTH)])
+    for values in rows:
+        row = [None] * WIDTH
+        for name, value in values.items():
+            row[COLUMN_INDICES[name]] = value
+        ws.append(row)
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+def _row(**overrides) -> dict:
+    row = {"add_date": datetime(2025, 4, 1), "cancel_date": None, "course": "英語",
+           "class_type": "【コア】", "classroom": "本校", "grade": 31, "teacher": "田中"}
+    row.update(overrides)
+    return row
+
+
+@pytest.fixture(autouse=True)
+def _fresh_cache():
+    clear_cache()
+    yield
+    clear_cache()
+
+
+class TestPreflight:
+    """preflight() のテスト"""
+
+    def test_accepts_roster(self):
+        """COLUMN_INDICES 配置の名簿は通り、ヘッダーのフィンガープリントを返す"""
+        rows = [_row(), _row(add_date="2025/04/07", cancel_date=datetime(2025, 5, 1)),
+                _row(grade="32"), {}]
+        assert len(preflight(_workbook(rows))) == 64
+
+    def test_benchmark_roster(self):
+        """合成名簿（dimension のないシート）も通る"""
+        from benchmarks.roster import cached_roster
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = cached_roster(Path(tmpdir), 200, seed=2)
+            preflight(path)
+
+    def test_rejects_non_date(self):
+        """日付列の値の過半数が日付でなければ、列と行を挙げて SchemaError"""
+        with pytest.raises(SchemaError) as e:
+            preflight(_workbook([_row(), _row(add_date="英語"), _row(add_date="数学")]))
+        assert e.value.problems == ["C 列（受講追加日付）の Row 6 「英語」が日付ではありません",
+                                    "C 列（受講追加日付）の Row 7 「数学」が日付ではありません"]
+
+    def test_tolerates_minority(self):
+        """日付でない・整数でない値が列の一部だけなら通る（load_excel は欠損として読む）"""
+        preflight(_workbook([_row(), _row(), _row(add_date="英語", grade="高1")]))
+
+    def test_tolerates_placeholder(self):
+        """取消日付の "-" などの埋め草は空欄と同じ扱い"""
+        preflight(_workbook([_row(), _row(cancel_date="-")]))
+        preflight(_workbook([_row(cancel_date="－", grade="-")]))
+
+    def test_rejects_numeric_date(self):
+        """日付書式のない数値は日付として扱わない（列がずれている場合など）"""
+        with pytest.raises(SchemaError, match="G 列"):
+            preflight(_workbook([_row(cancel_date=45000)]))
+
+    def test_rejects_grade(self):
+        """学年コードが整数でなければ SchemaError"""
+        with pytest.raises(SchemaError, match="P 列（学年コード）"):
+            preflight(_workbook([_row(grade="高1")]))
+
+    def test_rejects_missing_header(self):
+        """ヘッダー行の必須列が空なら SchemaError"""
+        header = [f"列{i + 1}" for i in range(WIDTH)]
+        header[COLUMN_INDICES["teacher"]] = None
+        with pytest.raises(SchemaError, match="AA 列（担当）が空"):
+            preflight(_workbook([_row()], header=header))
+        with pytest.raises(SchemaError, match="ヘッダー行"):
+            preflight(_workbook([], header=[]))
+
+    def test_rejects_non_xlsx(self):
+        """xlsx でなければ SchemaError"""
+        with pytest.raises(SchemaError, match="読み込めません"):
+            preflight(b"not a workbook")
+
+    def test_samples_only_head(self):
+        """確認するのは先頭 PREFLIGHT_ROWS 行だけ"""
+        rows = [_row()] * PREFLIGHT_ROWS + [_row(grade="x")]
+        preflight(_workbook(rows))
+
+    def test_message_is_bounded(self):
+        """問題が多くてもメッセージは先頭の数件と件数だけ"""
+        with pytest.raises(SchemaError) as e:
+            preflight(_workbook([_row(add_date="x", grade="y")] * 10))
+        assert len(e.value.problems) == 20
+        assert "ほか 15 件" in str(e.value)
+
+    def test_restores_file_position(self):
+        """ファイルオブジェクトの位置を戻し、そのまま load_excel できる"""
+        with tempfile.SpooledTemporaryFile(max_size=1024) as f:
+            f.write(_workbook([_row(), _row()]))
+            f.seek(0)
+            preflight(f)
+            assert f.tell() == 0
+            assert len(load_excel(f)) == 2
+
+    def test_cached_template_skips_rows(self):
+        """確認済みのヘッダーと同じテンプレートはデータ行の確認を省く"""
+        fingerprint = preflight(_workbook([_row()]))
+        assert preflight(_workbook([_row(grade="x")])) == fingerprint
+        clear_cache()
+        with pytest.raises(SchemaError):
+            preflight(_workbook([_row(grade="x")]))
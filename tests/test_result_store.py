@@ -0,0 +1,199 @@
+"""
+services/result_store.py のユニットテスト
+
+SQLite ストアに保存した月別結果から作るピボットが CSV 保存時の build_pivot() と一致すること、
+月の置き換えが原子的に行われること、SQL の集計で絞り込めることを検証。
+"""
+import sqlite3
+import tempfile
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.aggregator import (
+    KEY_COLS,
+    RESULTS_DB,
+    build_pivot,
+    has_month_result,
+    query_store,
+    result_store,
+    save_monthly_result,
+    store_version,
+)
+from services.pivot_cache import PivotCache
+from services.result_store import ResultStore
+from tests.helpers import month_df
+
+
+MONTHS = [("2025-04", "4月", [5, 3, 1]), ("2025-05", "5月", [6, 2]), ("2026-04", "4月", [1])]
+
+
+def _save_all(results_dir: Path, fmt: str) -> None:
+    for month, label, counts in MONTHS:
+        save_monthly_result(month_df(label, counts), pd.Period(month, "M"), results_dir, fmt=fmt)
+
+
+@pytest.fixture
+def dirs():
+    with tempfile.TemporaryDirectory() as a, tempfile.TemporaryDirectory() as b:
+        yield Path(a), Path(b)
+
+
+class TestSqliteBackend:
+    """save_monthly_result(fmt="sqlite") と build_pivot()"""
+
+    def test_pivot_matches_csv(self, dirs):
+        csv_dir, db_dir = dirs
+        _save_all(csv_dir, "csv")
+        _save_all(db_dir, "sqlite")
+        assert not list(db_dir.glob("*.csv"))
+        pd.testing.assert_frame_equal(build_pivot(db_dir), build_pivot(csv_dir))
+
+    def test_replace_month(self, dirs):
+        csv_dir, db_dir = dirs
+        for d, fmt in ((csv_dir, "csv"), (db_dir, "sqlite")):
+            _save_all(d, fmt)
+            save_monthly_result(month_df("5月", [9]), pd.Period("2025-05", "M"), d, fmt=fmt)
+        pd.testing.assert_frame_equal(build_pivot(db_dir), build_pivot(csv_dir))
+
+    def test_switching_format_moves_month(self, dirs):
+        """別形式で保存し直した月は元の形式から消え、二重計上されない"""
+        csv_dir, db_dir = dirs
+        _save_all(csv_dir, "csv")
+        _save_all(db_dir, "sqlite")
+        save_monthly_result(month_df("4月", [5, 3, 1]), pd.Period("2025-04", "M"), db_dir, fmt="csv")
+        assert "2025-04" not in result_store(db_dir).months()
+        assert has_month_result(db_dir, "2025-04")
+        pd.testing.assert_frame_equal(build_pivot(db_dir), build_pivot(csv_dir))
+
+        save_monthly_result(month_df("4月", [5, 3, 1]), pd.Period("2025-04", "M"), db_dir, fmt="sqlite")
+        assert not (db_dir / "2025-04.csv").exists()
+        pd.testing.assert_frame_equal(build_pivot(db_dir), build_pivot(csv_dir))
+
+    def test_pivot_cache_follows_store(self, dirs):
+        _, db_dir = dirs
+        _save_all(db_dir, "sqlite")
+        cache = PivotCache(db_dir)
+        first, fingerprint = cache.snapshot()
+        assert cache.snapshot()[0] is first
+
+        save_monthly_result(month_df("5月", [7, 7]), pd.Period("2025-05", "M"), db_dir, fmt="sqlite")
+        pivot, updated = cache.snapshot()
+        assert updated != fingerprint
+        pd.testing.assert_frame_equal(pivot, build_pivot(db_dir))
+        assert PivotCache(db_dir).snapshot()[1] == updated
+
+    def test_query_store(self, dirs):
+        _, db_dir = dirs
+        _save_all(db_dir, "sqlite")
+        pivot = build_pivot(db_dir)
+        expected = pivot[pivot["教室"] == "Room A"].reset_index(drop=True)
+        pd.testing.assert_frame_equal(query_store({"教室": ["Room A"]}, db_dir), expected)
+
+    def test_missing_key_is_empty_string_filter(self, dirs):
+        _, db_dir = dirs
+        _save_all(db_dir, "sqlite")
+        result = query_store({"M/C": [""]}, db_dir)
+        assert len(result) == 1
+        assert pd.isna(result.loc[0, "M/C"])
+
+
+class TestResultStore:
+    """ResultStore 単体"""
+
+    @pytest.fixture
+    def store(self, dirs):
+        return ResultStore(dirs[0] / RESULTS_DB, KEY_COLS, ["学年", "教室", "担当"])
+
+    def test_wal_and_indexes(self, store):
+        store.replace_month(month_df("4月", [1]), "2025-04")
+        with sqlite3.connect(store.path) as conn:
+            assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+            indexes = {r[1] for r in conn.execute("PRAGMA index_list(keys)")}
+        assert {"keys_学年", "keys_教室", "keys_担当"} <= indexes
+
+    def test_duplicate_keys_are_summed(self, store):
+        df = pd.concat([month_df("4月", [2]), month_df("4月", [3])])
+        store.replace_month(df, "2025-04")
+        assert store.totals()["count"].tolist() == [5]
+
+    def test_failed_replace_keeps_old_month(self, store, monkeypatch):
+        store.replace_month(month_df("4月", [5, 3]), "2025-04")
+        version = store.version()
+        bad = month_df("4月", [1])
+        bad["5月"] = [1]
+        with pytest.raises(ValueError):
+            store.replace_month(bad, "2025-04")
+
+        def fail(conn):
+            raise RuntimeError("boom")
+
+        # 削除・INSERT の後で失敗させる
+        monkeypatch.setattr(store, "_next_generation", fail)
+        with pytest.raises(RuntimeError):
+            store.replace_month(month_df("4月", [9]), "2025-04")
+        monkeypatch.undo()
+        assert sorted(store.totals()["count"].tolist()) == [3, 5]
+        assert store.version() == version
+
+    def test_version_never_repeats(self, store):
+        versions = {store.version()}
+        store.replace_month(month_df("4月", [1]), "2025-04")
+        versions.add(store.version())
+        store.delete_months(["2025-04"])
+        versions.add(store.version())
+        store.replace_month(month_df("4月", [1]), "2025-04")
+        versions.add(store.version())
+        assert len(versions) == 4
+
+    def test_month_frame_round_trip(self, store):
+        """month_frame() は replace_month() に渡した行を欠損も含めて返す"""
+        df = month_df("4月", [5, 3, 1])
+        df.loc[2, "M/C"] = np.nan
+        store.replace_month(df, "2025-04")
+        pd.testing.assert_frame_equal(store.month_frame("2025-04"), df, check_dtype=False)
+        assert store.month_frame("2025-05") is None
+
+    def test_retain(self, store):
+        store.replace_month(month_df("4月", [1]), "2025-04")
+        store.replace_month(month_df("5月", [1]), "2025-05")
+        assert store.retain(["2025-05"]) == ["2025-04"]
+        assert store.months() == {"2025-05": "5月"}
+
+    def test_concurrent_writers(self, store):
+        """複数スレッドから別々の月を同時に書き込んでも失われない"""
+        def write(i):
+            store.replace_month(month_df("4月", [i + 1, 1, 1]), f"20{10 + i}-04")
+
+        threads = [threading.Thread(target=write, args=(i,)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(store.months()) == 8
+        assert store.totals(group_by=[])["count"].sum() == sum(range(1, 9)) + 16
+
+    def test_unknown_key_raises(self, store):
+        with pytest.raises(ValueError):
+            store.totals({"生徒": ["x"]})
+
+
+def test_store_version_without_store(dirs):
+    assert store_version(dirs[0]) is None
+    assert not (dirs[0] / RESULTS_DB).exists()
+
+
+def test_month_source_in_store(dirs):
+    """SQLite に保存した月も再アップロードの省略判定に使える"""
+    from services.manifest import find_month_source, record_month_source
+
+    _, db_dir = dirs
+    _save_all(db_dir, "sqlite")
+    record_month_source(db_dir, "2025-04", "abc", RESULTS_DB, 3)
+    assert find_month_source(db_dir, "2025-04", "abc") is not None
+
+    result_store(db_dir).delete_months(["2025-04"])
+    assert find_month_source(db_dir, "2025-04", "abc") is None
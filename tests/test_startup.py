@@ -0,0 +1,82 @@
+"""
+起動時の import のテスト
+
+Web アプリと CLI の起動（import・--help）で pandas・openpyxl などの重い依存を読み込まないこと、
+import 時間が予算内に収まることを、新しいインタプリタで検証する。
+"""
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).parent.parent
+HEAVY_MODULES = ("pandas", "numpy", "openpyxl", "jinja2")
+# import 時間の予算（秒）。遅い CI では IMPORT_BUDGET_SECONDS で緩められる
+IMPORT_BUDGET = float(os.environ.get("IMPORT_BUDGET_SECONDS", "1.0"))
+
+
+def _run(code: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=PROJECT_ROOT,
+                          capture_output=True, text=True, timeout=60, check=True)
+
+
+def _loaded_heavy(stdout: str) -> list[str]:
+    """_REPORT が出力した、読み込み済みの重いモジュール"""
+    line = stdout.splitlines()[-1]
+    assert line.startswith("loaded:")
+    return [m for m in line.removeprefix("loaded:").split(",") if m]
+
+
+def _cumulative_seconds(stderr: str, module: str) -> float:
+    """-X importtime の出力から module の累積 import 時間（秒）"""
+    for line in stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip() == module:
+            return int(parts[1]) / 1e6
+    raise AssertionError(f"{module} の import 時間が見つかりません")
+
+
+_REPORT = f"print('loaded:' + ','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+
+
+class TestWebApp:
+    """app/main.py"""
+
+    @pytest.fixture(autouse=True)
+    def _requires_app_deps(self):
+        pytest.importorskip("fastapi")
+        pytest.importorskip("yossy_portal_lib")
+
+    def test_import_defers_heavy_modules(self):
+        proc = _run(f"import sys, app.main; {_REPORT}")
+        assert _loaded_heavy(proc.stdout) == []
+
+    def test_import_within_budget(self):
+        proc = _run("import app.main")
+        assert _cumulative_seconds(proc.stderr, "app.main") < IMPORT_BUDGET
+
+
+class TestCli:
+    """scripts/aggregate.py"""
+
+    def test_help_defers_heavy_modules(self):
+        proc = _run(
+            "import runpy, sys\n"
+            "sys.argv = ['aggregate.py', '--help']\n"
+            "try:\n"
+            "    runpy.run_path('scripts/aggregate.py', run_name='__main__')\n"
+            "except SystemExit:\n"
+            "    pass\n"
+            f"{_REPORT}")
+        assert "usage" in proc.stdout
+        assert _loaded_heavy(proc.stdout) == []
+
+
+class TestAggregatorImport:
+    """services/aggregator.py"""
+
+    def test_openpyxl_is_loaded_on_first_read(self):
+        proc = _run(f"import sys, services.aggregator; {_REPORT}")
+        assert "openpyxl" not in _loaded_heavy(proc.stdout)
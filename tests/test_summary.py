@@ -0,0 +1,64 @@
+"""
+services/summary.py のユニットテスト
+
+サマリーの保存と読み出し、月別結果の保存で世代番号が進むと無効になることを検証。
+"""
+import pandas as pd
+
+from services.aggregator import build_pivot, save_monthly_result
+from services.atomic_io import bump_generation, read_generation
+from services.summary import read_summary, summary_path, write_store_summary, write_summary
+from tests.helpers import uniform_month_df
+
+
+class TestSummary:
+    """write_summary() / read_summary() のテスト"""
+
+    def test_round_trip(self, results_dir):
+        """月の一覧・月別総計・行数を保存し、同じ世代番号なら読み戻せる"""
+        save_monthly_result(uniform_month_df("4月", 2), pd.Period("2025-04", "M"), results_dir)
+        save_monthly_result(uniform_month_df("5月", 5, rows=4), pd.Period("2025-05", "M"), results_dir)
+        generation = read_generation(results_dir)
+        written = write_summary(results_dir, build_pivot(results_dir), generation)
+        assert written == {"generation": generation, "months": ["4月", "5月"],
+                           "month_totals": {"4月": 6, "5月": 20}, "total_rows": 4}
+        assert read_summary(results_dir) == written
+
+    def test_stale_after_save(self, results_dir):
+        """月別結果を保存した後は古いサマリーを返さない"""
+        save_monthly_result(uniform_month_df("4月", 2), pd.Period("2025-04", "M"), results_dir)
+        write_summary(results_dir, build_pivot(results_dir), read_generation(results_dir))
+        save_monthly_result(uniform_month_df("5月", 5), pd.Period("2025-05", "M"), results_dir)
+        assert read_summary(results_dir) is None
+
+    def test_stale_generation_written(self, results_dir):
+        """ピボットの読み込み中に世代番号が進んだ場合、書いたサマリーは次の読み込みで無効"""
+        generation = read_generation(results_dir)
+        bump_generation(results_dir)
+        write_summary(results_dir, build_pivot(results_dir), generation)
+        assert read_summary(results_dir) is None
+
+    def test_empty(self, results_dir):
+        """月別結果がなければ空のサマリー。ディレクトリがなければ書かない"""
+        assert write_summary(results_dir, pd.DataFrame(), 0) == {
+            "generation": 0, "months": [], "month_totals": {}, "total_rows": 0}
+        assert read_summary(results_dir)["total_rows"] == 0
+        missing = results_dir / "FY2030"
+        write_summary(missing, pd.DataFrame(), 0)
+        assert not missing.exists()
+        assert read_summary(missing) is None
+
+    def test_broken_ignored(self, results_dir):
+        """壊れたサマリーは None"""
+        summary_path(results_dir).write_text("{", encoding="utf-8")
+        assert read_summary(results_dir) is None
+
+    def test_store_summary_matches_pivot(self, results_dir):
+        """SQLite ストアの年度は SQL の集計から同じサマリーを作る"""
+        save_monthly_result(uniform_month_df("4月", 2), pd.Period("2025-04", "M"), results_dir, fmt="sqlite")
+        save_monthly_result(uniform_month_df("5月", 5, rows=4), pd.Period("2025-05", "M"), results_dir,
+                            fmt="sqlite")
+        generation = read_generation(results_dir)
+        assert write_store_summary(results_dir, generation) == \
+            write_summary(results_dir, build_pivot(results_dir), generation)
+        assert read_summary(results_dir)["month_totals"] == {"4月": 6, "5月": 20}
@@ -0,0 +1,146 @@
+"""
+app/uploads.py のユニットテスト
+
+multipart 本体のストリーミング受信と上限超過時の打ち切り、複数ファイルの受信を検証。
+"""
+import asyncio
+import hashlib
+
+import pytest
+
+from app.uploads import UploadError, UploadTooLarge, UploadTooMany, receive_upload, receive_uploads
+
+BOUNDARY = "testboundary"
+
+
+def _body(filename: str, content: bytes, field: str = "file") -> bytes:
+    return (
+        f"--{BOUNDARY}\r\n"
+        f'Content-Disposition: form-data; name="note"\r\n\r\n'
+        f"memo\r\n"
+        f"--{BOUNDARY}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        f"Content-Type: application/octet-stream\r\n\r\n"
+    ).encode("utf-8") + content + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+class FakeRequest:
+    """headers と stream() だけを持つ Request 代替。読み出したチャンク数を記録"""
+
+    def __init__(self, body: bytes, chunk_size: int = 1024, content_length: bool = False):
+        self.headers = {"content-type": f"multipart/form-data; boundary={BOUNDARY}"}
+        if content_length:
+            self.headers["content-length"] = str(len(body))
+        self._chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+        self.consumed = 0
+
+    async def stream(self):
+        for chunk in self._chunks:
+            self.consumed += 1
+            yield chunk
+
+
+def _multi_body(files: list[tuple[str, bytes]], field: str = "files") -> bytes:
+    parts = b"".join(
+        (f"--{BOUNDARY}\r\n"
+         f'Content-Disposition: form-data; name="{field}"; filename="{name}"\r\n'
+         f"Content-Type: application/octet-stream\r\n\r\n").encode("utf-8") + content + b"\r\n"
+        for name, content in files)
+    return parts + f"--{BOUNDARY}--\r\n".encode()
+
+
+def _receive(request, max_size=10_000, spool_size=100):
+    return asyncio.run(receive_upload(request, "file", max_size, spool_size))
+
+
+class TestReceiveUpload:
+    """receive_upload() のテスト"""
+
+    def test_receives_file_part(self):
+        """ファイル部分だけが一時ファイルに書かれる"""
+        content = bytes(range(256)) * 20
+        upload = _receive(FakeRequest(_body("名簿_2504.xlsx", content)))
+        try:
+            assert upload.filename == "名簿_2504.xlsx"
+            assert upload.size == len(content)
+            assert upload.sha256 == hashlib.sha256(content).hexdigest()
+            assert upload.file.read() == content
+            # spool_size を超えたのでディスクへ退避済み
+            assert upload.file._rolled
+        finally:
+            upload.close()
+
+    def test_rejects_while_streaming(self):
+        """上限を超えた時点で残りの本体を読まずに打ち切る"""
+        request = FakeRequest(_body("big_2504.xlsx", b"x" * 50_000))
+
+        with pytest.raises(UploadTooLarge):
+            _receive(request)
+        assert request.consumed < len(request._chunks)
+
+    def test_rejects_by_content_length(self):
+        """Content-Length で明らかに超過する場合は本体を読まない"""
+        request = FakeRequest(_body("big_2504.xlsx", b"x" * 200_000), content_length=True)
+
+        with pytest.raises(UploadTooLarge):
+            _receive(request)
+        assert request.consumed == 0
+
+    def test_missing_file_field(self):
+        """対象フィールドがなければ UploadError"""
+        with pytest.raises(UploadError):
+            _receive(FakeRequest(_body("a_2504.xlsx", b"data", field="other")))
+
+    def test_not_multipart(self):
+        """multipart 以外は UploadError"""
+        request = FakeRequest(b"{}")
+        request.headers["content-type"] = "application/json"
+
+        with pytest.raises(UploadError):
+            _receive(request)
+
+
+class TestReceiveUploads:
+    """receive_uploads() のテスト"""
+
+    @staticmethod
+    def _receive_all(request, max_size=10_000, max_files=5):
+        received = []
+
+        def on_file(upload):
+            # 受信途中（残りのパートを読む前）に渡される
+            received.append((upload.filename, upload.file.read(), request.consumed))
+            upload.close()
+
+        count = asyncio.run(receive_uploads(request, "files", max_size, max_files, on_file, 100))
+        return count, received
+
+    def test_files_handed_over_in_order(self):
+        """ファイルごとに受信し終えた時点で、先頭に戻した状態で渡される"""
+        files = [(f"名簿_25{m:02d}.xlsx", bytes([m]) * 3000) for m in (4, 5, 6)]
+        request = FakeRequest(_multi_body(files), chunk_size=512)
+        count, received = self._receive_all(request)
+
+        assert count == 3
+        assert [(name, data) for name, data, _ in received] == files
+        assert received[0][2] < len(request._chunks)
+
+    def test_skips_empty_part(self):
+        """ファイル未選択の空パートは無視"""
+        count, received = self._receive_all(FakeRequest(_multi_body([("", b""), ("a_2504.xlsx", b"x")])))
+        assert count == 1 and received[0][0] == "a_2504.xlsx"
+
+    def test_too_many_files(self):
+        """上限を超えるファイル数は UploadTooMany（それまでのファイルは渡し済み）"""
+        files = [(f"a_25{m:02d}.xlsx", b"x") for m in (4, 5, 6)]
+        received = []
+        with pytest.raises(UploadTooMany):
+            asyncio.run(receive_uploads(FakeRequest(_multi_body(files)), "files", 100, 2,
+                                        lambda u: (received.append(u.filename), u.close())))
+        assert received == ["a_2504.xlsx", "a_2505.xlsx"]
+
+    def test_per_file_limit(self):
+        """max_size は1ファイルあたりの上限"""
+        request = FakeRequest(_multi_body([("a_2504.xlsx", b"x" * 800), ("b_2505.xlsx", b"x" * 2000)]))
+        with pytest.raises(UploadTooLarge):
+            self._receive_all(request, max_size=1000)
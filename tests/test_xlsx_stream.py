@@ -0,0 +1,106 @@
+"""
+services/xlsx_stream.py のユニットテスト
+
+ストリーミング出力した XLSX が pandas / openpyxl で読み戻せること、
+ZIP64 は上限を超えうる大きさのシートだけに使うことを検証。
+"""
+import io
+import tempfile
+import zipfile
+from pathlib import Path
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from services import xlsx_stream
+from services.aggregator import to_excel_bytes, write_excel
+from services.xlsx_stream import iter_xlsx, sheet_size_bound
+
+
+def _pivot(rows: int = 3) -> pd.DataFrame:
+    return pd.DataFrame({
+        "学年": ["高1", "高2", "高3"] * (rows // 3) + ["高1"] * (rows % 3),
+        "教室": [f"Room <{i % 7}> & co" for i in range(rows)],
+        "講座名": [f"講座{i}" for i in range(rows)],
+        "M/C": ["【マスター】" if i % 2 else None for i in range(rows)],
+        "担当": [f"担当\x01{i % 5}" for i in range(rows)],
+        "4月": list(range(rows)),
+        "5月": [i * 2 for i in range(rows)],
+    })
+
+
+class TestIterXlsx:
+    """iter_xlsx() のテスト"""
+
+    def test_round_trip(self):
+        """pandas で読み戻すと値が一致（制御文字は除去）"""
+        df = _pivot()
+
+        loaded = pd.read_excel(io.BytesIO(to_excel_bytes(df)))
+
+        assert list(loaded.columns) == list(df.columns)
+        assert loaded["4月"].tolist() == df["4月"].tolist()
+        assert loaded["教室"].tolist() == df["教室"].tolist()
+        assert loaded["M/C"].isna().tolist() == df["M/C"].isna().tolist()
+        assert loaded["担当"].tolist() == [s.replace("\x01", "") for s in df["担当"]]
+
+    def test_sheet_name_and_bold_header(self):
+        """シート名とヘッダーの太字"""
+        wb = load_workbook(io.BytesIO(to_excel_bytes(_pivot())))
+
+        assert wb.sheetnames == ["月次受講人数"]
+        assert wb.active["A1"].font.b
+        assert not wb.active["A2"].font.b
+
+    def test_yields_multiple_chunks(self):
+        """行数が多いと複数チャンクに分かれて流れる"""
+        chunks = list(iter_xlsx(_pivot(3000), chunk_size=4096))
+
+        assert len(chunks) > 2
+        loaded = pd.read_excel(io.BytesIO(b"".join(chunks)))
+        assert len(loaded) == 3000
+
+    def test_write_excel_to_path(self):
+        """ファイルへの直接書き出し"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "monthly_stats.xlsx"
+            write_excel(_pivot(), path)
+
+            assert len(pd.read_excel(path)) == 3
+
+
+def _sheet_info(data: bytes) -> zipfile.ZipInfo:
+    return zipfile.ZipFile(io.BytesIO(data)).getinfo("xl/worksheets/sheet1.xml")
+
+
+class TestZip64:
+    """ZIP64 の使い分けのテスト"""
+
+    def test_small_export_is_not_zip64(self):
+        """通常の大きさのシートは ZIP64 にしない（展開に必要な版は 2.0）"""
+        assert _sheet_info(to_excel_bytes(_pivot(3000))).extract_version == 20
+
+    def test_large_estimate_uses_zip64(self, monkeypatch):
+        """見積もりが上限を超えるシートは ZIP64 で書き、そのまま読み戻せる"""
+        monkeypatch.setattr(xlsx_stream, "ZIP64_THRESHOLD", 1024)
+        data = to_excel_bytes(_pivot(300))
+
+        assert _sheet_info(data).extract_version == 45
+        assert len(pd.read_excel(io.BytesIO(data))) == 300
+
+    def test_bound_covers_sheet(self):
+        """見積もりは実際のシート XML 以上"""
+        df = _pivot(3000)
+        df["講座名"] = ["&<>" * 20 + "講座" * 10] * len(df)
+
+        assert sheet_size_bound(df) >= _sheet_info(to_excel_bytes(df)).file_size
+
+    def test_file_has_no_data_descriptor(self):
+        """ファイルへの直接書き出しはサイズをローカルヘッダーに書き戻す（データ記述子なし）"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "monthly_stats.xlsx"
+            write_excel(_pivot(), path)
+
+            info = _sheet_info(path.read_bytes())
+            assert info.extract_version == 20
+            assert not info.flag_bits & 0x08